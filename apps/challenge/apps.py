@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class ChallengeConfig(AppConfig):
+    name = "apps.challenge"
+
+    def ready(self) -> None:  # type: ignore[override]
+        # Import signal handlers to ensure they are registered at startup
+        from . import signals  # noqa: F401
+
+        return super().ready()
@@ -13,8 +13,12 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import re
 
 from django import forms
+from django.core.exceptions import ValidationError
+from django.utils.html import format_html_join
+from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
 from apps.user import FORMATION_M1, FORMATION_M2, formation_short
@@ -86,6 +90,167 @@ class BSAvailabilityRadioSelect(forms.RadioSelect):
         return context
 
 
+class SessionMatrixWidget(forms.Widget):
+    """
+    Widget for a whole (helper × session) grid of radio selects.
+
+    The cells keep their own POST names (`key_format`, e.g. AVAILABILITY_FIELDKEY).
+    Each distinct cell (value, choices, options) is rendered once by
+    `cell_widget` and then reused for all cells that look the same.
+    """
+
+    PLACEHOLDER = "sessionmatrixcell"
+
+    def __init__(self, key_format, cell_widget, attrs=None):
+        super().__init__(attrs)
+        self.key_format = key_format
+        self.cell_widget = cell_widget
+        # Set by SessionMatrixField, as ChoiceField sets the choices of its widget
+        self.helper_choices = {}
+        self.session_pks = []
+        self.cell_options = None
+        self.key_re = re.compile(
+            "^"
+            + re.escape(key_format)
+            .replace(re.escape("{hpk}"), r"(?P<hpk>\d+)")
+            .replace(re.escape("{spk}"), r"(?P<spk>\d+)")
+            + "$"
+        )
+        self._rendered = {}
+
+    def value_from_datadict(self, data, files, name):
+        cells = {}
+        for key, value in data.items():
+            match = self.key_re.match(key)
+            if match:
+                cells[(int(match["hpk"]), int(match["spk"]))] = value
+        return cells
+
+    def value_omitted_from_data(self, data, files, name):
+        return False
+
+    def render_cell(self, helper_pk, session_pk, value, choices, **options):
+        cache_key = (value, tuple(c[0] for c in choices), tuple(options.items()))
+        try:
+            html = self._rendered[cache_key]
+        except KeyError:
+            html = self._rendered[cache_key] = self.cell_widget(
+                choices=choices, **options
+            ).render(self.PLACEHOLDER, value, attrs={"id": self.PLACEHOLDER})
+        return mark_safe(
+            html.replace(
+                self.PLACEHOLDER,
+                self.key_format.format(hpk=helper_pk, spk=session_pk),
+            )
+        )
+
+    def render_row(self, helper_pk, value):
+        """
+        Rendered cells of that helper, in the sessions' order, from the
+        {(helper_pk, session_pk): value} `value`
+        """
+        choices = self.helper_choices.get(helper_pk)
+        if choices is None:
+            return []
+        return [
+            self.render_cell(
+                helper_pk,
+                session_pk,
+                (value or {}).get((helper_pk, session_pk), ""),
+                choices,
+                **(
+                    self.cell_options(helper_pk, session_pk)
+                    if self.cell_options
+                    else {}
+                ),
+            )
+            for session_pk in self.session_pks
+        ]
+
+    def render(self, name, value, attrs=None, renderer=None):
+        """
+        The whole grid, one row per helper; the forms' templates lay the rows out
+        with SessionMatrixField.render_row instead
+        """
+        return format_html_join(
+            "\n",
+            "<div>{}</div>",
+            (
+                (mark_safe("".join(self.render_row(helper_pk, value))),)
+                for helper_pk in self.helper_choices
+            ),
+        )
+
+
+class SessionMatrixField(forms.Field):
+    """
+    A whole (helper × session) grid of choices as one field.
+
+    Its value is a {(helper_pk, session_pk): value} dict of the filled cells
+    only; `helper_choices` maps each helper to its choices.
+    """
+
+    default_error_messages = {
+        "invalid_choice": _(
+            "Select a valid choice. %(value)s is not one of the available choices."
+        ),
+    }
+
+    def __init__(
+        self,
+        key_format,
+        helper_choices,
+        session_pks,
+        cell_widget,
+        coerce=str,
+        cell_options=None,
+        **kwargs,
+    ):
+        kwargs.setdefault("required", False)
+        kwargs.setdefault("initial", {})
+        super().__init__(widget=SessionMatrixWidget(key_format, cell_widget), **kwargs)
+        self.helper_choices = helper_choices
+        self.session_pks = list(session_pks)
+        self.coerce = coerce
+        self.cell_options = cell_options
+        self.widget.helper_choices = helper_choices
+        self.widget.session_pks = self.session_pks
+        self.widget.cell_options = cell_options
+        self._valid_values = {
+            helper_pk: {coerce(c[0]) for c in choices}
+            for helper_pk, choices in helper_choices.items()
+        }
+
+    def to_python(self, value):
+        cells = {}
+        session_pks = set(self.session_pks)
+        for (helper_pk, session_pk), cell in (value or {}).items():
+            if (
+                cell in self.empty_values
+                or helper_pk not in self.helper_choices
+                or session_pk not in session_pks
+            ):
+                continue
+            try:
+                cell = self.coerce(cell)
+            except (TypeError, ValueError):
+                cell = None
+            if cell not in self._valid_values[helper_pk]:
+                raise ValidationError(
+                    self.error_messages["invalid_choice"],
+                    code="invalid_choice",
+                    params={"value": value[(helper_pk, session_pk)]},
+                )
+            cells[(helper_pk, session_pk)] = cell
+        return cells
+
+    def render_row(self, helper_pk):
+        """
+        Rendered cells of that helper, in the sessions' order
+        """
+        return self.widget.render_row(helper_pk, self.initial)
+
+
 class SessionChoiceField(object):
     def __init__(self, *args, **kwargs):
         self.session = kwargs.pop("session", False)
@@ -14,14 +14,19 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import operator
+from functools import partial, reduce
+
 from django import forms
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
 from django.utils.translation import gettext_lazy as _
 
 from bootstrap3_datetime.widgets import DateTimePicker
 from dal.forward import Const as dal_const
 from dal_select2.widgets import ModelSelect2, Select2Multiple
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
 
 from apps.common import (
     DV_SEASON_STATE_OPEN,
@@ -30,8 +35,10 @@ from apps.common import (
     DV_STATE_CHOICES_WITH_ABBR,
 )
 from apps.common.forms import SelectWithDisabledValues
+from apps.common.jobs import bump_data_version
+from apps.salary.models import MonthlyTimesheetStatus, UserWorkedDay
 from apps.user import FORMATION_KEYS, FORMATION_M2
-from apps.user.models import USERSTATUS_DELETED
+from apps.user.models import USERSTATUS_DELETED, UserProfile
 
 from ...orga.models import Organization
 from .. import (
@@ -45,9 +52,18 @@ from .. import (
     SEASON_WORKWISH_FIELDKEY,
     STAFF_FIELDKEY,
 )
-from ..fields import BSAvailabilityRadioSelect, BSChoiceRadioSelect, LeaderChoiceField
-from ..models import Season
-from ..models.availability import HelperSessionAvailability
+from ..fields import (
+    BSAvailabilityRadioSelect,
+    BSChoiceRadioSelect,
+    LeaderChoiceField,
+    SessionMatrixField,
+)
+from ..models import Qualification, Season
+from ..models.availability import (
+    HelperSeasonWorkWish,
+    HelperSessionAvailability,
+    HelperSessionSchedule,
+)
 
 
 class SeasonForm(forms.ModelForm):
@@ -178,45 +194,125 @@ class SeasonAvailabilityForm(forms.Form):
         kwargs.pop("cantons", None)
         super(SeasonAvailabilityForm, self).__init__(*args, **kwargs)
 
-        if self.potential_helpers:
-            for helper_category, helpers in self.potential_helpers:
-                for helper in helpers:
-                    workwishkey = SEASON_WORKWISH_FIELDKEY.format(hpk=helper.pk)
-                    try:
-                        fieldinit = self.initial[workwishkey]
-                    except KeyError:
-                        fieldinit = 0
-                    self.fields[workwishkey] = forms.IntegerField(
-                        required=False,
-                        initial=fieldinit,
-                        min_value=0,
+        session_pks = [session.pk for session in self.season.sessions_with_qualifs]
+        helper_choices = {}
+        initial = {}
+        forbid_absence = set()
+        for helper_category, helpers in self.potential_helpers or []:
+            for helper in helpers:
+                workwishkey = SEASON_WORKWISH_FIELDKEY.format(hpk=helper.pk)
+                try:
+                    fieldinit = self.initial[workwishkey]
+                except KeyError:
+                    fieldinit = 0
+                self.fields[workwishkey] = forms.IntegerField(
+                    required=False,
+                    initial=fieldinit,
+                    min_value=0,
+                )
+
+                helper_choices[helper.pk] = (
+                    HelperSessionAvailability.AVAILABILITY_CHOICES
+                )
+                for session_pk in session_pks:
+                    keys = {"hpk": helper.pk, "spk": session_pk}
+                    availability = self.initial.get(
+                        AVAILABILITY_FIELDKEY.format(**keys)
                     )
-
-                    for session in self.season.sessions_with_qualifs:
-                        availkey = AVAILABILITY_FIELDKEY.format(
-                            hpk=helper.pk, spk=session.pk
-                        )
-                        staffkey = STAFF_FIELDKEY.format(hpk=helper.pk, spk=session.pk)
-                        try:
-                            fieldinit = self.initial[availkey]
-                        except KeyError:
-                            fieldinit = ""
-                        try:
-                            forbid_absence = self.initial[staffkey]
-                        except KeyError:
-                            forbid_absence = False
-                        # Trick to pass the 'chosen' information through
-                        self.fields[availkey] = forms.ChoiceField(
-                            choices=HelperSessionAvailability.AVAILABILITY_CHOICES,
-                            widget=BSAvailabilityRadioSelect(
-                                forbid_absence=forbid_absence
-                            ),
-                            required=False,
-                            initial=fieldinit,
-                        )
+                    if availability:
+                        initial[(helper.pk, session_pk)] = availability
+                    # Trick to pass the 'chosen' information through
+                    if self.initial.get(STAFF_FIELDKEY.format(**keys)):
+                        forbid_absence.add((helper.pk, session_pk))
+
+        self.fields["availabilities"] = SessionMatrixField(
+            key_format=AVAILABILITY_FIELDKEY,
+            helper_choices=helper_choices,
+            session_pks=session_pks,
+            cell_widget=BSAvailabilityRadioSelect,
+            cell_options=lambda helper_pk, session_pk: {
+                "forbid_absence": (helper_pk, session_pk) in forbid_absence
+            },
+            initial=initial,
+        )
 
     def save(self):
-        pass
+        """
+        Persist the work wishes and availabilities that differ from the
+        database, in a handful of bulk queries
+        """
+        helpers = [
+            helper
+            for helper_category, helpers in (self.potential_helpers or [])
+            for helper in helpers
+        ]
+        sessions = list(self.season.sessions_with_qualifs)
+
+        wishes = {}
+        for hww in HelperSeasonWorkWish.objects.filter(
+            season=self.season, helper__in=helpers
+        ).order_by("id"):
+            # Too many of these, for some reason. Take the latest.
+            wishes[hww.helper_id] = hww
+        availabilities = {
+            (hsa.helper_id, hsa.session_id): hsa
+            for hsa in HelperSessionAvailability.objects.filter(
+                session__in=sessions, helper__in=helpers
+            )
+        }
+
+        new_wishes, changed_wishes = [], []
+        for helper in helpers:
+            # Fill in the wishes
+            workwishkey = SEASON_WORKWISH_FIELDKEY.format(hpk=helper.pk)
+            if workwishkey in self.cleaned_data:
+                amount = self.cleaned_data[workwishkey] or 0
+                hww = wishes.get(helper.pk)
+                if hww is None:
+                    if amount:
+                        new_wishes.append(
+                            HelperSeasonWorkWish(
+                                season=self.season, helper=helper, amount=amount
+                            )
+                        )
+                elif hww.amount != amount:
+                    hww.amount = amount
+                    changed_wishes.append(hww)
+
+        # Fill in the availabilities
+        new_availabilities, changed_availabilities = [], []
+        for (helper_pk, session_pk), availability in self.cleaned_data[
+            "availabilities"
+        ].items():
+            hsa = availabilities.get((helper_pk, session_pk))
+            if hsa is None:
+                new_availabilities.append(
+                    HelperSessionAvailability(
+                        session_id=session_pk,
+                        helper_id=helper_pk,
+                        availability=availability,
+                    )
+                )
+            elif hsa.availability != availability:
+                hsa.availability = availability
+                changed_availabilities.append(hsa)
+
+        with transaction.atomic():
+            if new_wishes:
+                bulk_create_with_history(new_wishes, HelperSeasonWorkWish)
+            if changed_wishes:
+                bulk_update_with_history(
+                    changed_wishes, HelperSeasonWorkWish, ["amount"]
+                )
+            if new_availabilities:
+                bulk_create_with_history(new_availabilities, HelperSessionAvailability)
+            if changed_availabilities:
+                bulk_update_with_history(
+                    changed_availabilities, HelperSessionAvailability, ["availability"]
+                )
+            # Written in bulk, without signals
+            bump_data_version()
+        return self.season
 
 
 class SeasonStaffFilterForm(forms.Form):
@@ -255,37 +351,113 @@ class SeasonStaffChoiceForm(forms.Form):
         kwargs.pop("cantons", None)
         super(SeasonStaffChoiceForm, self).__init__(*args, **kwargs)
 
-        if self.available_helpers:
-            for helper_category, helpers in self.available_helpers:
-                for helper in helpers:
-                    for session in self.season.sessions_with_qualifs:
-                        AVAILABILITY_FIELDKEY.format(hpk=helper.pk, spk=session.pk)
-                        staffkey = STAFF_FIELDKEY.format(hpk=helper.pk, spk=session.pk)
-                        try:
-                            fieldinit = self.initial[staffkey]
-                        except KeyError:
-                            fieldinit = CHOSEN_AS_NOT
-                        available_choices = [CHOSEN_AS_NOT]
-                        if helper.profile.actor:
-                            available_choices.append(CHOSEN_AS_ACTOR)
-                        if helper.profile.formation:
-                            available_choices.append(CHOSEN_AS_HELPER)
-                            available_choices.append(CHOSEN_AS_REPLACEMENT)
-                        if helper.profile.formation == FORMATION_M2:
-                            available_choices.append(CHOSEN_AS_LEADER)
-                        self.fields[staffkey] = forms.ChoiceField(
-                            choices=[
-                                c
-                                for c in list(CHOICE_CHOICES)
-                                if c[0] in available_choices
-                            ],
-                            widget=BSChoiceRadioSelect(
-                                attrs={"horizontal": True, "class": "btn-group-xs"},
-                                user_assignment=session.user_assignment(helper),
-                            ),
-                            required=False,
-                            initial=fieldinit,
-                        )
+        session_pks = [session.pk for session in self.season.sessions_with_qualifs]
+        helper_choices = {}
+        initial = {}
+        for helper_category, helpers in self.available_helpers or []:
+            for helper in helpers:
+                available_choices = [CHOSEN_AS_NOT]
+                if helper.profile.actor:
+                    available_choices.append(CHOSEN_AS_ACTOR)
+                if helper.profile.formation:
+                    available_choices.append(CHOSEN_AS_HELPER)
+                    available_choices.append(CHOSEN_AS_REPLACEMENT)
+                if helper.profile.formation == FORMATION_M2:
+                    available_choices.append(CHOSEN_AS_LEADER)
+                helper_choices[helper.pk] = [
+                    c for c in list(CHOICE_CHOICES) if c[0] in available_choices
+                ]
+                for session_pk in session_pks:
+                    fieldinit = self.initial.get(
+                        STAFF_FIELDKEY.format(hpk=helper.pk, spk=session_pk),
+                        CHOSEN_AS_NOT,
+                    )
+                    if fieldinit not in ["", None]:
+                        initial[(helper.pk, session_pk)] = fieldinit
+
+        self.fields["staff"] = SessionMatrixField(
+            key_format=STAFF_FIELDKEY,
+            helper_choices=helper_choices,
+            session_pks=session_pks,
+            cell_widget=partial(
+                BSChoiceRadioSelect,
+                attrs={"horizontal": True, "class": "btn-group-xs"},
+            ),
+            coerce=int,
+            cell_options=lambda helper_pk, session_pk: {
+                "user_assignment": self.season.assignments.get((session_pk, helper_pk))
+            },
+            initial=initial,
+        )
 
     def save(self):
-        pass
+        """
+        Commit the staff choices: update the chosen_as of the availabilities by
+        groups, then drop the people not chosen (as such) anymore from the
+        qualifications, all in one transaction
+        """
+        sessions = list(self.season.sessions_with_qualifs)
+
+        # chosen_as: {session_id: [helper_id, …]}
+        choices = {}
+        for (helper_pk, session_pk), chosen_as in self.cleaned_data["staff"].items():
+            choices.setdefault(chosen_as, {}).setdefault(session_pk, []).append(
+                helper_pk
+            )
+
+        with transaction.atomic():
+            for chosen_as, helpers_by_session in choices.items():
+                HelperSessionAvailability.objects.filter(
+                    reduce(
+                        operator.or_,
+                        [
+                            Q(session_id=session_id, helper_id__in=helper_ids)
+                            for session_id, helper_ids in helpers_by_session.items()
+                        ],
+                    )
+                ).exclude(chosen_as=chosen_as).update(chosen_as=chosen_as)
+
+            chosen = HelperSessionAvailability.objects.filter(
+                session=OuterRef("session")
+            )
+            # Drop the helpers not chosen as such from the qualifications
+            removed_helpers = Qualification.helpers.through.objects.filter(
+                qualification__session__in=sessions
+            ).exclude(
+                Exists(
+                    HelperSessionAvailability.objects.filter(
+                        session=OuterRef("qualification__session"),
+                        helper=OuterRef("user"),
+                        chosen_as=CHOSEN_AS_HELPER,
+                    )
+                )
+            )
+            # Remember who worked when, the bulk deletion sends no m2m_changed
+            removed = set(
+                removed_helpers.values_list("user_id", "qualification__session__day")
+            )
+            removed_helpers.delete()
+            # Only save the qualifications whose leader or actor has to go;
+            # Qualification.save() drops them.
+            for quali in Qualification.objects.filter(session__in=sessions).filter(
+                Q(leader__isnull=False)
+                & ~Exists(
+                    chosen.filter(helper=OuterRef("leader"), chosen_as=CHOSEN_AS_LEADER)
+                )
+                | Q(actor__isnull=False)
+                & ~Exists(
+                    chosen.filter(helper=OuterRef("actor"), chosen_as=CHOSEN_AS_ACTOR)
+                )
+            ):
+                quali.save()
+            # The choices were updated in bulk, without signals
+            HelperSessionSchedule.update_for_sessions([s.pk for s in sessions])
+            if removed:
+                removed_user_ids = {user_id for user_id, day in removed}
+                removed_days = {day for user_id, day in removed}
+                UserWorkedDay.update_for(removed_user_ids, removed_days)
+                MonthlyTimesheetStatus.update_for(removed_user_ids, removed_days)
+                UserProfile.invalidate_users_that_worked_in_cantons()
+            self.season.update_memberships()
+            bump_data_version()
+        return self.season
@@ -0,0 +1,154 @@
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from . import (
+    AVAILABILITY_FIELDKEY,
+    CHOICE_FIELDKEY,
+    CHOSEN_KEYS,
+    CONFLICT_FIELDKEY,
+    SEASON_WORKWISH_FIELDKEY,
+    STAFF_FIELDKEY,
+    SUPERLEADER_FIELDKEY,
+)
+from .utils import get_assignments
+
+
+class SeasonAvailabilityMatrix(Mapping):
+    """
+    Availabilities, staff choices and qualification assignments of a set of
+    helpers over all sessions of a season, loaded in a fixed number of queries.
+
+    Every cell is indexed by (helper_id, session_id). The matrix also behaves
+    as the read-only dict of form initial values (`AVAILABILITY_FIELDKEY` & co.)
+    that the availability and staff views and their template filters consume.
+    """
+
+    def __init__(self, season, helpers):
+        self.season = season
+        self.helpers = list(helpers)
+        self.helper_ids = [helper.pk for helper in self.helpers]
+        self._load()
+        self._build_initial()
+
+    def _load(self):
+        from .models import HelperSessionAvailability
+
+        # (id, day, superleader_id) of all sessions, in the season's order
+        self.sessions = list(
+            self.season.sessions_with_qualifs.values_list("id", "day", "superleader_id")
+        )
+        session_ids = [session_id for session_id, day, superleader_id in self.sessions]
+
+        # (helper_id, session_id): (availability, chosen_as)
+        self.cells = {
+            (helper_id, session_id): (availability, chosen_as)
+            for helper_id, session_id, availability, chosen_as in (
+                HelperSessionAvailability.objects.filter(
+                    session_id__in=session_ids, helper_id__in=self.helper_ids
+                ).values_list("helper_id", "session_id", "availability", "chosen_as")
+            )
+        }
+
+        # (session_id, helper_id): CHOSEN_AS_* in the qualifications
+        self.assignments = get_assignments(session_ids)
+
+        # helper_id: [HelperSessionAvailability] chosen in sessions of other
+        # seasons, the same days
+        self.conflicts = {}
+        for hsa in (
+            HelperSessionAvailability.objects.exclude(session_id__in=session_ids)
+            .filter(
+                session__day__in={day for session_id, day, sl_id in self.sessions},
+                chosen_as__in=CHOSEN_KEYS,
+                helper_id__in=self.helper_ids,
+            )
+            .select_related("session", "session__orga")
+        ):
+            self.conflicts.setdefault(hsa.helper_id, []).append(hsa)
+
+        self.work_wishes = dict(
+            self.season.work_wishes.values_list("helper_id", "amount")
+        )
+
+    @property
+    def has_availabilities(self):
+        """
+        Whether anyone (not only our helpers) answered for that season
+        """
+        from .models import HelperSessionAvailability
+
+        return bool(self.cells) or (
+            HelperSessionAvailability.objects.filter(
+                session_id__in=[session_id for session_id, d, sl_id in self.sessions]
+            ).exists()
+        )
+
+    def availability(self, helper_id, session_id):
+        try:
+            return self.cells[(helper_id, session_id)][0]
+        except KeyError:
+            return ""
+
+    def chosen_as(self, helper_id, session_id):
+        try:
+            return self.cells[(helper_id, session_id)][1]
+        except KeyError:
+            return None
+
+    def assignment(self, helper_id, session_id):
+        return self.assignments.get((session_id, helper_id))
+
+    def _build_initial(self):
+        self._initial = OrderedDict()
+        self._keys_by_helper = {}
+        for helper_id in self.helper_ids:
+            initial = OrderedDict()
+            initial[SEASON_WORKWISH_FIELDKEY.format(hpk=helper_id)] = (
+                self.work_wishes.get(helper_id, 0)
+            )
+            helper_conflicts = self.conflicts.get(helper_id, [])
+            for session_id, day, superleader_id in self.sessions:
+                fieldkey = AVAILABILITY_FIELDKEY.format(hpk=helper_id, spk=session_id)
+                staffkey = STAFF_FIELDKEY.format(hpk=helper_id, spk=session_id)
+                choicekey = CHOICE_FIELDKEY.format(hpk=helper_id, spk=session_id)
+                try:
+                    availability, chosen_as = self.cells[(helper_id, session_id)]
+                except KeyError:
+                    initial[fieldkey] = ""
+                    initial[staffkey] = ""
+                    initial[choicekey] = ""
+                else:
+                    initial[fieldkey] = availability
+                    # Si un choix est fait _dans_ une session (qualif)
+                    initial[staffkey] = self.assignment(helper_id, session_id)
+                    initial[choicekey] = True
+                    # Le choix n’est fait qu'au niveau de la session
+                    if not initial[staffkey]:
+                        initial[staffkey] = chosen_as
+                        initial[choicekey] = False
+                # List super-leaders (Moniteurs +)
+                if superleader_id == helper_id:
+                    initial[
+                        SUPERLEADER_FIELDKEY.format(hpk=helper_id, spk=session_id)
+                    ] = True
+                # Trouve les disponibilités en conflit
+                initial[CONFLICT_FIELDKEY.format(hpk=helper_id, spk=session_id)] = [
+                    hc for hc in helper_conflicts if hc.session.day == day
+                ]
+            self._initial.update(initial)
+            self._keys_by_helper[helper_id] = list(initial)
+
+    def helper_keys(self, helper_id):
+        """
+        Initial keys concerning that helper, in order
+        """
+        return self._keys_by_helper.get(helper_id, [])
+
+    def __getitem__(self, key):
+        return self._initial[key]
+
+    def __iter__(self):
+        return iter(self._initial)
+
+    def __len__(self):
+        return len(self._initial)
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:26
+
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_memberships(apps, schema_editor):
+    Season = apps.get_model("challenge", "Season")
+    Session = apps.get_model("challenge", "Session")
+    Qualification = apps.get_model("challenge", "Qualification")
+    SeasonMembership = apps.get_model("challenge", "SeasonMembership")
+
+    memberships = []
+    for season in Season.objects.all():
+        add_years, final_month_0 = divmod(season.month_start + season.n_months - 1, 12)
+        sessions = Session.objects.filter(
+            orga__address_canton__in=season.cantons,
+            day__gte=date(season.year, season.month_start, 1),
+            day__lte=date(season.year + add_years, final_month_0 + 1, 1)
+            - timedelta(days=1),
+            qualifications__isnull=False,
+        )
+        staff = set()
+        for user_ids in Qualification.objects.filter(
+            session__in=sessions.values("id")
+        ).values_list("leader_id", "actor_id", "helpers"):
+            staff.update(user_ids)
+        coordinators = set(sessions.values_list("orga__coordinator_id", flat=True))
+        memberships += [
+            SeasonMembership(season=season, user_id=user_id, role=role)
+            for role, user_ids in [("staff", staff), ("coordinator", coordinators)]
+            for user_id in user_ids
+            if user_id is not None
+        ]
+    SeasonMembership.objects.bulk_create(memberships, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('challenge', '0088_alter_historicalqualification_n_participants_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeasonMembership',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('staff', 'Personnel'), ('coordinator', 'Coordina·teur·trice')], max_length=11, verbose_name='Rôle')),
+                ('season', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='challenge.season', verbose_name='Mois')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='season_memberships', to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur')),
+            ],
+            options={
+                'unique_together': {('user', 'season', 'role')},
+            },
+        ),
+        migrations.RunPython(populate_memberships, migrations.RunPython.noop),
+    ]
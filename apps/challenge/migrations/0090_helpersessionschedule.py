@@ -0,0 +1,66 @@
+# Generated by Django 4.2.6 on 2026-10-18 21:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_schedules(apps, schema_editor):
+    Session = apps.get_model("challenge", "Session")
+    HelperSessionAvailability = apps.get_model("challenge", "HelperSessionAvailability")
+    Qualification = apps.get_model("challenge", "Qualification")
+    HelperSessionSchedule = apps.get_model("challenge", "HelperSessionSchedule")
+
+    schedules = {
+        (session_id, helper_id, "superleader")
+        for session_id, helper_id in Session.objects.filter(
+            superleader__isnull=False
+        ).values_list("pk", "superleader_id")
+    }
+    schedules.update(
+        (session_id, helper_id, "chosen")
+        for session_id, helper_id in HelperSessionAvailability.objects.exclude(
+            chosen_as=0
+        ).values_list("session_id", "helper_id")
+    )
+    for session_id, leader_id, actor_id, helper_id in Qualification.objects.values_list(
+        "session_id", "leader_id", "actor_id", "helpers"
+    ):
+        for user_id, role in [
+            (leader_id, "leader"),
+            (helper_id, "helper"),
+            (actor_id, "actor"),
+        ]:
+            if user_id:
+                schedules.add((session_id, user_id, role))
+    HelperSessionSchedule.objects.bulk_create(
+        [
+            HelperSessionSchedule(session_id=session_id, helper_id=helper_id, role=role)
+            for session_id, helper_id, role in schedules
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('challenge', '0089_seasonmembership'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HelperSessionSchedule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('superleader', 'Moniteur·trice + / Photographe'), ('chosen', 'Choisi'), ('leader', 'Moniteur·trice 2'), ('helper', 'Moniteur·trice 1'), ('actor', 'Intervenant·e')], max_length=11, verbose_name='Rôle')),
+                ('helper', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_schedules', to=settings.AUTH_USER_MODEL, verbose_name='Moniteur')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to='challenge.session', verbose_name='Session')),
+            ],
+            options={
+                'unique_together': {('helper', 'session', 'role')},
+            },
+        ),
+        migrations.RunPython(populate_schedules, migrations.RunPython.noop),
+    ]
@@ -13,20 +13,22 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-from .availability import HelperSessionAvailability
+from .availability import HelperSessionAvailability, HelperSessionSchedule
 from .invoices import Invoice, InvoiceLine
 from .qualification import Qualification, QualificationActivity
-from .season import Season
+from .season import Season, SeasonMembership
 from .session import Session
 from .settings import AnnualStateSetting
 
 __all__ = [
     "AnnualStateSetting",
     "HelperSessionAvailability",
+    "HelperSessionSchedule",
     "Invoice",
     "InvoiceLine",
     "Qualification",
     "QualificationActivity",
     "Season",
+    "SeasonMembership",
     "Session",
 ]
@@ -167,3 +167,98 @@ class HelperSessionAvailability(models.Model):
             helper=self.helper.get_full_name(),
             is_available=is_available,
         )
+
+
+class HelperSessionSchedule(models.Model):
+    """
+    Where a helper appears in a session, and as what: one row per helper,
+    session and role, maintained by `update_for_sessions` through the challenge
+    signals
+    """
+
+    ROLE_SUPERLEADER = "superleader"
+    ROLE_CHOSEN = "chosen"
+    ROLE_LEADER = "leader"
+    ROLE_HELPER = "helper"
+    ROLE_ACTOR = "actor"
+    ROLE_CHOICES = (
+        (ROLE_SUPERLEADER, _("Moniteur·trice + / Photographe")),
+        (ROLE_CHOSEN, _("Choisi")),
+        (ROLE_LEADER, _("Moniteur·trice 2")),
+        (ROLE_HELPER, _("Moniteur·trice 1")),
+        (ROLE_ACTOR, _("Intervenant·e")),
+    )
+    # The roles from the qualifications
+    ASSIGNED_ROLES = [ROLE_LEADER, ROLE_HELPER, ROLE_ACTOR]
+
+    session = models.ForeignKey(
+        Session,
+        verbose_name=_("Session"),
+        related_name="schedules",
+        on_delete=models.CASCADE,
+    )
+    helper = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name=_("Moniteur"),
+        related_name="session_schedules",
+        on_delete=models.CASCADE,
+    )
+    role = models.CharField(_("Rôle"), max_length=11, choices=ROLE_CHOICES)
+
+    class Meta:
+        unique_together = (("helper", "session", "role"),)
+
+    @classmethod
+    def update_for_sessions(cls, session_ids):
+        """
+        Bring the rows of these sessions up to date with their superleader,
+        availabilities and qualifications
+        """
+        from .qualification import Qualification
+
+        session_ids = set(session_ids)
+        if not session_ids:
+            return
+        schedules = {
+            (session_id, helper_id, cls.ROLE_SUPERLEADER)
+            for session_id, helper_id in Session.objects.filter(
+                pk__in=session_ids, superleader__isnull=False
+            ).values_list("pk", "superleader_id")
+        }
+        schedules.update(
+            (session_id, helper_id, cls.ROLE_CHOSEN)
+            for session_id, helper_id in HelperSessionAvailability.objects.filter(
+                session_id__in=session_ids
+            )
+            .exclude(chosen_as=CHOSEN_AS_NOT)
+            .values_list("session_id", "helper_id")
+        )
+        for session_id, leader_id, actor_id, helper_id in Qualification.objects.filter(
+            session_id__in=session_ids
+        ).values_list("session_id", "leader_id", "actor_id", "helpers"):
+            for user_id, role in [
+                (leader_id, cls.ROLE_LEADER),
+                (helper_id, cls.ROLE_HELPER),
+                (actor_id, cls.ROLE_ACTOR),
+            ]:
+                if user_id:
+                    schedules.add((session_id, user_id, role))
+
+        existing = {
+            (session_id, helper_id, role): pk
+            for pk, session_id, helper_id, role in cls.objects.filter(
+                session_id__in=session_ids
+            ).values_list("id", "session_id", "helper_id", "role")
+        }
+        stale = [pk for key, pk in existing.items() if key not in schedules]
+        if stale:
+            cls.objects.filter(pk__in=stale).delete()
+        new = schedules - existing.keys()
+        if new:
+            cls.objects.bulk_create(
+                [
+                    cls(session_id=session_id, helper_id=helper_id, role=role)
+                    for session_id, helper_id, role in new
+                ],
+                ignore_conflicts=True,
+            )
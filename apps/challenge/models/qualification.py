@@ -18,7 +18,6 @@ from django.conf import settings
 from django.core.validators import MaxValueValidator
 from django.db import models
 from django.db.models import IntegerChoices, Q
-from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext
 from django.utils.translation import gettext_lazy as _
@@ -195,31 +194,17 @@ class Qualification(models.Model):
     def n_helpers_enum(self) -> MonitorNumberEnum:
         return MonitorNumberEnum(self.n_helpers)
 
-    @cached_property
+    @property
+    def availability_incoherences(self):
+        """
+        The users assigned in this qualification without being chosen as such,
+        from the report of the whole session
+        """
+        return self.session.availability_incoherences.get(self.pk)
+
+    @property
     def has_availability_incoherences(self):
-        # Check les intervenants
-        if (
-            self.actor
-            and not self.session.availability_statuses.filter(
-                helper=self.actor, chosen_as=CHOSEN_AS_ACTOR
-            ).exists()
-        ):
-            return True
-        # Check les moniteurs 2
-        if (
-            self.leader
-            and not self.session.availability_statuses.filter(
-                helper=self.leader, chosen_as=CHOSEN_AS_LEADER
-            ).exists()
-        ):
-            return True
-        # Check les moniteurs 1
-        for helper in self.helpers.all():
-            if not self.session.availability_statuses.filter(
-                helper=helper, chosen_as=CHOSEN_AS_HELPER
-            ).exists():
-                return True
-        return False
+        return self.availability_incoherences is not None
 
     def fix_availability_incoherences(self):
         # many-to-many won't work without self.id.
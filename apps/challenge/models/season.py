@@ -14,7 +14,9 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import operator
 from datetime import date, timedelta
+from functools import reduce
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -207,10 +209,35 @@ class Season(models.Model):
 
     @property
     def has_availability_incoherences(self):
-        for session in self.sessions_with_qualifs:
-            if session.has_availability_incoherences:
-                return True
-        return False
+        return bool(self.availability_incoherences)
+
+    @cached_property
+    def availability_incoherences(self):
+        """
+        Incoherences report of all qualifications of the season, see
+        `get_availability_incoherences`
+        """
+        from ..utils import get_availability_incoherences
+
+        return get_availability_incoherences(self.sessions_with_qualifs.values("id"))
+
+    def prime_availability_incoherences(self, sessions):
+        """
+        Give these sessions, with their qualifications prefetched, their slice of
+        the season's `availability_incoherences` instead of querying it per
+        session; return them as a list
+        """
+        sessions = list(sessions)
+        report = self.availability_incoherences
+        for session in sessions:
+            # The report only covers the season's sessions
+            if session.day and self.begin <= session.day <= self.end:
+                session.availability_incoherences = {
+                    quali.pk: report[quali.pk]
+                    for quali in session.qualifications.all()
+                    if quali.pk in report
+                }
+        return sessions
 
     @property
     def sessions(self):
@@ -246,6 +273,15 @@ class Season(models.Model):
             )
         return self.sessions_with_q
 
+    @cached_property
+    def assignments(self):
+        """
+        (session_id, user_id): CHOSEN_AS_* for the qualifications of the season
+        """
+        from ..utils import get_assignments
+
+        return get_assignments(self.sessions_with_qualifs.values("id"))
+
     @cached_property
     def all_helpers_qs(self):
         User = get_user_model()
@@ -271,9 +307,115 @@ class Season(models.Model):
         """
         # All users selected in season can see all of this season's sessions
         # Coordinators can always consult.
-        return (
-            self.staff_can_see and self.all_helpers_qs.filter(id=user.id).exists()
-        ) or self.all_coordinator_qs.filter(id=user.id).exists()
+        roles = [SeasonMembership.ROLE_COORDINATOR]
+        if self.staff_can_see:
+            roles.append(SeasonMembership.ROLE_STAFF)
+        return self.memberships.filter(user_id=user.id, role__in=roles).exists()
+
+    @classmethod
+    def unprivileged_user_can_see_qs(cls, user):
+        """
+        All the seasons a user can consult, see `unprivileged_user_can_see`
+        """
+        return cls.objects.filter(
+            Q(memberships__role=SeasonMembership.ROLE_COORDINATOR)
+            | Q(
+                memberships__role=SeasonMembership.ROLE_STAFF,
+                state=DV_SEASON_STATE_RUNNING,
+            ),
+            memberships__user_id=user.id,
+        ).distinct()
+
+    @classmethod
+    def containing(cls, days_cantons):
+        """
+        The seasons spanning any of the (day, canton) pairs
+        """
+        months_cantons = {(day.year * 12 + day.month, c) for day, c in days_cantons}
+        if not months_cantons:
+            return cls.objects.none()
+        return cls.objects.annotate(
+            first_month=models.F("year") * 12 + models.F("month_start")
+        ).filter(
+            reduce(
+                operator.or_,
+                [
+                    Q(
+                        first_month__lte=month,
+                        first_month__gt=month - models.F("n_months"),
+                        cantons__contains=[canton],
+                    )
+                    for month, canton in months_cantons
+                ],
+            )
+        )
+
+    def update_memberships(self, user_ids=None):
+        """
+        Bring the SeasonMembership rows of this season up to date with its
+        qualifications and organizations, for all users or only `user_ids`
+        """
+        from .qualification import Qualification
+
+        qualifications = Qualification.objects.filter(
+            session__orga__address_canton__in=self.cantons,
+            session__day__gte=self.begin,
+            session__day__lte=self.end,
+        )
+        existing = self.memberships.all()
+        if user_ids is not None:
+            user_ids = {user_id for user_id in user_ids if user_id is not None}
+            if not user_ids:
+                return
+            staff_qualifications = qualifications.filter(
+                Q(leader_id__in=user_ids)
+                | Q(actor_id__in=user_ids)
+                | Q(helpers__in=user_ids)
+            )
+            qualifications = qualifications.filter(
+                session__orga__coordinator_id__in=user_ids
+            )
+            existing = existing.filter(user_id__in=user_ids)
+        else:
+            staff_qualifications = qualifications
+
+        staff = set()
+        for qualification_user_ids in staff_qualifications.values_list(
+            "leader_id", "actor_id", "helpers"
+        ):
+            staff.update(qualification_user_ids)
+        coordinators = set(
+            qualifications.values_list(
+                "session__orga__coordinator_id", flat=True
+            ).distinct()
+        )
+        memberships = {
+            (user_id, role)
+            for users, role in [
+                (staff, SeasonMembership.ROLE_STAFF),
+                (coordinators, SeasonMembership.ROLE_COORDINATOR),
+            ]
+            for user_id in users
+            if user_id is not None and (user_ids is None or user_id in user_ids)
+        }
+
+        existing = set(existing.values_list("user_id", "role"))
+        stale = existing - memberships
+        if stale:
+            self.memberships.filter(
+                reduce(
+                    operator.or_,
+                    [Q(user_id=user_id, role=role) for user_id, role in stale],
+                )
+            ).delete()
+        if memberships - existing:
+            SeasonMembership.objects.bulk_create(
+                [
+                    SeasonMembership(season=self, user_id=user_id, role=role)
+                    for user_id, role in memberships - existing
+                ],
+                ignore_conflicts=True,
+            )
 
     def get_absolute_url(self):
         return reverse("season-detail", args=[self.pk])
@@ -285,9 +427,12 @@ class Season(models.Model):
         super().save(*args, **kwargs)
         # Clear cached properties
         for cached_prop in [
+            "begin",
+            "end",
             "can_set_state_running",
             "staff_can_update_availability",
             "staff_can_see_planning",
+            "staff_can_see",
             "manager_can_crud",
             "coordinator_can_update",
             "season_full",
@@ -314,3 +459,34 @@ class Season(models.Model):
             desc=self.desc(False),
             leader=" - %s" % self.leader.get_full_name() if self.leader else "",
         )
+
+
+class SeasonMembership(models.Model):
+    """
+    Who takes part in a season, and as what; maintained by
+    `Season.update_memberships` through the challenge signals
+    """
+
+    ROLE_STAFF = "staff"
+    ROLE_COORDINATOR = "coordinator"
+    ROLE_CHOICES = (
+        (ROLE_STAFF, _("Personnel")),
+        (ROLE_COORDINATOR, _("Coordina·teur·trice")),
+    )
+
+    season = models.ForeignKey(
+        Season,
+        verbose_name=_p("Singular month", "Mois"),
+        related_name="memberships",
+        on_delete=models.CASCADE,
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name=_("Utilisateur"),
+        related_name="season_memberships",
+        on_delete=models.CASCADE,
+    )
+    role = models.CharField(_("Rôle"), max_length=11, choices=ROLE_CHOICES)
+
+    class Meta:
+        unique_together = (("user", "season", "role"),)
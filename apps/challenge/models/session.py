@@ -117,10 +117,13 @@ class Session(Address, models.Model):
 
     @cached_property
     def has_availability_incoherences(self):
-        for quali in self.qualifications.all():
-            if quali.has_availability_incoherences:
-                return True
-        return False
+        return bool(self.availability_incoherences)
+
+    @cached_property
+    def availability_incoherences(self):
+        from ..utils import get_availability_incoherences
+
+        return get_availability_incoherences([self.pk])
 
     @property
     def errors(self):
@@ -231,16 +234,15 @@ class Session(Address, models.Model):
     def actor_needs(self):
         return self.n_qualifications
 
+    @cached_property
+    def assignments(self):
+        from ..utils import get_assignments
+
+        return get_assignments([self.pk])
+
     def user_assignment(self, user):
         # Check as what a user is assigned to that session
-        for q in self.qualifications.all():
-            if user == q.leader:
-                return CHOSEN_AS_LEADER
-            if user in q.helpers.all():
-                return CHOSEN_AS_HELPER
-            if user == q.actor:
-                return CHOSEN_AS_ACTOR
-        return None
+        return self.assignments.get((self.pk, user.pk))
 
     def n_quali_things(self, field):
         return sum([q for q in self.qualifications.values_list(field, flat=True) if q])
@@ -0,0 +1,240 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from apps.orga.models import Organization
+from apps.user.models import UserProfile
+
+from . import CHOSEN_AS_NOT
+from .models import (
+    HelperSessionAvailability,
+    HelperSessionSchedule,
+    Qualification,
+    Season,
+    Session,
+)
+
+
+def update_memberships(sessions, user_ids=None):
+    """
+    Update the memberships of the seasons containing `sessions`, a Session
+    queryset or (day, canton) pairs, for all users or only `user_ids`
+    """
+    if not isinstance(sessions, list):
+        sessions = list(sessions.values_list("day", "orga__address_canton"))
+    for season in Season.containing(
+        [(day, canton) for day, canton in sessions if day and canton]
+    ):
+        season.update_memberships(user_ids)
+
+
+def _position(season):
+    return (season.year, season.month_start, season.n_months, season.cantons)
+
+
+@receiver(pre_save, sender=Season)
+def season_previous_position(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._previous_position = (
+            Season.objects.filter(pk=instance.pk)
+            .values_list("year", "month_start", "n_months", "cantons")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Season)
+def season_memberships(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created or getattr(instance, "_previous_position", None) != _position(instance):
+        instance.update_memberships()
+
+
+def _qualification_users(qualification, *sessions):
+    return {qualification.leader_id, qualification.actor_id} | set(
+        Session.objects.filter(pk__in=sessions).values_list(
+            "orga__coordinator_id", flat=True
+        )
+    )
+
+
+@receiver(pre_save, sender=Qualification)
+def qualification_previous_state(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._previous_state = (
+            Qualification.objects.filter(pk=instance.pk)
+            .values_list("session_id", "leader_id", "actor_id")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Qualification)
+def qualification_memberships(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous_state = getattr(instance, "_previous_state", None)
+    state = (instance.session_id, instance.leader_id, instance.actor_id)
+    if previous_state == state:
+        return
+    UserProfile.invalidate_users_that_worked_in_cantons()
+    sessions = {instance.session_id}
+    user_ids = _qualification_users(instance, instance.session_id)
+    if previous_state:
+        previous_session_id, *previous_user_ids = previous_state
+        user_ids.update(previous_user_ids)
+        if previous_session_id != instance.session_id:
+            # The helpers moved along
+            sessions.add(previous_session_id)
+            user_ids.update(_qualification_users(instance, previous_session_id))
+            user_ids.update(instance.helpers.values_list("id", flat=True))
+    HelperSessionSchedule.update_for_sessions(sessions)
+    update_memberships(Session.objects.filter(pk__in=sessions), user_ids)
+
+
+@receiver(pre_delete, sender=Qualification)
+def qualification_previous_users(sender, instance, **kwargs):
+    # The helpers links are gone after the deletion
+    instance._previous_user_ids = _qualification_users(
+        instance, instance.session_id
+    ) | set(instance.helpers.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Qualification)
+def qualification_deleted_memberships(sender, instance, **kwargs):
+    UserProfile.invalidate_users_that_worked_in_cantons()
+    HelperSessionSchedule.update_for_sessions([instance.session_id])
+    update_memberships(
+        Session.objects.filter(pk=instance.session_id),
+        getattr(instance, "_previous_user_ids", None),
+    )
+
+
+@receiver(m2m_changed, sender=Qualification.helpers.through)
+def qualification_helpers_memberships(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action == "pre_clear":
+        # Remember what is about to be cleared
+        if reverse:
+            instance._cleared_pks = set(
+                instance.qualifs_mon1.values_list("id", flat=True)
+            )
+        else:
+            instance._cleared_pks = set(instance.helpers.values_list("id", flat=True))
+        return
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    if action == "post_clear":
+        pk_set = getattr(instance, "_cleared_pks", set())
+    if not pk_set:
+        return
+    UserProfile.invalidate_users_that_worked_in_cantons()
+    if not reverse:
+        sessions = Session.objects.filter(pk=instance.session_id)
+        user_ids = pk_set
+    else:
+        sessions = Session.objects.filter(qualifications__in=pk_set)
+        user_ids = {instance.pk}
+    HelperSessionSchedule.update_for_sessions(sessions.values_list("id", flat=True))
+    update_memberships(sessions, user_ids)
+
+
+def _availability_schedules(availability):
+    return HelperSessionSchedule.objects.filter(
+        session_id=availability.session_id,
+        helper_id=availability.helper_id,
+        role=HelperSessionSchedule.ROLE_CHOSEN,
+    )
+
+
+@receiver(post_save, sender=HelperSessionAvailability)
+def availability_schedules(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.chosen_as == CHOSEN_AS_NOT:
+        _availability_schedules(instance).delete()
+    else:
+        HelperSessionSchedule.objects.bulk_create(
+            [
+                HelperSessionSchedule(
+                    session_id=instance.session_id,
+                    helper_id=instance.helper_id,
+                    role=HelperSessionSchedule.ROLE_CHOSEN,
+                )
+            ],
+            ignore_conflicts=True,
+        )
+
+
+@receiver(post_delete, sender=HelperSessionAvailability)
+def availability_deleted_schedules(sender, instance, **kwargs):
+    _availability_schedules(instance).delete()
+
+
+@receiver(pre_save, sender=Session)
+def session_previous_position(sender, instance, raw=False, **kwargs):
+    # Remember where the session was, it might move to an other season
+    if instance.pk and not raw:
+        instance._previous_position = (
+            Session.objects.filter(pk=instance.pk)
+            .values_list("day", "orga_id", "orga__address_canton", "superleader_id")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Session)
+def session_memberships(sender, instance, created, raw=False, **kwargs):
+    # A new session has no qualifications yet; deleted ones are handled through
+    # the deletion of their qualifications
+    if raw:
+        return
+    previous_position = getattr(instance, "_previous_position", None)
+    previous_superleader_id = previous_position[3] if previous_position else None
+    if previous_superleader_id != instance.superleader_id:
+        HelperSessionSchedule.update_for_sessions([instance.pk])
+    if (
+        created
+        or not previous_position
+        or previous_position[:2] == (instance.day, instance.orga_id)
+    ):
+        return
+    UserProfile.invalidate_users_that_worked_in_cantons()
+    previous_day, previous_orga_id, previous_canton, __ = previous_position
+    update_memberships(
+        [(previous_day, previous_canton), (instance.day, instance.orga.address_canton)]
+    )
+
+
+@receiver(pre_save, sender=Organization)
+def organization_previous_state(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._previous_state = (
+            Organization.objects.filter(pk=instance.pk)
+            .values_list("address_canton", "coordinator_id")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Organization)
+def organization_memberships(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    previous_state = getattr(instance, "_previous_state", None)
+    if previous_state == (instance.address_canton, instance.coordinator_id):
+        return
+    UserProfile.invalidate_users_that_worked_in_cantons()
+    cantons = {instance.address_canton}
+    if previous_state:
+        cantons.add(previous_state[0])
+    update_memberships(
+        [
+            (day, canton)
+            for day in instance.sessions.values_list("day", flat=True)
+            for canton in cantons
+        ]
+    )
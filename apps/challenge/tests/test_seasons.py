@@ -15,10 +15,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import datetime
 
+from django import forms
+from django.core.exceptions import ValidationError
+from django.http import QueryDict
 from django.test import TestCase
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
+import pytest
 from bs4 import BeautifulSoup
 
 from apps.common import (
@@ -34,7 +38,9 @@ from apps.common import (
 )
 from apps.common.forms import SWISS_DATE_INPUT_FORMAT
 from apps.orga.tests.factories import OrganizationFactory
+from apps.salary.models import MonthlyTimesheetStatus, UserWorkedDay
 from apps.user import FORMATION_M1, FORMATION_M2
+from apps.user.models import UserProfile
 from apps.user.tests.factories import UserFactory
 from defivelo.tests.utils import (
     AuthClient,
@@ -45,9 +51,29 @@ from defivelo.tests.utils import (
 
 from .. import (
     AVAILABILITY_FIELDKEY,
+    CHOICE_FIELDKEY,
+    CHOSEN_AS_ACTOR,
+    CHOSEN_AS_HELPER,
     CHOSEN_AS_LEADER,
+    CHOSEN_AS_NOT,
+    CHOSEN_AS_REPLACEMENT,
+    CONFLICT_FIELDKEY,
+    SEASON_WORKWISH_FIELDKEY,
+    STAFF_FIELDKEY,
+    SUPERLEADER_FIELDKEY,
 )
-from ..models import HelperSessionAvailability
+from ..fields import BSAvailabilityRadioSelect, SessionMatrixField
+from ..matrix import SeasonAvailabilityMatrix
+from ..models import (
+    HelperSessionAvailability,
+    HelperSessionSchedule,
+    Qualification,
+    Season,
+    SeasonMembership,
+    Session,
+)
+from ..models.availability import HelperSeasonWorkWish
+from ..utils import get_roles_matrix, get_users_roles_for_session
 from .factories import QualificationFactory, SeasonFactory, SessionFactory
 
 freeforallurls = ["season-list"]
@@ -382,6 +408,160 @@ class StateManagerUserTest(SeasonTestCaseMixin):
                     response = self.client.get(url, follow=True)
                     self.assertEqual(response.status_code, 200, url)
 
+    def test_season_availabilities_conflict(self):
+        session = self.sessions[0]
+        helper = UserFactory(profile__affiliation_canton=self.season.cantons[0])
+        HelperSessionAvailability.objects.create(
+            session=session, helper=helper, availability="y"
+        )
+        # Same day, chosen in an other month
+        foreign_season = SeasonFactory(
+            cantons=self.foreigncantons[:1],
+            year=self.season.year,
+            month_start=self.season.month_start,
+            n_months=1,
+        )
+        foreign_session = SessionFactory(
+            day=session.day, orga__address_canton=self.foreigncantons[0]
+        )
+        HelperSessionAvailability.objects.create(
+            session=foreign_session,
+            helper=helper,
+            availability="y",
+            chosen_as=CHOSEN_AS_HELPER,
+        )
+
+        url = reverse("season-availabilities", kwargs={"pk": self.season.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        self.assertContains(
+            response,
+            reverse("season-availabilities", kwargs={"pk": foreign_season.pk})
+            + "#sess%d" % foreign_session.pk,
+        )
+
+    def test_season_availabilities_update_only_changes(self):
+        helper = UserFactory(
+            profile__affiliation_canton=self.season.cantons[0],
+            profile__formation=FORMATION_M1,
+        )
+        unchanged = self.sessions[0]
+        added = SessionFactory(orga=unchanged.orga, day=unchanged.day)
+        QualificationFactory(session=added)
+        HelperSessionAvailability.objects.create(
+            session=unchanged, helper=helper, availability="y"
+        )
+        url = reverse(
+            "season-availabilities-update",
+            kwargs={"pk": self.season.pk, "helperpk": helper.pk},
+        )
+        data = {
+            SEASON_WORKWISH_FIELDKEY.format(hpk=helper.pk): 3,
+            AVAILABILITY_FIELDKEY.format(hpk=helper.pk, spk=unchanged.pk): "y",
+            AVAILABILITY_FIELDKEY.format(hpk=helper.pk, spk=added.pk): "i",
+        }
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302, url)
+
+        self.assertEqual(
+            HelperSeasonWorkWish.objects.get(season=self.season, helper=helper).amount,
+            3,
+        )
+        hsa = HelperSessionAvailability.objects.get(session=unchanged, helper=helper)
+        self.assertEqual(hsa.availability, "y")
+        # Untouched availabilities don't get a new history entry
+        self.assertEqual(hsa.history.count(), 1)
+        self.assertEqual(
+            HelperSessionAvailability.objects.get(
+                session=added, helper=helper
+            ).availability,
+            "i",
+        )
+
+        # Only the changed availability is written
+        data[AVAILABILITY_FIELDKEY.format(hpk=helper.pk, spk=unchanged.pk)] = "n"
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302, url)
+        hsa.refresh_from_db()
+        self.assertEqual(hsa.availability, "n")
+        self.assertEqual(hsa.history.count(), 2)
+        self.assertEqual(HelperSeasonWorkWish.history.filter(helper=helper).count(), 1)
+
+    def test_season_staff_update(self):
+        session = self.sessions[0]
+        leader = UserFactory(
+            profile__affiliation_canton=self.season.cantons[0],
+            profile__formation=FORMATION_M2,
+        )
+        helper = UserFactory(
+            profile__affiliation_canton=self.season.cantons[0],
+            profile__formation=FORMATION_M1,
+        )
+        quali = QualificationFactory(session=session, leader=leader, helpers=[helper])
+        untouched = self.qualifs[0]
+        untouched_history = untouched.history.count()
+        helper_status = MonthlyTimesheetStatus.objects.filter(
+            user=helper, year=session.day.year, month=session.day.month
+        )
+        helper_worked_day = UserWorkedDay.objects.filter(user=helper, day=session.day)
+        self.assertTrue(helper_status.exists())
+        self.assertTrue(helper_worked_day.exists())
+        self.assertIn(
+            helper,
+            UserProfile.get_cached_users_that_worked_in_cantons(
+                [session.orga.address_canton], session.day.year
+            ),
+        )
+
+        url = reverse("season-staff-update", kwargs={"pk": self.season.pk})
+        response = self.client.post(
+            url,
+            {
+                STAFF_FIELDKEY.format(hpk=leader.pk, spk=session.pk): CHOSEN_AS_NOT,
+                STAFF_FIELDKEY.format(
+                    hpk=helper.pk, spk=session.pk
+                ): CHOSEN_AS_REPLACEMENT,
+            },
+        )
+        self.assertEqual(response.status_code, 302, url)
+
+        self.assertEqual(
+            HelperSessionAvailability.objects.get(
+                session=session, helper=leader
+            ).chosen_as,
+            CHOSEN_AS_NOT,
+        )
+        self.assertEqual(
+            HelperSessionAvailability.objects.get(
+                session=session, helper=helper
+            ).chosen_as,
+            CHOSEN_AS_REPLACEMENT,
+        )
+        quali.refresh_from_db()
+        self.assertIsNone(quali.leader)
+        self.assertFalse(quali.helpers.exists())
+        # Qualifications that didn't change aren't saved
+        self.assertEqual(untouched.history.count(), untouched_history)
+        # The helper removed in bulk doesn't work that day anymore
+        self.assertFalse(helper_status.exists())
+        self.assertFalse(helper_worked_day.exists())
+        self.assertNotIn(
+            helper,
+            UserProfile.get_cached_users_that_worked_in_cantons(
+                [session.orga.address_canton], session.day.year
+            ),
+        )
+
+    def test_season_errors_list(self):
+        quali = self.qualifs[0]
+        helper = UserFactory()
+        quali.helpers.add(helper)
+
+        url = reverse("season-errorslist", kwargs={"pk": self.season.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        self.assertEqual(list(response.context["qualifs"]), [quali])
+
     def test_season_runningplanning_accesses(self):
         # Loop over all states
         for state in DV_SEASON_STATES:
@@ -1010,6 +1190,312 @@ def test_session_to_season_in_previous_year(db):
     assert session.season.end >= session.day
 
 
+def test_season_availability_matrix(db, django_assert_max_num_queries):
+    season = SeasonFactory(cantons=["VD"], year=2019, month_start=4, n_months=1)
+    other_season = SeasonFactory(cantons=["VS"], year=2019, month_start=4, n_months=1)
+    session = SessionFactory(
+        day=datetime.date(2019, 4, 12), orga=OrganizationFactory(address_canton="VD")
+    )
+    other_session = SessionFactory(
+        day=datetime.date(2019, 4, 12), orga=OrganizationFactory(address_canton="VS")
+    )
+    leader, replacement, absent = UserFactory(), UserFactory(), UserFactory()
+    QualificationFactory(session=session, leader=leader)
+    QualificationFactory(session=other_session)
+    session.superleader = absent
+    session.save()
+    HelperSessionAvailability.objects.create(
+        session=session,
+        helper=replacement,
+        availability="i",
+        chosen_as=CHOSEN_AS_REPLACEMENT,
+    )
+    conflict = HelperSessionAvailability.objects.create(
+        session=other_session,
+        helper=replacement,
+        availability="y",
+        chosen_as=CHOSEN_AS_HELPER,
+    )
+    HelperSeasonWorkWish.objects.create(season=season, helper=replacement, amount=3)
+
+    with django_assert_max_num_queries(6):
+        matrix = SeasonAvailabilityMatrix(season, [leader, replacement, absent])
+
+    assert matrix.has_availabilities
+    keys = {"hpk": leader.pk, "spk": session.pk}
+    assert matrix[AVAILABILITY_FIELDKEY.format(**keys)] == "y"
+    assert matrix[STAFF_FIELDKEY.format(**keys)] == CHOSEN_AS_LEADER
+    assert matrix[CHOICE_FIELDKEY.format(**keys)] is True
+    assert matrix[CONFLICT_FIELDKEY.format(**keys)] == []
+
+    keys = {"hpk": replacement.pk, "spk": session.pk}
+    assert matrix[SEASON_WORKWISH_FIELDKEY.format(hpk=replacement.pk)] == 3
+    assert matrix[AVAILABILITY_FIELDKEY.format(**keys)] == "i"
+    assert matrix[STAFF_FIELDKEY.format(**keys)] == CHOSEN_AS_REPLACEMENT
+    assert matrix[CHOICE_FIELDKEY.format(**keys)] is False
+    assert matrix[CONFLICT_FIELDKEY.format(**keys)] == [conflict]
+
+    keys = {"hpk": absent.pk, "spk": session.pk}
+    assert matrix[AVAILABILITY_FIELDKEY.format(**keys)] == ""
+    assert matrix[SUPERLEADER_FIELDKEY.format(**keys)] is True
+    assert SUPERLEADER_FIELDKEY.format(hpk=leader.pk, spk=session.pk) not in matrix
+
+    assert matrix.helper_keys(absent.pk) == [
+        SEASON_WORKWISH_FIELDKEY.format(hpk=absent.pk),
+        AVAILABILITY_FIELDKEY.format(**keys),
+        STAFF_FIELDKEY.format(**keys),
+        CHOICE_FIELDKEY.format(**keys),
+        SUPERLEADER_FIELDKEY.format(**keys),
+        CONFLICT_FIELDKEY.format(**keys),
+    ]
+    assert matrix.chosen_as(replacement.pk, other_session.pk) is None
+    assert SeasonAvailabilityMatrix(other_season, []).has_availabilities
+
+
+def test_season_assignments(db, django_assert_num_queries):
+    season = SeasonFactory(cantons=["VD"], year=2019, month_start=4, n_months=1)
+    session = SessionFactory(
+        day=datetime.date(2019, 4, 12), orga=OrganizationFactory(address_canton="VD")
+    )
+    leader, helper, actor = UserFactory(), UserFactory(), UserFactory()
+    QualificationFactory(session=session, leader=leader, helpers=[helper])
+    # The first qualification wins
+    second = QualificationFactory(session=session)
+    Qualification.objects.filter(pk=second.pk).update(actor=helper)
+    QualificationFactory(session=session, actor=actor)
+
+    with django_assert_num_queries(2):
+        assignments = season.assignments
+    assert assignments == {
+        (session.pk, leader.pk): CHOSEN_AS_LEADER,
+        (session.pk, helper.pk): CHOSEN_AS_HELPER,
+        (session.pk, actor.pk): CHOSEN_AS_ACTOR,
+    }
+    assert session.user_assignment(helper) == CHOSEN_AS_HELPER
+    assert session.user_assignment(UserFactory()) is None
+
+    roles = get_users_roles_for_session([leader, helper, actor], session, assignments)
+    assert list(roles.values()) == ["M2", "M1", "Int."]
+
+
+def test_roles_matrix(db, django_assert_num_queries):
+    leader, helper, replacement, superleader, other = (UserFactory() for i in range(5))
+    session = SessionFactory(superleader=superleader)
+    QualificationFactory(session=session, leader=leader, helpers=[helper])
+    HelperSessionAvailability.objects.create(
+        session=session,
+        helper=replacement,
+        availability="y",
+        chosen_as=CHOSEN_AS_REPLACEMENT,
+    )
+    other_session = SessionFactory(superleader=leader)
+    users = [leader, helper, replacement, superleader, other]
+
+    with django_assert_num_queries(4):
+        matrix = get_roles_matrix(
+            [user.pk for user in users], [session.pk, other_session.pk]
+        )
+    assert matrix == [
+        ["M2", "M1", "S", "M+", ""],
+        ["M+", "", "", "", ""],
+    ]
+
+
+def test_season_availability_incoherences(db, django_assert_num_queries):
+    season = SeasonFactory(cantons=["VD"], year=2019, month_start=4, n_months=1)
+    session = SessionFactory(
+        day=datetime.date(2019, 4, 12), orga=OrganizationFactory(address_canton="VD")
+    )
+    leader, helper, other_helper, actor = (UserFactory() for i in range(4))
+    coherent = QualificationFactory(
+        session=session, leader=leader, helpers=[helper], actor=actor
+    )
+    incoherent = QualificationFactory(session=session)
+    Qualification.objects.filter(pk=incoherent.pk).update(leader=helper, actor=actor)
+    incoherent.helpers.add(other_helper)
+
+    with django_assert_num_queries(2):
+        report = season.availability_incoherences
+    assert report == {
+        incoherent.pk: {
+            "actor": None,
+            "leader": helper.pk,
+            "helpers": [other_helper.pk],
+        }
+    }
+    assert season.has_availability_incoherences
+
+    session = Session.objects.get(pk=session.pk)
+    qualifs = list(session.qualifications.all())
+    with django_assert_num_queries(2):
+        assert [q.has_availability_incoherences for q in qualifs] == [False, True]
+    assert qualifs[0].pk == coherent.pk
+    assert qualifs[1].availability_incoherences == report[incoherent.pk]
+    assert session.has_availability_incoherences
+
+    # The listed sessions read their slice of the season's report
+    other_session = SessionFactory(day=datetime.date(2019, 4, 13), orga=session.orga)
+    QualificationFactory(session=other_session)
+    season = Season.objects.get(pk=season.pk)
+    sessions = list(season.sessions_by_orga)
+    with django_assert_num_queries(2):
+        season.prime_availability_incoherences(sessions)
+    with django_assert_num_queries(0):
+        assert [
+            (
+                s.pk,
+                s.has_availability_incoherences,
+                [q.has_availability_incoherences for q in s.qualifications.all()],
+            )
+            for s in sessions
+        ] == [
+            (session.pk, True, [False, True]),
+            (other_session.pk, False, [False]),
+        ]
+
+
+def test_season_memberships(db, django_assert_num_queries):
+    season = SeasonFactory(
+        cantons=["VD"],
+        year=2019,
+        month_start=4,
+        n_months=1,
+        state=DV_SEASON_STATE_RUNNING,
+    )
+    coordinator, helper, actor = UserFactory(), UserFactory(), UserFactory()
+    session = SessionFactory(
+        day=datetime.date(2019, 4, 12),
+        orga=OrganizationFactory(address_canton="VD", coordinator=coordinator),
+    )
+    quali = QualificationFactory(session=session, helpers=[helper], actor=actor)
+
+    def memberships():
+        return set(season.memberships.values_list("user_id", "role"))
+
+    assert memberships() == {
+        (coordinator.pk, SeasonMembership.ROLE_COORDINATOR),
+        (helper.pk, SeasonMembership.ROLE_STAFF),
+        (actor.pk, SeasonMembership.ROLE_STAFF),
+    }
+    with django_assert_num_queries(1):
+        assert season.unprivileged_user_can_see(helper)
+    assert list(Season.unprivileged_user_can_see_qs(helper)) == [season]
+    assert not season.unprivileged_user_can_see(UserFactory())
+
+    season.state = DV_SEASON_STATE_OPEN
+    season.save()
+    assert not season.unprivileged_user_can_see(helper)
+    assert season.unprivileged_user_can_see(coordinator)
+    assert list(Season.unprivileged_user_can_see_qs(helper)) == []
+
+    quali.helpers.remove(helper)
+    assert memberships() == {
+        (coordinator.pk, SeasonMembership.ROLE_COORDINATOR),
+        (actor.pk, SeasonMembership.ROLE_STAFF),
+    }
+    quali.helpers.add(helper)
+    quali.actor = None
+    quali.save()
+    assert (actor.pk, SeasonMembership.ROLE_STAFF) not in memberships()
+    Qualification.objects.get(pk=quali.pk).delete()
+    assert memberships() == set()
+
+    quali = QualificationFactory(session=session, actor=actor)
+    other_coordinator = UserFactory()
+    session.orga.coordinator = other_coordinator
+    session.orga.save()
+    assert memberships() == {
+        (other_coordinator.pk, SeasonMembership.ROLE_COORDINATOR),
+        (actor.pk, SeasonMembership.ROLE_STAFF),
+    }
+
+    # The session moves out of the season
+    session.day = datetime.date(2019, 5, 12)
+    session.save()
+    assert memberships() == set()
+
+
+def test_helper_session_schedules(db):
+    superleader, helper, leader = UserFactory(), UserFactory(), UserFactory()
+    session = SessionFactory(superleader=superleader)
+    # Also creates the availabilities with the matching chosen_as
+    quali = QualificationFactory(session=session, helpers=[helper], leader=leader)
+
+    def schedules():
+        return set(session.schedules.values_list("helper_id", "role"))
+
+    assert schedules() == {
+        (superleader.pk, HelperSessionSchedule.ROLE_SUPERLEADER),
+        (helper.pk, HelperSessionSchedule.ROLE_HELPER),
+        (helper.pk, HelperSessionSchedule.ROLE_CHOSEN),
+        (leader.pk, HelperSessionSchedule.ROLE_LEADER),
+        (leader.pk, HelperSessionSchedule.ROLE_CHOSEN),
+    }
+
+    HelperSessionAvailability.objects.get(session=session, helper=helper).delete()
+    quali.helpers.clear()
+    session.superleader = None
+    session.save()
+    assert schedules() == {
+        (leader.pk, HelperSessionSchedule.ROLE_LEADER),
+        (leader.pk, HelperSessionSchedule.ROLE_CHOSEN),
+    }
+
+    quali.delete()
+    HelperSessionAvailability.objects.filter(session=session).update(
+        chosen_as=CHOSEN_AS_NOT
+    )
+    HelperSessionSchedule.update_for_sessions([session.pk])
+    assert schedules() == set()
+
+
+def test_session_matrix_field():
+    field = SessionMatrixField(
+        key_format=AVAILABILITY_FIELDKEY,
+        helper_choices={1: HelperSessionAvailability.AVAILABILITY_CHOICES},
+        session_pks=[10, 11],
+        cell_widget=BSAvailabilityRadioSelect,
+        cell_options=lambda helper_pk, session_pk: {"forbid_absence": session_pk == 11},
+        initial={(1, 10): "y"},
+    )
+    data = QueryDict(mutable=True)
+    data.update(
+        {
+            AVAILABILITY_FIELDKEY.format(hpk=1, spk=10): "i",
+            AVAILABILITY_FIELDKEY.format(hpk=1, spk=11): "",
+            # Unknown helper, session or other field: ignored
+            AVAILABILITY_FIELDKEY.format(hpk=2, spk=10): "y",
+            AVAILABILITY_FIELDKEY.format(hpk=1, spk=12): "y",
+            SEASON_WORKWISH_FIELDKEY.format(hpk=1): "2",
+        }
+    )
+    assert field.clean(field.widget.value_from_datadict(data, {}, "avail")) == {
+        (1, 10): "i"
+    }
+    data[AVAILABILITY_FIELDKEY.format(hpk=1, spk=11)] = "x"
+    with pytest.raises(ValidationError):
+        field.clean(field.widget.value_from_datadict(data, {}, "avail"))
+
+    # Cells are rendered as the standalone widgets would
+    cells = field.render_row(1)
+    for session_pk, cell, value, forbid_absence in [
+        (10, cells[0], "y", False),
+        (11, cells[1], "", True),
+    ]:
+        key = AVAILABILITY_FIELDKEY.format(hpk=1, spk=session_pk)
+        widget = BSAvailabilityRadioSelect(
+            choices=HelperSessionAvailability.AVAILABILITY_CHOICES,
+            forbid_absence=forbid_absence,
+        )
+        assert cell == widget.render(key, value, attrs={"id": key})
+    assert field.render_row(2) == []
+
+    # The whole grid renders too, e.g. through {{ form }}
+    form = forms.Form()
+    form.fields["avail"] = field
+    assert str(form["avail"]) == "<div>%s</div>" % "".join(cells)
+
+
 class CoordinatorUserTest(SeasonTestCaseMixin):
     def setUp(self):
         self.client = CoordinatorAuthClient()
@@ -1271,3 +1757,25 @@ class TestPlanning(SeasonTestCaseMixin):
                     content,
                     "Expected organiser name to be present in CSV export",
                 )
+
+    def test_general_personal_calendar(self):
+        year = self.season.year
+        dv_season = (
+            DV_SEASON_SPRING
+            if self.season.month_start <= DV_SEASON_LAST_SPRING_MONTH
+            else DV_SEASON_AUTUMN
+        )
+        session_in_scope = self.sessions[0]
+        session_in_scope.orga.address_canton = self.canton
+        session_in_scope.orga.save()
+        QualificationFactory(actor=self.user1, session=session_in_scope)
+
+        url = reverse(
+            "season-personal-calendar",
+            kwargs={"year": year, "dv_season": dv_season, "helperpk": self.user1.pk},
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        content = response.content.decode("utf-8")
+        self.assertEqual(content.count("BEGIN:VEVENT"), 1)
+        self.assertIn(session_in_scope.orga.name, content)
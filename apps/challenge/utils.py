@@ -3,7 +3,8 @@ from datetime import time
 from typing import Mapping
 
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Q, Sum
+from django.db.models import Count, Sum
+from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext
 from django.utils.translation import gettext as _
@@ -22,52 +23,153 @@ from . import (
 User = get_user_model()
 
 
-def get_users_roles_for_session(users, session) -> Mapping[User, str]:
+def get_assignments(session_ids) -> Mapping[tuple[int, int], int]:
     """
-    Get the role (in short format) of each user of `users` in `session`.
+    Map (session_id, user_id) to the CHOSEN_AS_* under which that user is
+    assigned in the qualifications of these sessions.
+
+    Same precedence as going through the qualifications in order: the first
+    qualification wins, then leader, helpers and actor.
     """
-    user_session_chosen_as = dict(
-        session.availability_statuses.exclude(chosen_as=CHOSEN_AS_NOT).values_list(
-            "helper_id", "chosen_as"
-        )
+    from .models import Qualification
+
+    qualifs_helpers = {}
+    for quali_id, user_id in Qualification.helpers.through.objects.filter(
+        qualification__session_id__in=session_ids
+    ).values_list("qualification_id", "user_id"):
+        qualifs_helpers.setdefault(quali_id, []).append(user_id)
+
+    assignments = {}
+    for quali_id, session_id, leader_id, actor_id in Qualification.objects.filter(
+        session_id__in=session_ids
+    ).values_list("id", "session_id", "leader_id", "actor_id"):
+        if leader_id:
+            assignments.setdefault((session_id, leader_id), CHOSEN_AS_LEADER)
+        for user_id in qualifs_helpers.get(quali_id, []):
+            assignments.setdefault((session_id, user_id), CHOSEN_AS_HELPER)
+        if actor_id:
+            assignments.setdefault((session_id, actor_id), CHOSEN_AS_ACTOR)
+    return assignments
+
+
+def get_availability_incoherences(session_ids) -> Mapping[int, dict]:
+    """
+    Compare the assignments in the qualifications of these sessions with the
+    chosen_as of their availabilities, in two queries.
+
+    Return a report of the qualifications with incoherences only:
+    {qualification_id: {"actor": user_id, "leader": user_id, "helpers": [user_id]}}
+    listing the assigned users not chosen as such for the session.
+    """
+    from .models import HelperSessionAvailability, Qualification
+
+    chosen = set(
+        HelperSessionAvailability.objects.filter(
+            session_id__in=session_ids,
+            chosen_as__in=[CHOSEN_AS_ACTOR, CHOSEN_AS_LEADER, CHOSEN_AS_HELPER],
+        ).values_list("session_id", "helper_id", "chosen_as")
     )
-    qualifications = session.qualifications.all()
-
-    roles = {}
-    for user in users:
-        label = ""
-        for quali in qualifications:
-            if user == quali.leader:
-                label = formation_short(FORMATION_M2, True)
-                break
-            elif user in quali.helpers.all():
-                label = formation_short(FORMATION_M1, True)
-                break
-            elif user == quali.actor:
-                # Translators: Nom court pour 'Intervenant'
-                label = gettext("Int.")
-                break
-        # Vérifie tout de même si l’utilisateur est déjà sélectionné
-        if not label and user.id in user_session_chosen_as:
-            if user_session_chosen_as[user.id] == CHOSEN_AS_LEADER:
-                label = formation_short(FORMATION_M2, True)
-            elif user_session_chosen_as[user.id] == CHOSEN_AS_HELPER:
-                label = formation_short(FORMATION_M1, True)
-            elif user_session_chosen_as[user.id] == CHOSEN_AS_ACTOR:
-                # Translators: Nom court pour 'Intervenant'
-                label = gettext("Int.")
-            elif user_session_chosen_as[user.id] == CHOSEN_AS_REPLACEMENT:
-                # Translators: Nom court pour 'Moniteur·trice de secours'
-                label = gettext("S")
-            else:
-                label = gettext("×")
-
-        if user == session.superleader:
-            # Translators: Nom court pour 'Moniteur +'
-            label = "{} / {}".format(label, gettext("M+")) if label else gettext("M+")
-
-        roles[user] = label
-    return roles
+
+    report = {}
+    for quali_id, session_id, actor_id, leader_id, helper_id in (
+        Qualification.objects.filter(session_id__in=session_ids)
+        .values_list("id", "session_id", "actor_id", "leader_id", "helpers")
+        .order_by()
+    ):
+        if quali_id not in report:
+            report[quali_id] = {"actor": None, "leader": None, "helpers": []}
+            # Check les intervenants
+            if actor_id and (session_id, actor_id, CHOSEN_AS_ACTOR) not in chosen:
+                report[quali_id]["actor"] = actor_id
+            # Check les moniteurs 2
+            if leader_id and (session_id, leader_id, CHOSEN_AS_LEADER) not in chosen:
+                report[quali_id]["leader"] = leader_id
+        # Check les moniteurs 1
+        if helper_id and (session_id, helper_id, CHOSEN_AS_HELPER) not in chosen:
+            report[quali_id]["helpers"].append(helper_id)
+    return {
+        quali_id: incoherences
+        for quali_id, incoherences in report.items()
+        if any(incoherences.values())
+    }
+
+
+def get_roles_matrix(user_ids, session_ids, assignments=None) -> list[list[str]]:
+    """
+    Get the role (in short format) of each user in each session, as a
+    `matrix[session_index][user_index]` list of lists following the order of
+    `session_ids` and `user_ids`.
+
+    `assignments` is an optional map from `get_assignments()` covering these
+    sessions, to avoid recomputing it.
+    """
+    from .models import HelperSessionAvailability, Session
+
+    user_ids = list(user_ids)
+    session_ids = list(session_ids)
+    if assignments is None:
+        assignments = get_assignments(session_ids)
+    users_index = {user_id: i for i, user_id in enumerate(user_ids)}
+    sessions_index = {session_id: i for i, session_id in enumerate(session_ids)}
+    matrix = [[""] * len(user_ids) for session_id in session_ids]
+
+    # Translators: Nom court pour 'Intervenant'
+    actor_label = gettext("Int.")
+    assigned_labels = {
+        CHOSEN_AS_LEADER: formation_short(FORMATION_M2, True),
+        CHOSEN_AS_HELPER: formation_short(FORMATION_M1, True),
+        CHOSEN_AS_ACTOR: actor_label,
+    }
+    chosen_labels = {
+        **assigned_labels,
+        # Translators: Nom court pour 'Moniteur·trice de secours'
+        CHOSEN_AS_REPLACEMENT: gettext("S"),
+    }
+
+    # Vérifie si l’utilisateur est déjà sélectionné
+    for session_id, helper_id, chosen_as in (
+        HelperSessionAvailability.objects.filter(
+            session_id__in=session_ids, helper_id__in=user_ids
+        )
+        .exclude(chosen_as=CHOSEN_AS_NOT)
+        .values_list("session_id", "helper_id", "chosen_as")
+    ):
+        matrix[sessions_index[session_id]][users_index[helper_id]] = chosen_labels.get(
+            chosen_as, gettext("×")
+        )
+    # The assignments in the qualifications win
+    for (session_id, user_id), assignment in assignments.items():
+        if (
+            session_id in sessions_index
+            and user_id in users_index
+            and assignment in assigned_labels
+        ):
+            matrix[sessions_index[session_id]][users_index[user_id]] = assigned_labels[
+                assignment
+            ]
+    # Translators: Nom court pour 'Moniteur +'
+    superleader_label = gettext("M+")
+    for session_id, superleader_id in Session.objects.filter(
+        pk__in=session_ids, superleader_id__in=user_ids
+    ).values_list("pk", "superleader_id"):
+        row = matrix[sessions_index[session_id]]
+        i = users_index[superleader_id]
+        row[i] = (
+            "{} / {}".format(row[i], superleader_label) if row[i] else superleader_label
+        )
+    return matrix
+
+
+def get_users_roles_for_session(users, session, assignments=None) -> Mapping[User, str]:
+    """
+    Get the role (in short format) of each user of `users` in `session`, see
+    `get_roles_matrix`.
+    """
+    users = list(users)
+    if assignments is None:
+        assignments = session.assignments
+    (roles,) = get_roles_matrix([user.pk for user in users], [session.pk], assignments)
+    return dict(zip(users, roles))
 
 
 def is_morning(begin):
@@ -136,16 +238,7 @@ class GeneralSeason(object):
             )
             # If a helper is specified, restrict to sessions relevant to that helper
             if self.helper_id:
-                qs = qs.filter(
-                    Q(superleader_id=self.helper_id)
-                    | (
-                        Q(availability_statuses__helper_id=self.helper_id)
-                        & ~Q(availability_statuses__chosen_as=CHOSEN_AS_NOT)
-                    )
-                    | Q(qualifications__leader_id=self.helper_id)
-                    | Q(qualifications__helpers__id=self.helper_id)
-                    | Q(qualifications__actor_id=self.helper_id)
-                ).distinct()
+                qs = qs.filter(pk__in=self.helper_sessions())
                 # Update cantons to only those with confirmed availability/assignment
                 self.cantons = list(
                     qs.values_list("orga__address_canton", flat=True).distinct()
@@ -153,6 +246,29 @@ class GeneralSeason(object):
             self._sessions_with_q = qs
         return self._sessions_with_q
 
+    def helper_sessions(self, roles=None):
+        """
+        Ids of the sessions of the period where the helper appears (as one of
+        `roles`, see `HelperSessionSchedule`)
+        """
+        from .models import HelperSessionSchedule
+
+        schedules = HelperSessionSchedule.objects.filter(
+            helper_id=self.helper_id,
+            session__day__gte=self.begin,
+            session__day__lte=self.end,
+        )
+        if roles is not None:
+            schedules = schedules.filter(role__in=roles)
+        return schedules.values("session_id")
+
+    @cached_property
+    def assignments(self):
+        """
+        (session_id, user_id): CHOSEN_AS_* for the qualifications of the period
+        """
+        return get_assignments(self.sessions_with_qualifs.values("id"))
+
     @property
     def work_wishes(self):
         from .models.availability import HelperSeasonWorkWish
@@ -19,6 +19,7 @@ import operator
 import re
 from collections import OrderedDict
 from functools import reduce
+from itertools import zip_longest
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -42,7 +43,6 @@ from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, UpdateView
 
 from django_ical.views import ICalFeed
-from rolepermissions.checkers import has_role
 from rolepermissions.mixins import HasPermissionsMixin
 from tablib import Dataset
 
@@ -60,7 +60,7 @@ from apps.common.views import ExportMixin
 from apps.user import FORMATION_KEYS, FORMATION_M1, FORMATION_M2
 from apps.user.models import USERSTATUS_ACTIVE, USERSTATUS_DELETED, USERSTATUS_RESERVE
 from apps.user.views import ActorsList, HelpersList
-from defivelo.roles import has_permission, user_cantons
+from defivelo.roles import has_permission, has_role, user_cantons
 from defivelo.templatetags.dv_filters import dv_season_url
 from defivelo.views import MenuView
 
@@ -70,12 +70,6 @@ from .. import (
     CHOSEN_AS_ACTOR,
     CHOSEN_AS_HELPER,
     CHOSEN_AS_LEADER,
-    CHOSEN_AS_NOT,
-    CHOSEN_KEYS,
-    CONFLICT_FIELDKEY,
-    SEASON_WORKWISH_FIELDKEY,
-    STAFF_FIELDKEY,
-    SUPERLEADER_FIELDKEY,
 )
 from ..forms import (
     SeasonAvailabilityForm,
@@ -86,8 +80,13 @@ from ..forms import (
     SeasonToSpecificStateForm,
 )
 from ..forms.season import SeasonStaffFilterForm
-from ..models import HelperSessionAvailability, Qualification, Season
-from ..models.availability import HelperSeasonWorkWish
+from ..matrix import SeasonAvailabilityMatrix
+from ..models import (
+    HelperSessionAvailability,
+    HelperSessionSchedule,
+    Qualification,
+    Season,
+)
 from ..models.qualification import (
     CATEGORY_CHOICE_A,
     CATEGORY_CHOICE_B,
@@ -95,7 +94,7 @@ from ..models.qualification import (
 )
 from ..utils import (
     GeneralSeason,
-    get_users_roles_for_session,
+    get_roles_matrix,
     seasons_in_scope_for_user,
 )
 from .mixins import CantonSeasonFormMixin
@@ -232,7 +231,9 @@ class SeasonDetailView(SeasonMixin, DetailView):
         sessions = self.season.sessions_by_orga
         if not has_permission(self.request.user, "challenge_see_all_orga"):
             sessions = sessions.filter(orga__coordinator=self.request.user)
-        context["sessions_by_orga"] = sessions
+        context["sessions_by_orga"] = self.season.prime_availability_incoherences(
+            sessions
+        )
         return context
 
 
@@ -378,80 +379,16 @@ class SeasonAvailabilityMixin(SeasonHelpersMixin):
         # Overridden in aggregated/general-planning views
         return False
 
-    def get_initial(self, all_hsas=None, all_helpers=None):
-        initials = OrderedDict()
-        if not all_hsas:
-            all_hsas = self.current_availabilities()
+    def get_initial(self, all_helpers=None):
         if not all_helpers:
             all_helpers = self.potential_helpers()
 
-        if all_hsas:
-            all_sessions = self.object.sessions_with_qualifs
-            all_wishes = dict(
-                self.object.work_wishes.values_list("helper_id", "amount")
-            )
-            potential_conflicts = (
-                HelperSessionAvailability.objects
-                # Ne boucle pas
-                .exclude(session__id__in=all_sessions)
-                # Seulement des sessions concernées
-                .filter(session__day__in=all_sessions.values_list("day", flat=True))
-                # Seulement dans les états qui nous intéressent
-                .filter(chosen_as__in=CHOSEN_KEYS)
-                .prefetch_related("session", "session__orga")
-            )
-            for helper_category, helpers in all_helpers:
-                helpers_conflicts = list(potential_conflicts.filter(helper__in=helpers))
-
-                for helper in helpers:
-                    helper_availability = {
-                        a.session_id: a for a in all_hsas if a.helper == helper
-                    }
-                    # Fill in the wishes
-                    initials[SEASON_WORKWISH_FIELDKEY.format(hpk=helper.pk)] = (
-                        all_wishes[helper.pk] if helper.pk in all_wishes else 0
-                    )
-
-                    for session in all_sessions:
-                        fieldkey = AVAILABILITY_FIELDKEY.format(
-                            hpk=helper.pk, spk=session.pk
-                        )
-                        staffkey = STAFF_FIELDKEY.format(hpk=helper.pk, spk=session.pk)
-                        choicekey = CHOICE_FIELDKEY.format(
-                            hpk=helper.pk, spk=session.pk
-                        )
-                        conflictkey = CONFLICT_FIELDKEY.format(
-                            hpk=helper.pk, spk=session.pk
-                        )
-                        superleaderkey = SUPERLEADER_FIELDKEY.format(
-                            hpk=helper.pk, spk=session.pk
-                        )
-                        try:
-                            hsa = helper_availability[session.id]
-                            initials[fieldkey] = hsa.availability
-                            # Si un choix est fait _dans_ une session (qualif)
-                            initials[staffkey] = session.user_assignment(helper)
-                            initials[choicekey] = True
-                            # Le choix n’est fait qu'au niveau de la session
-                            if not initials[staffkey]:
-                                initials[staffkey] = hsa.chosen_as
-                                initials[choicekey] = False
-                        except Exception:
-                            initials[fieldkey] = ""
-                            initials[staffkey] = ""
-                            initials[choicekey] = ""
-                        # List super-leaders (Moniteurs +)
-                        if session.superleader == helper:
-                            initials[superleaderkey] = True
-
-                        # Trouve les disponibilités en conflit
-                        initials[conflictkey] = [
-                            hc.session
-                            for hc in helpers_conflicts
-                            if hc.helper_id == helper.pk
-                            and hc.session.day == session.day
-                        ]
-            return initials
+        matrix = SeasonAvailabilityMatrix(
+            self.object,
+            [helper for category, helpers in all_helpers for helper in helpers],
+        )
+        if matrix.has_availabilities:
+            return matrix
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -822,10 +759,14 @@ class SeasonExportView(
             _("M+"),
         ]
 
-    def get_dataset(self):
-        dataset = Dataset()
+    export_streaming = True
+
+    def get_export_rows(self):
+        # The sheet is laid out by columns: one per session or qualification.
+        # They are all built before the first row, only the file is streamed.
+        columns = []
         # Prépare le fichier
-        dataset.append_col(
+        columns.append(
             [
                 gettext("Date"),
                 gettext("Canton"),
@@ -936,12 +877,12 @@ class SeasonExportView(
                         else ""
                     )
                     col.append(quali.comments)
-                    dataset.append_col(col)
+                    columns.append(col)
                     col = []
             else:
                 col += [""] * 13
-                dataset.append_col(col)
-        return dataset
+                columns.append(col)
+        return None, zip_longest(*columns, fillvalue="")
 
 
 class GeneralPlanningSupportMixin(object):
@@ -1088,19 +1029,18 @@ class SeasonPersonalPlanningExportView(
                 helperpk = None
             if helperpk:
                 # Include sessions where the helper is assigned in any qualification
-                chosen_ids = set(
-                    sessions_qs.filter(
-                        Q(qualifications__leader_id=helperpk)
-                        | Q(qualifications__helpers__id=helperpk)
-                        | Q(qualifications__actor_id=helperpk)
-                    ).values_list("id", flat=True)
+                sessions_qs = sessions_qs.filter(
+                    pk__in=HelperSessionSchedule.objects.filter(
+                        helper_id=helperpk,
+                        role__in=HelperSessionSchedule.ASSIGNED_ROLES,
+                    ).values("session_id")
                 )
-                if chosen_ids:
-                    sessions_qs = sessions_qs.filter(pk__in=chosen_ids)
-                else:
-                    sessions_qs = sessions_qs.none()
 
-        for session in sessions_qs:
+        sessions = list(sessions_qs)
+        roles = get_roles_matrix(
+            [user.pk for user in qs], [session.pk for session in sessions]
+        )
+        for session, users_roles in zip(sessions, roles):
             session_place = session.place
             if not session_place:
                 session_place = (
@@ -1116,7 +1056,6 @@ class SeasonPersonalPlanningExportView(
                 "%s - %s" % (time(session.begin), time(session.end)),
                 session.n_qualifications,
             ]
-            users_roles = list(get_users_roles_for_session(qs, session).values())
             col += users_roles
             dataset.append_col(col)
         return dataset
@@ -1134,19 +1073,15 @@ class SeasonAvailabilityView(SeasonAvailabilityMixin, DetailView):
         # Add the form for picking a new helper
         context["form"] = SeasonNewHelperAvailabilityForm(cantons=self.season.cantons)
         hsas = self.current_availabilities()
-        if hsas:
+        if hsas.exists():
             # Fill in the helpers with the ones we currently have
-            helpers_pks = self.current_availabilities().values_list(
-                "helper_id", flat=True
-            )
+            helpers_pks = hsas.values_list("helper_id", flat=True)
             potential_helpers = self.potential_helpers(
                 qs=get_user_model().objects.filter(pk__in=helpers_pks)
             )
 
             context["potential_helpers"] = potential_helpers
-            context["availabilities"] = self.get_initial(
-                all_hsas=hsas, all_helpers=potential_helpers
-            )
+            context["availabilities"] = self.get_initial(all_helpers=potential_helpers)
         return context
 
     def post(self, request, *args, **kwargs):
@@ -1416,8 +1351,10 @@ class SeasonGeneralPlanningView(SeasonAvailabilityMixin, DetailView):
         context["availabilities"] = pruned
 
         _, _, seasons = self._seasons_in_scope()
-        context["user_can_see_season"] = any(
-            s.unprivileged_user_can_see(self.request.user) for s in seasons
+        context["user_can_see_season"] = (
+            Season.unprivileged_user_can_see_qs(self.request.user)
+            .filter(pk__in=[s.pk for s in seasons])
+            .exists()
         )
         return context
 
@@ -1515,51 +1452,6 @@ class SeasonAvailabilityUpdateView(SeasonAvailabilityMixin, SeasonUpdateView):
                 },
             )
 
-    def form_valid(self, form):
-        # Create or update the Availability objects
-        for session in self.object.sessions_with_qualifs:
-            for helper_category, helpers in self.potential_helpers():
-                for helper in helpers:
-                    # Fill in the wishes
-                    workwishkey = SEASON_WORKWISH_FIELDKEY.format(hpk=helper.pk)
-                    if workwishkey in form.cleaned_data:
-                        amount = form.cleaned_data[workwishkey]
-                        try:
-                            (hww, created) = HelperSeasonWorkWish.objects.get_or_create(
-                                season=self.season,
-                                helper=helper,
-                                defaults={"amount": amount},
-                            )
-                        except HelperSeasonWorkWish.MultipleObjectsReturned:
-                            # Too many of these, for some reason. Take the latest.
-                            hww = HelperSeasonWorkWish.objects.filter(
-                                season=self.season, helper=helper
-                            ).order_by("-id")[0]
-                            created = False
-                        if not created:
-                            hww.amount = amount
-                            hww.save()
-
-                    # Fill in the availabilities
-                    fieldkey = AVAILABILITY_FIELDKEY.format(
-                        hpk=helper.pk, spk=session.pk
-                    )
-                    if fieldkey in form.cleaned_data:
-                        availability = form.cleaned_data[fieldkey]
-                        if availability:
-                            (
-                                hsa,
-                                created,
-                            ) = HelperSessionAvailability.objects.get_or_create(
-                                session=session,
-                                helper=helper,
-                                defaults={"availability": availability},
-                            )
-                            if not created:
-                                hsa.availability = availability
-                                hsa.save()
-        return super(SeasonAvailabilityUpdateView, self).form_valid(form)
-
 
 class SeasonStaffChoiceUpdateView(
     SeasonAvailabilityMixin, SeasonUpdateView, HasPermissionsMixin
@@ -1571,10 +1463,13 @@ class SeasonStaffChoiceUpdateView(
     view_is_update = True
 
     def get_initial(self):
-        # Shortcut through giving only the available_helpers
-        return super(SeasonStaffChoiceUpdateView, self).get_initial(
-            all_hsas=None, all_helpers=self.available_helpers
-        )
+        # Shortcut through giving only the available_helpers; the form and the
+        # context share the same matrix
+        if not hasattr(self, "_initial"):
+            self._initial = super(SeasonStaffChoiceUpdateView, self).get_initial(
+                all_helpers=self.available_helpers
+            )
+        return self._initial
 
     def get_form_kwargs(self):
         form_kwargs = super(SeasonStaffChoiceUpdateView, self).get_form_kwargs()
@@ -1591,40 +1486,7 @@ class SeasonStaffChoiceUpdateView(
         return context
 
     def form_valid(self, form):
-        # Update all staff choices
-        for session in self.object.sessions_with_qualifs:
-            session_helpers = {}  # Those picked for the season
-            session_non_helpers = {}  # Those not picked for the season
-            for helper_category, helpers in self.available_helpers:
-                for helper in helpers:
-                    fieldkey = STAFF_FIELDKEY.format(hpk=helper.pk, spk=session.pk)
-
-                    try:
-                        chosen_as = int(form.cleaned_data[fieldkey])
-
-                        HelperSessionAvailability.objects.filter(
-                            session=session, helper=helper
-                        ).update(chosen_as=chosen_as)
-                    except ValueError:
-                        chosen_as = None
-
-                    if chosen_as != CHOSEN_AS_NOT:
-                        session_helpers[helper.pk] = helper
-                    else:
-                        session_non_helpers[helper.pk] = helper
-
-            # Do a session-wide check across all helpers picked for that
-            # session
-            for quali in session.qualifications.all():
-                for non_helper in session_non_helpers.values():
-                    # Drop those not in the session anymore
-                    if non_helper == quali.leader:
-                        quali.leader = None
-                    if non_helper in quali.helpers.all():
-                        quali.helpers.remove(helper)
-                    if non_helper == quali.actor:
-                        quali.actor = None
-                quali.save()
+        form.save()
         return HttpResponseRedirect(
             reverse_lazy("season-availabilities", kwargs={"pk": self.object.pk})
         )
@@ -1700,15 +1562,10 @@ class SeasonErrorsListView(HasPermissionsMixin, SeasonMixin, ListView):
         return context
 
     def get_queryset(self):
-        wrong_qualifs = []
-        for session in self.season.sessions_with_qualifs.all():
-            for quali in session.qualifications.all():
-                if quali.has_availability_incoherences:
-                    wrong_qualifs.append(quali.pk)
         return (
             super(SeasonErrorsListView, self)
             .get_queryset()
-            .filter(pk__in=wrong_qualifs)
+            .filter(pk__in=list(self.season.availability_incoherences))
             .distinct()
         )
 
@@ -1735,20 +1592,37 @@ class SeasonPersonalPlanningExportFeed(GeneralPlanningSupportMixin, ICalFeed):
         return super().__call__(request)
 
     def items(self):
-        return self.object.sessions_with_qualifs.filter(
-            Q(superleader=self.user)
-            | Q(qualifications__actor=self.user)
-            | Q(qualifications__helpers=self.user)
-            | Q(qualifications__leader=self.user)
+        sessions = list(
+            self.object.sessions_with_qualifs.filter(
+                pk__in=self.user.session_schedules.filter(
+                    role__in=[HelperSessionSchedule.ROLE_SUPERLEADER]
+                    + HelperSessionSchedule.ASSIGNED_ROLES
+                ).values("session_id")
+            )
         )
+        session_pks = [session.pk for session in sessions]
+        self.role_labels = {
+            session_pk: role_label
+            for session_pk, (role_label,) in zip(
+                session_pks,
+                get_roles_matrix(
+                    [self.user.pk], session_pks, assignments=self.object.assignments
+                ),
+            )
+        }
+        return sessions
 
     def item_guid(self, session):
         return "{}-{}".format(session.id, "session")
 
     def item_title(self, session):
-        roles_by_user = get_users_roles_for_session([self.user], session)
-        role_label = roles_by_user[self.user]
-        return " ".join([role_label, session.orga.address_canton, session.orga.name])
+        return " ".join(
+            [
+                self.role_labels[session.pk],
+                session.orga.address_canton,
+                session.orga.name,
+            ]
+        )
 
     def item_description(self, session):
         session_place = session.place
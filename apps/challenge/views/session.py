@@ -150,6 +150,16 @@ class SessionsListView(SessionMixin, WeekArchiveView):
             return super().dispatch(request, *args, **kwargs)
         raise PermissionDenied
 
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related("qualifications")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["sessions"] = self.season_object.prime_availability_incoherences(
+            context["sessions"]
+        )
+        return context
+
 
 class SessionDetailView(SessionMixin, DetailView):
     # Allow season fetch even for non-state managers
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class CommonConfig(AppConfig):
+    name = "apps.common"
+
+    def ready(self) -> None:  # type: ignore[override]
+        # Import signal handlers to ensure they are registered at startup
+        from . import signals  # noqa: F401
+
+        return super().ready()
@@ -0,0 +1,88 @@
+import csv
+import tempfile
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+
+STREAMING_EXPORT_FORMATS = ["csv", "xlsx"]
+XLSX_CHUNK_SIZE = 64 * 1024
+
+
+class Echo:
+    """
+    File-like object handing back what is written, for `csv.writer`
+    """
+
+    def write(self, value):
+        return value
+
+
+def resource_rows(resource, queryset):
+    """
+    (headers, rows) of an import_export resource export, as in
+    `Resource.export()`, but with rows computed as they are consumed
+    """
+    resource.before_export(queryset)
+    queryset = resource.filter_export(queryset)
+    return resource.get_export_headers(), (
+        resource.export_resource(obj) for obj in resource.iter_queryset(queryset)
+    )
+
+
+def stream_csv(headers, rows, **kwargs):
+    """
+    Yield the CSV lines of the export, as tablib would write them
+    """
+    kwargs.setdefault("delimiter", ",")
+    writer = csv.writer(Echo(), **kwargs)
+    if headers:
+        yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _xlsx_cell(sheet, value, **styles):
+    try:
+        cell = WriteOnlyCell(sheet, value=value)
+    except ValueError:
+        cell = WriteOnlyCell(sheet, value=str(value))
+    for style, style_value in styles.items():
+        setattr(cell, style, style_value)
+    return cell
+
+
+def stream_xlsx(headers, rows, title="Tablib Dataset"):
+    """
+    Yield the chunks of the XLSX file of the export, laid out as tablib would.
+
+    The sheet is written in openpyxl's write-only mode, which spools the rows
+    to disk instead of keeping them in memory.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    if headers:
+        # Freeze the headers line
+        sheet.freeze_panes = "A2"
+        bold = Font(bold=True)
+        sheet.append([_xlsx_cell(sheet, header, font=bold) for header in headers])
+    wrap_text = Alignment(wrap_text=True)
+    for row in rows:
+        sheet.append(
+            [
+                _xlsx_cell(sheet, value, alignment=wrap_text)
+                if "\n" in str(value)
+                else _xlsx_cell(sheet, value)
+                for value in row
+            ]
+        )
+    with tempfile.TemporaryFile() as xlsx_file:
+        workbook.save(xlsx_file)
+        xlsx_file.seek(0)
+        yield from iter(lambda: xlsx_file.read(XLSX_CHUNK_SIZE), b"")
+
+
+def stream_export(formattxt, headers, rows, **kwargs):
+    if formattxt == "xlsx":
+        return stream_xlsx(headers, rows)
+    return (line.encode("utf-8") for line in stream_csv(headers, rows, **kwargs))
@@ -0,0 +1,183 @@
+import datetime
+import hashlib
+import re
+import tempfile
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.files import File
+from django.db import transaction
+from django.http import FileResponse
+from django.shortcuts import redirect, render
+from django.test import RequestFactory
+from django.urls import resolve
+from django.utils import timezone, translation
+from django.utils.functional import SimpleLazyObject
+
+from defivelo.roles import permissions_snapshot
+
+from .models import DataVersion, ExportJob
+
+
+def bump_data_version():
+    """
+    Bump the data version once the current transaction is committed, once per
+    transaction
+    """
+    connection = transaction.get_connection()
+    # Shared by the callbacks of the transaction: the first one to run bumps.
+    # A rolled back transaction leaves it pending for the next one.
+    pending = getattr(connection, "data_version_bump", None)
+    if pending is None or pending["done"]:
+        pending = connection.data_version_bump = {"done": False}
+
+    def bump():
+        if not pending["done"]:
+            pending["done"] = True
+            DataVersion.bump()
+
+    transaction.on_commit(bump)
+
+
+# Query parameter of the link retrying a failed export
+RETRY_PARAMETER = "retry_export"
+
+
+def export_job_key(request, export_type, data_version, path=None):
+    return hashlib.sha256(
+        "\n".join(
+            [
+                export_type,
+                path or request.get_full_path(),
+                str(request.user.pk),
+                translation.get_language() or "",
+                str(data_version),
+            ]
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def export_job_response(request, export_type):
+    """
+    Serve the export file if it was built from the current data, or enqueue
+    its job and tell the user to come back.
+
+    A failed job is built again when the user asks to (with RETRY_PARAMETER),
+    a job whose worker died once it ran for longer than EXPORT_JOBS_TIMEOUT.
+    """
+    path = request.get_full_path()
+    retry = RETRY_PARAMETER in request.GET
+    if retry:
+        query = request.GET.copy()
+        del query[RETRY_PARAMETER]
+        path = request.path + ("?" + query.urlencode() if query else "")
+    data_version = DataVersion.current()
+    key = export_job_key(request, export_type, data_version, path)
+    job = ExportJob.objects.filter(key=key).last()
+    lost_since = timezone.now() - datetime.timedelta(
+        seconds=settings.EXPORT_JOBS_TIMEOUT
+    )
+    if job is not None and (
+        retry
+        and job.status == ExportJob.STATUS_FAILED
+        or job.status == ExportJob.STATUS_RUNNING
+        and (job.started_on is None or job.started_on < lost_since)
+    ):
+        job.status = ExportJob.STATUS_PENDING
+        job.started_on = job.finished_on = None
+        job.error = ""
+        job.save(update_fields=["status", "started_on", "finished_on", "error"])
+    if retry:
+        # Back to the export's own URL, to not retry on each reload
+        return redirect(path)
+    if job is None:
+        job = ExportJob.objects.create(
+            key=key,
+            export_type=export_type,
+            path=path,
+            base_url=request.build_absolute_uri("/"),
+            language=translation.get_language() or "",
+            user=request.user,
+            data_version=data_version,
+        )
+    if job.status == ExportJob.STATUS_DONE:
+        response = FileResponse(
+            job.file.open("rb"), as_attachment=True, filename=job.filename
+        )
+        response["Content-Type"] = job.content_type
+        return response
+    query = request.GET.copy()
+    query[RETRY_PARAMETER] = "1"
+    return render(
+        request,
+        "export_job.html",
+        {"job": job, "retry_url": request.path + "?" + query.urlencode()},
+        status=202,
+    )
+
+
+def run_export_job(job):
+    """
+    Build the file of the job, by calling the export view as its user
+    """
+    base_url = urlsplit(job.base_url or "//" + Site.objects.get_current().domain)
+    request = RequestFactory().get(
+        job.path, secure=base_url.scheme == "https", HTTP_HOST=base_url.netloc
+    )
+    # As the middlewares would have set them up
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+    request.user = job.user
+    request.permissions = SimpleLazyObject(lambda: permissions_snapshot(job.user))
+    request.export_job = job
+    with translation.override(job.language):
+        request.resolver_match = resolve(request.path_info)
+        view, args, kwargs = request.resolver_match
+        response = view(request, *args, **kwargs)
+        if response.status_code != 200:
+            raise ValueError("Export answered with status %s" % response.status_code)
+        with tempfile.TemporaryFile() as export_file:
+            if response.streaming:
+                for chunk in response.streaming_content:
+                    export_file.write(chunk)
+            else:
+                export_file.write(response.content)
+            filename = re.search(
+                r'filename="(.*)"', response.get("Content-Disposition", "")
+            )
+            job.filename = filename.group(1) if filename else job.key
+            job.content_type = response.get("Content-Type", "")
+            job.file.save(job.key, File(export_file), save=False)
+    job.status = ExportJob.STATUS_DONE
+    job.finished_on = timezone.now()
+    job.save()
+
+
+def claim_export_job():
+    """
+    Mark the oldest pending job as running and return it, if any
+    """
+    with transaction.atomic():
+        job = (
+            ExportJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ExportJob.STATUS_PENDING)
+            .first()
+        )
+        if job:
+            job.status = ExportJob.STATUS_RUNNING
+            job.started_on = timezone.now()
+            job.save(update_fields=["status", "started_on"])
+    return job
+
+
+def purge_stale_export_jobs():
+    """
+    Delete the finished jobs, and their files, built from outdated data
+    """
+    for job in ExportJob.objects.exclude(
+        status__in=[ExportJob.STATUS_PENDING, ExportJob.STATUS_RUNNING]
+    ).exclude(data_version=DataVersion.current()):
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
@@ -0,0 +1,45 @@
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...jobs import claim_export_job, purge_stale_export_jobs, run_export_job
+from ...models import ExportJob
+
+
+class Command(BaseCommand):
+    help = "Build the pending exports, see settings.EXPORT_JOBS"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Only build the currently pending exports, then quit",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2,
+            help="Seconds to wait for new exports when idle",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_export_job()
+            if job is None:
+                purge_stale_export_jobs()
+                if options["once"]:
+                    return
+                time.sleep(options["sleep"])
+                continue
+            try:
+                run_export_job(job)
+            except Exception:
+                job.status = ExportJob.STATUS_FAILED
+                job.error = traceback.format_exc()
+                job.finished_on = timezone.now()
+                job.save()
+                self.stderr.write("Export {} failed".format(job.path))
+            else:
+                self.stdout.write("Export {} built".format(job.path))
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.6 on 2026-10-18 22:16
+
+import apps.common.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('common', '0008_merge_WS_in_VS'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('finished_on', models.DateTimeField(blank=True, null=True)),
+                ('key', models.CharField(db_index=True, max_length=64)),
+                ('export_type', models.CharField(max_length=255)),
+                ('path', models.TextField()),
+                ('language', models.CharField(max_length=7)),
+                ('data_version', models.PositiveBigIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('running', 'En cours'), ('done', 'Terminé'), ('failed', 'Échoué')], default='pending', max_length=7)),
+                ('file', models.FileField(blank=True, storage=apps.common.models.export_jobs_storage, upload_to='')),
+                ('filename', models.CharField(blank=True, max_length=255)),
+                ('content_type', models.CharField(blank=True, max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_on'],
+            },
+        ),
+    ]
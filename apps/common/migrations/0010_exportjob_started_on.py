@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-19 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0009_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='started_on',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-19 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0010_exportjob_started_on'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='base_url',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
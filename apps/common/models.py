@@ -14,6 +14,8 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
@@ -33,3 +35,70 @@ class Address(models.Model):
     @property
     def address_canton_full(self):
         return [c[1] for c in STATE_CHOICES if c[0] == self.address_canton][0]
+
+
+class DataVersion(models.Model):
+    """
+    Single counter, bumped after every committed change of the data, which
+    stamps the export files built from it
+    """
+
+    version = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(version=models.F("version") + 1):
+            cls.objects.get_or_create(pk=1, defaults={"version": 1})
+
+
+def export_jobs_storage():
+    return FileSystemStorage(location=settings.EXPORT_JOBS_ROOT)
+
+
+class ExportJob(models.Model):
+    """
+    An export requested through an `ExportMixin` view, built in the background
+    by the run_export_jobs command, and kept while its data version is current
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _("En attente")),
+        (STATUS_RUNNING, _("En cours")),
+        (STATUS_DONE, _("Terminé")),
+        (STATUS_FAILED, _("Échoué")),
+    )
+
+    created_on = models.DateTimeField(auto_now_add=True)
+    started_on = models.DateTimeField(blank=True, null=True)
+    finished_on = models.DateTimeField(blank=True, null=True)
+    # Hash of the export type, its parameters and the data version
+    key = models.CharField(max_length=64, db_index=True)
+    export_type = models.CharField(max_length=255)
+    path = models.TextField()
+    # Scheme and host the export was requested from, e.g. https://example.com/
+    base_url = models.CharField(max_length=255, blank=True)
+    language = models.CharField(max_length=7)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="export_jobs",
+        on_delete=models.CASCADE,
+    )
+    data_version = models.PositiveBigIntegerField()
+    status = models.CharField(
+        max_length=7, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    file = models.FileField(storage=export_jobs_storage, blank=True)
+    filename = models.CharField(max_length=255, blank=True)
+    content_type = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["created_on"]
@@ -0,0 +1,59 @@
+from django.apps import apps
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .jobs import bump_data_version
+
+# The models read by the exports, whose changes outdate the built files
+EXPORTED_MODELS = [
+    settings.AUTH_USER_MODEL,
+    "user.UserProfile",
+    "user.UserManagedState",
+    "orga.Organization",
+    "challenge.Season",
+    "challenge.Session",
+    "challenge.Qualification",
+    "challenge.QualificationActivity",
+    "challenge.HelperSessionAvailability",
+    "challenge.Invoice",
+    "challenge.InvoiceLine",
+    "salary.Timesheet",
+]
+# Fields saved on their own that no export reads, e.g. on each login
+NOT_EXPORTED_FIELDS = {"last_login"}
+
+
+def data_changed(sender, raw=False, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= NOT_EXPORTED_FIELDS:
+        return
+    if not raw:
+        bump_data_version()
+
+
+def relations_changed(sender, action, **kwargs):
+    if action.startswith("post_"):
+        bump_data_version()
+
+
+def connect_exported_models():
+    for model_name in EXPORTED_MODELS:
+        model = apps.get_model(model_name)
+        post_save.connect(data_changed, sender=model)
+        post_delete.connect(data_changed, sender=model)
+        if hasattr(model, "_parler_meta"):
+            # The translated fields
+            translations = model._parler_meta.root_model
+            post_save.connect(data_changed, sender=translations)
+            post_delete.connect(data_changed, sender=translations)
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Qualification = apps.get_model("challenge.Qualification")
+    UserProfile = apps.get_model("user.UserProfile")
+    for through in [
+        User.groups.through,
+        Qualification.helpers.through,
+        UserProfile.actor_for.through,
+    ]:
+        m2m_changed.connect(relations_changed, sender=through)
+
+
+connect_exported_models()
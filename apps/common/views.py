@@ -14,19 +14,46 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from import_export.formats import base_formats
+from tablib import Dataset
+
+from .exports import STREAMING_EXPORT_FORMATS, resource_rows, stream_export
+from .jobs import export_job_response
 
 
 class ExportMixin(object):
     export_class = None
     export_filename = None
     export_kwargs = {}
+    # Stream CSV and XLSX exports row by row, see `get_export_rows`
+    export_streaming = False
+
+    def get_export_job_response(self):
+        """
+        With settings.EXPORT_JOBS, the export is built by the run_export_jobs
+        command (calling the view again) and served once ready
+        """
+        if settings.EXPORT_JOBS and not hasattr(self.request, "export_job"):
+            return export_job_response(
+                self.request,
+                "{}.{}".format(self.__module__, self.__class__.__name__),
+            )
+        return None
+
+    def get(self, request, *args, **kwargs):
+        return self.get_export_job_response() or super().get(request, *args, **kwargs)
 
     def render_to_response(self, context, **response_kwargs):
+        # For the views not going through our get()
+        job_response = self.get_export_job_response()
+        if job_response:
+            return job_response
+
         resolvermatch = self.request.resolver_match
         formattxt = resolvermatch.kwargs.get("format", "csv")
         # Instantiate the format object from base_formats in import_export
@@ -35,21 +62,33 @@ class ExportMixin(object):
         except AttributeError:
             format = base_formats.CSV()
 
-        try:
-            dataset = (self.get_export_class(self.request)).export(self.object_list)
-        except AttributeError:
-            dataset = self.get_dataset()
-
         filename = _("DV-{exportfilename}_{YMD_date}.{extension}").format(
             exportfilename=self.export_filename,
             YMD_date=timezone.now().strftime("%Y%m%d"),
             extension=format.get_extension(),
         )
 
-        response = HttpResponse(
-            dataset.export(formattxt, **self.export_kwargs),
-            format.get_content_type() + ";charset=utf-8",
-        )
+        export_rows = self.get_export_rows()
+        if (
+            export_rows is not None
+            and self.export_streaming
+            and formattxt in STREAMING_EXPORT_FORMATS
+        ):
+            headers, rows = export_rows
+            response = StreamingHttpResponse(
+                stream_export(formattxt, headers, rows, **self.export_kwargs),
+                format.get_content_type() + ";charset=utf-8",
+            )
+        else:
+            if export_rows is not None:
+                headers, rows = export_rows
+                dataset = Dataset(*rows, headers=headers)
+            else:
+                dataset = self.get_dataset()
+            response = HttpResponse(
+                dataset.export(formattxt, **self.export_kwargs),
+                format.get_content_type() + ";charset=utf-8",
+            )
         response["Content-Disposition"] = 'attachment; filename="{f}"'.format(
             f=filename
         )
@@ -61,6 +100,17 @@ class ExportMixin(object):
         """
         return self.export_class
 
+    def get_export_rows(self):
+        """
+        (headers, rows) of the export, rows being any iterable of lists, only
+        consumed while the response is sent; None for the exports only
+        providing a `get_dataset()`
+        """
+        export_class = self.get_export_class(self.request)
+        if export_class is None:
+            return None
+        return resource_rows(export_class, self.object_list)
+
 
 class PaginatorMixin(object):
     paginate_by = 10
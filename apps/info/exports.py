@@ -216,8 +216,11 @@ class LogisticsExport(SeasonSessionsMixin):
         )
 
     def get_dataset(self, html=False):
-        dataset = Dataset()
-        dataset.headers = [
+        headers, rows = self.get_export_rows(html)
+        return Dataset(*rows, headers=headers)
+
+    def get_export_rows(self, html=False):
+        headers = [
             gettext("Canton"),
             gettext("Établissement"),
             gettext("Lieu"),
@@ -237,33 +240,32 @@ class LogisticsExport(SeasonSessionsMixin):
             n_bikes=Sum("qualifications__n_bikes"),
             n_helmets=Sum("qualifications__n_helmets"),
         )
-        for session in sessions:
+        return headers, (
+            self.get_session_row(session, html)
+            for session in sessions.iterator(chunk_size=2000)
+        )
+
+    def get_session_row(self, session, html=False):
+        url = None
+        if html:
             season = session.season
-            url = None
-            if season and html:
+            if season:
                 url = reverse(
                     "session-detail",
                     kwargs={"seasonpk": season.pk, "pk": session.id},
                 )
-            datetxt = datefilter(session.day, settings.DATE_FORMAT_COMPACT)
-            timetxt = datefilter(session.begin, settings.TIME_FORMAT_SHORT)
-            dataset.append(
-                [
-                    session.orga.address_canton,
-                    session.orga.ifabbr if html else session.orga.name,
-                    session.city,
-                    mark_safe(linktxt.format(url=url, content=datetxt))
-                    if url
-                    else datetxt,
-                    mark_safe(linktxt.format(url=url, content=timetxt))
-                    if url
-                    else timetxt,
-                    session.n_qualifs,
-                    session.n_participants,
-                    session.n_bikes,
-                    session.n_helmets,
-                    session.bikes_concept,
-                    session.bikes_phone,
-                ]
-            )
-        return dataset
+        datetxt = datefilter(session.day, settings.DATE_FORMAT_COMPACT)
+        timetxt = datefilter(session.begin, settings.TIME_FORMAT_SHORT)
+        return [
+            session.orga.address_canton,
+            session.orga.ifabbr if html else session.orga.name,
+            session.city,
+            mark_safe(linktxt.format(url=url, content=datetxt)) if url else datetxt,
+            mark_safe(linktxt.format(url=url, content=timetxt)) if url else timetxt,
+            session.n_qualifs,
+            session.n_participants,
+            session.n_bikes,
+            session.n_helmets,
+            session.bikes_concept,
+            session.bikes_phone,
+        ]
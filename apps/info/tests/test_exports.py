@@ -0,0 +1,163 @@
+import datetime
+import tempfile
+from io import BytesIO, StringIO
+
+from django.contrib.auth.models import update_last_login
+from django.contrib.sites.models import Site
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from openpyxl import load_workbook
+
+from apps.challenge.tests.factories import QualificationFactory, SessionFactory
+from apps.common import DV_SEASON_SPRING
+from apps.common.jobs import RETRY_PARAMETER, bump_data_version
+from apps.common.models import DataVersion, ExportJob
+from apps.orga.tests.factories import OrganizationFactory
+from defivelo.tests.utils import PowerUserAuthClient
+
+from ..views import LogisticsExportView
+
+
+class LogisticsExportTest(TestCase):
+    def setUp(self):
+        self.client = PowerUserAuthClient()
+        self.session = SessionFactory(
+            day=datetime.date(2021, 3, 4),
+            orga=OrganizationFactory(address_canton="VD", name="École, du Lac"),
+            bikes_concept="Livraison\nsur place",
+        )
+        QualificationFactory.create_batch(size=2, session=self.session, n_bikes=3)
+
+    def url(self, exportformat):
+        return reverse(
+            "logistics-export",
+            kwargs={
+                "year": 2021,
+                "dv_season": DV_SEASON_SPRING,
+                "format": exportformat,
+            },
+        )
+
+    def test_csv_export_is_streamed(self):
+        response = self.client.get(self.url("csv"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        content = response.getvalue().decode("utf-8")
+        self.assertIn('"École, du Lac"', content)
+        # Same content as the Dataset export
+        view = LogisticsExportView()
+        view.request = response.wsgi_request
+        view.export_year, view.export_season = 2021, DV_SEASON_SPRING
+        self.assertEqual(content, view.get_dataset().export("csv"))
+
+    def test_xlsx_export_is_streamed(self):
+        response = self.client.get(self.url("xlsx"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        sheet = load_workbook(BytesIO(response.getvalue())).active
+        rows = list(sheet.values)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][:2], ("VD", "École, du Lac"))
+        # Two qualifications, three bikes each
+        self.assertEqual(rows[1][5], 2)
+        self.assertEqual(rows[1][7], 6)
+        self.assertTrue(sheet["A1"].font.bold)
+        self.assertTrue(sheet["J2"].alignment.wrap_text)
+
+    def test_export_job(self):
+        with tempfile.TemporaryDirectory() as exports_root, override_settings(
+            EXPORT_JOBS=True, EXPORT_JOBS_ROOT=exports_root
+        ):
+            response = self.client.get(self.url("csv"))
+            self.assertEqual(response.status_code, 202)
+            job = ExportJob.objects.get()
+            self.assertEqual(job.status, ExportJob.STATUS_PENDING)
+            self.assertEqual(job.user, self.client.user)
+            self.assertEqual(job.base_url, "http://testserver/")
+
+            call_command("run_export_jobs", "--once", stdout=StringIO())
+            job.refresh_from_db()
+            self.assertEqual(job.status, ExportJob.STATUS_DONE)
+
+            # Served from the file, as many times as needed
+            for i in range(2):
+                response = self.client.get(self.url("csv"))
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('"École, du Lac"', response.getvalue().decode("utf-8"))
+                self.assertIn(".csv", response["Content-Disposition"])
+            self.assertEqual(ExportJob.objects.count(), 1)
+
+            # Logging in doesn't change the exported data
+            with self.captureOnCommitCallbacks(execute=True):
+                update_last_login(None, self.client.user)
+            self.assertEqual(self.client.get(self.url("csv")).status_code, 200)
+
+            # Until the data changes
+            self.session.orga.name = "École des Champs"
+            self.session.orga.save()
+            # As on the commit of the change
+            DataVersion.bump()
+            response = self.client.get(self.url("csv"))
+            self.assertEqual(response.status_code, 202)
+            call_command("run_export_jobs", "--once", stdout=StringIO())
+            # The outdated file is gone
+            self.assertEqual(ExportJob.objects.get().status, ExportJob.STATUS_DONE)
+            response = self.client.get(self.url("csv"))
+            self.assertIn("École des Champs", response.getvalue().decode("utf-8"))
+
+    def test_export_job_retry(self):
+        with tempfile.TemporaryDirectory() as exports_root, override_settings(
+            EXPORT_JOBS=True, EXPORT_JOBS_ROOT=exports_root
+        ):
+            self.client.get(self.url("csv"))
+            job = ExportJob.objects.get()
+            job.status = ExportJob.STATUS_FAILED
+            job.save()
+
+            # The failure is shown until the user asks to retry
+            response = self.client.get(self.url("csv"))
+            self.assertEqual(response.status_code, 202)
+            job.refresh_from_db()
+            self.assertEqual(job.status, ExportJob.STATUS_FAILED)
+            response = self.client.get(self.url("csv"), {RETRY_PARAMETER: "1"})
+            self.assertRedirects(
+                response, self.url("csv"), fetch_redirect_response=False
+            )
+            job.refresh_from_db()
+            self.assertEqual(job.status, ExportJob.STATUS_PENDING)
+
+            # A job whose worker died is built again
+            job.status = ExportJob.STATUS_RUNNING
+            job.started_on = timezone.now() - datetime.timedelta(days=1)
+            job.save()
+            self.assertEqual(self.client.get(self.url("csv")).status_code, 202)
+            job.refresh_from_db()
+            self.assertEqual(job.status, ExportJob.STATUS_PENDING)
+
+            call_command("run_export_jobs", "--once", stdout=StringIO())
+            self.assertEqual(self.client.get(self.url("csv")).status_code, 200)
+            self.assertEqual(ExportJob.objects.count(), 1)
+
+    def test_data_version_is_bumped_once_per_transaction(self):
+        version = DataVersion.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_data_version()
+            bump_data_version()
+        self.assertEqual(DataVersion.current(), version + 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_data_version()
+        self.assertEqual(DataVersion.current(), version + 2)
+
+    def test_data_version_follows_the_exported_models(self):
+        version = DataVersion.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            Site.objects.create(domain="other.example.com", name="Other")
+        self.assertEqual(DataVersion.current(), version)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session.orga.save()
+        self.assertEqual(DataVersion.current(), version + 1)
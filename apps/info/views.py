@@ -210,4 +210,4 @@ class LogisticsView(LogisticsExport, SeasonExports):
 
 
 class LogisticsExportView(LogisticsExport, SeasonExportsMixin, ExportMixin, ListView):
-    pass
+    export_streaming = True
@@ -27,12 +27,11 @@ from django.views.generic.edit import CreateView, UpdateView
 from dal_select2.views import Select2QuerySetView
 from django_filters import CharFilter, FilterSet, MultipleChoiceFilter
 from django_filters.views import FilterView
-from rolepermissions.checkers import has_role
 from rolepermissions.mixins import HasPermissionsMixin
 
 from apps.common import DV_STATE_CHOICES_WITH_DEFAULT
 from apps.common.views import ExportMixin, PaginatorMixin
-from defivelo.roles import has_permission, user_cantons
+from defivelo.roles import has_permission, has_role, user_cantons
 from defivelo.views import MenuView
 
 from .export import OrganizationResource
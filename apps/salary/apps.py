@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class SalaryConfig(AppConfig):
+    name = "apps.salary"
+    verbose_name = "Salary"
+
+    def ready(self) -> None:  # type: ignore[override]
+        # Import signal handlers to ensure they are registered at startup
+        from . import signals  # noqa: F401
+
+        return super().ready()
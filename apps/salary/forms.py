@@ -1,6 +1,6 @@
 from django import forms
 from django.core.exceptions import ValidationError
-from django.db.models import Q
+from django.db import transaction
 from django.forms import formset_factory
 from django.urls import reverse_lazy
 from django.utils import timezone
@@ -8,15 +8,16 @@ from django.utils.safestring import mark_safe
 from django.utils.text import format_lazy
 from django.utils.translation import gettext_lazy as _
 
-from rolepermissions.checkers import has_role
-
-from apps.challenge.models.session import Session
 from apps.common.fields import CheckboxInput, NumberInput, TimeNumberInput
+from apps.common.jobs import bump_data_version
 from apps.salary.models import (
     MonthlyCantonalValidation,
     MonthlyCantonalValidationUrl,
+    MonthlyTimesheetStatus,
     Timesheet,
+    UserWorkedDay,
 )
+from defivelo.roles import has_role
 
 from . import BONUS_LEADER, HOURLY_RATE_HELPER, RATE_ACTOR
 
@@ -111,16 +112,9 @@ class TimesheetFormBase(forms.ModelForm):
 
     def clean(self):
         cleaned_data = super().clean()
-        if not (
-            Session.objects.values("day")
-            .filter(
-                Q(qualifications__actor=self.selected_user)
-                | Q(qualifications__helpers=self.selected_user)
-                | Q(qualifications__leader=self.selected_user)
-            )
-            .filter(day=cleaned_data["date"])
-            .exists()
-        ):
+        if not UserWorkedDay.objects.filter(
+            user=self.selected_user, day=cleaned_data["date"]
+        ).exists():
             raise forms.ValidationError(
                 _(
                     "Vous ne pouvez pas rentrer des heures pour le %(day)s: aucune qualif ce jour-ci."
@@ -213,8 +207,44 @@ class ControlTimesheetForm(TimesheetFormBase):
         return cleaned_data
 
 
-ControlTimesheetFormSet = formset_factory(ControlTimesheetForm, max_num=0, extra=0)
-TimesheetFormSet = formset_factory(TimesheetForm, max_num=0, extra=0)
+class BaseTimesheetFormSet(forms.BaseFormSet):
+    def save(self):
+        """
+        Save the timesheets of all forms with bulk upserts on (user, date), one per
+        set of cleaned fields, as `TimesheetFormBase.save` would one by one
+        """
+        timesheets_by_fields = {}
+        for form in self.forms:
+            if form.errors:
+                raise ValueError(
+                    "The timesheets could not be saved because the data didn't"
+                    " validate."
+                )
+            timesheets_by_fields.setdefault(tuple(form.cleaned_data), []).append(
+                Timesheet(user=form.selected_user, **form.cleaned_data)
+            )
+        with transaction.atomic():
+            for fields, timesheets in timesheets_by_fields.items():
+                Timesheet.objects.bulk_create(
+                    timesheets,
+                    update_conflicts=True,
+                    unique_fields=["user", "date"],
+                    update_fields=[field for field in fields if field != "date"],
+                )
+            # Written in bulk, without signals
+            MonthlyTimesheetStatus.update_for(
+                {form.selected_user.pk for form in self.forms},
+                {form.cleaned_data["date"] for form in self.forms},
+            )
+            bump_data_version()
+
+
+ControlTimesheetFormSet = formset_factory(
+    ControlTimesheetForm, formset=BaseTimesheetFormSet, max_num=0, extra=0
+)
+TimesheetFormSet = formset_factory(
+    TimesheetForm, formset=BaseTimesheetFormSet, max_num=0, extra=0
+)
 
 
 class MonthlyCantonalValidationForm(forms.ModelForm):
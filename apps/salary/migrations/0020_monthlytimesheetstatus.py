@@ -0,0 +1,79 @@
+# Generated by Django 4.2.6 on 2026-10-18 22:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_statuses(apps, schema_editor):
+    Qualification = apps.get_model("challenge", "Qualification")
+    Timesheet = apps.get_model("salary", "Timesheet")
+    MonthlyTimesheetStatus = apps.get_model("salary", "MonthlyTimesheetStatus")
+
+    worked = set()
+    for day, leader_id, actor_id, helper_id in Qualification.objects.values_list(
+        "session__day", "leader_id", "actor_id", "helpers"
+    ):
+        worked.update(
+            (user_id, day) for user_id in (leader_id, actor_id, helper_id) if user_id
+        )
+    timesheets = {
+        (user_id, date): validated_at
+        for user_id, date, validated_at in Timesheet.objects.filter(
+            date__isnull=False
+        ).values_list("user_id", "date", "validated_at")
+    }
+
+    # TimesheetStatus: TIMESHEET_MISSING = 1, NOT_VALIDATED = 2, VALIDATED = 4
+    statuses = {}
+    for user_id, day in worked:
+        if not day:
+            continue
+        status = statuses.setdefault((user_id, day.year, day.month), [0, 0])
+        status[0] += 1
+        if (user_id, day) not in timesheets:
+            status[1] |= 1
+    for (user_id, date), validated_at in timesheets.items():
+        statuses.setdefault((user_id, date.year, date.month), [0, 0])[1] |= (
+            4 if validated_at else 2
+        )
+    MonthlyTimesheetStatus.objects.bulk_create(
+        [
+            MonthlyTimesheetStatus(
+                user_id=user_id,
+                year=year,
+                month=month,
+                worked_days=worked_days,
+                flags=flags,
+            )
+            for (user_id, year, month), (worked_days, flags) in statuses.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('challenge', '0090_helpersessionschedule'),
+        ('salary', '0019_alter_timesheet_leader_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyTimesheetStatus',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('worked_days', models.PositiveSmallIntegerField(default=0)),
+                ('flags', models.PositiveSmallIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_timesheet_statuses', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'year', 'month')},
+            },
+        ),
+        migrations.RunPython(populate_statuses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 4.2.6 on 2026-10-18 22:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_worked_days(apps, schema_editor):
+    Qualification = apps.get_model("challenge", "Qualification")
+    UserWorkedDay = apps.get_model("salary", "UserWorkedDay")
+
+    worked_days = {}
+    for (
+        qualification_id,
+        day,
+        canton,
+        orga_id,
+        leader_id,
+        actor_id,
+        helper_id,
+    ) in Qualification.objects.values_list(
+        "pk",
+        "session__day",
+        "session__orga__address_ptr__address_canton",
+        "session__orga_id",
+        "leader_id",
+        "actor_id",
+        "helpers",
+    ):
+        if not day:
+            continue
+        for user_id, roles in [
+            (leader_id, ["helper", "leader"]),
+            (actor_id, ["actor"]),
+            (helper_id, ["helper"]),
+        ]:
+            if not user_id:
+                continue
+            worked_day = worked_days.setdefault(
+                (user_id, day, (canton or "").upper()),
+                {"orgas": set(), "helper": set(), "leader": set(), "actor": set()},
+            )
+            worked_day["orgas"].add(orga_id)
+            for role in roles:
+                worked_day[role].add(qualification_id)
+    UserWorkedDay.objects.bulk_create(
+        [
+            UserWorkedDay(
+                user_id=user_id,
+                day=day,
+                canton=canton,
+                orga_count=len(worked_day["orgas"]),
+                helper_count=len(worked_day["helper"]),
+                leader_count=len(worked_day["leader"]),
+                actor_count=len(worked_day["actor"]),
+            )
+            for (user_id, day, canton), worked_day in worked_days.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('salary', '0020_monthlytimesheetstatus'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserWorkedDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('canton', models.CharField(blank=True, max_length=2)),
+                ('orga_count', models.PositiveSmallIntegerField(default=0)),
+                ('helper_count', models.PositiveSmallIntegerField(default=0)),
+                ('leader_count', models.PositiveSmallIntegerField(default=0)),
+                ('actor_count', models.PositiveSmallIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='worked_days', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'day', 'canton')},
+            },
+        ),
+        migrations.RunPython(populate_worked_days, migrations.RunPython.noop),
+    ]
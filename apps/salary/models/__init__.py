@@ -1,4 +1,18 @@
-from .timesheets import Timesheet
+from .timesheets import (
+    MonthlyTimesheetStatus,
+    Timesheet,
+    TimesheetQuerySet,
+    TimesheetStatus,
+    UserWorkedDay,
+)
 from .validations import MonthlyCantonalValidation, MonthlyCantonalValidationUrl
 
-__all__ = ["MonthlyCantonalValidation", "MonthlyCantonalValidationUrl", "Timesheet"]
+__all__ = [
+    "MonthlyCantonalValidation",
+    "MonthlyCantonalValidationUrl",
+    "MonthlyTimesheetStatus",
+    "Timesheet",
+    "TimesheetQuerySet",
+    "TimesheetStatus",
+    "UserWorkedDay",
+]
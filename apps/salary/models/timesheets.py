@@ -1,10 +1,77 @@
+import enum
+
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, FloatField, IntegerField, Q, Sum
+from django.db.models.functions import Cast, ExtractMonth
 from django.utils.translation import gettext_lazy as _
 
 from .. import BONUS_LEADER, HOURLY_RATE_HELPER, RATE_ACTOR
 
 
+class TimesheetStatus(enum.IntFlag):
+    TIMESHEET_MISSING = 1
+    TIMESHEET_NOT_VALIDATED = 2
+    TIMESHEET_VALIDATED = 4
+
+    def __str__(self):
+        return str(self.value)
+
+
+class TimesheetQuerySet(models.QuerySet):
+    @staticmethod
+    def included():
+        """
+        Convert the ignore Bool (0 if not ignored, 1 if ignored) into an included
+        Bool (1 if taken into account, 0 if ignored)
+        """
+        return 1 - Cast(F("ignore"), IntegerField())
+
+    @classmethod
+    def amount(cls):
+        """
+        The amount of a timesheet in CHF, as `Timesheet.get_total_amount()`, to
+        be used in annotations or aggregations
+        """
+        return Cast(
+            (
+                (F("time_helper") + F("overtime") + F("traveltime"))
+                * HOURLY_RATE_HELPER
+                + F("actor_count") * RATE_ACTOR
+                + F("leader_count") * BONUS_LEADER
+            )
+            * cls.included(),
+            FloatField(),
+        )
+
+    def with_amount(self):
+        return self.annotate(amount=self.amount())
+
+    def total_amount(self):
+        return self.aggregate(amount=Sum(self.amount()))["amount"] or 0
+
+    def amounts_by(self, *fields, **expressions):
+        """
+        The amounts summed in the database, grouped by the given fields or
+        expressions, as `{"amount": …, field: …}` dicts
+        """
+        return (
+            self.order_by()
+            .values(*fields, **expressions)
+            .annotate(amount=Sum(self.amount()))
+        )
+
+    def amounts_by_month(self):
+        """
+        The amounts of the timesheets as a list of 12 elements, 0 being January
+        and 11 being December
+        """
+        total_by_month = [0] * 12
+        for amount in self.amounts_by(month=ExtractMonth("date")):
+            total_by_month[amount["month"] - 1] = amount["amount"]
+        return total_by_month
+
+
 class Timesheet(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -32,6 +99,8 @@ class Timesheet(models.Model):
     )
     ignore = models.BooleanField(_("Ignorer"), default=False)
 
+    objects = TimesheetQuerySet.as_manager()
+
     class Meta:
         unique_together = (
             (
@@ -65,3 +134,231 @@ class Timesheet(models.Model):
             + self.get_total_amount_helper()
             + self.get_total_amount_leader()
         )
+
+
+def _months_filter(field, months):
+    criteria = Q(pk__in=[])
+    for year, month in months:
+        criteria |= Q(**{f"{field}__year": year, f"{field}__month": month})
+    return criteria
+
+
+class MonthlyTimesheetStatus(models.Model):
+    """
+    The `TimesheetStatus` flags of a user for a month, kept up to date by the
+    signals on the timesheets, qualifications and sessions
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="monthly_timesheet_statuses",
+        on_delete=models.CASCADE,
+    )
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    # Days with sessions, whether they have a timesheet or not
+    worked_days = models.PositiveSmallIntegerField(default=0)
+    flags = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = (
+            (
+                "user",
+                "year",
+                "month",
+            ),
+        )
+
+    @classmethod
+    def compute(cls, user_ids, months):
+        """
+        Return a `{(user_id, year, month): [worked_days, flags]}` dict, for the
+        given users and (year, month) pairs
+        """
+        # The challenge models depend on the salary ones
+        from apps.challenge.models import Qualification
+
+        qualifications = Qualification.objects.filter(
+            _months_filter("session__day", months)
+        )
+        worked = set()
+        for day, leader_id, actor_id in qualifications.values_list(
+            "session__day", "leader_id", "actor_id"
+        ):
+            worked.update(
+                (user_id, day)
+                for user_id in (leader_id, actor_id)
+                if user_id in user_ids
+            )
+        worked.update(
+            (user_id, day)
+            for day, user_id in Qualification.helpers.through.objects.filter(
+                qualification__in=qualifications, user_id__in=user_ids
+            ).values_list("qualification__session__day", "user_id")
+        )
+        timesheets = {
+            (user_id, date): validated_at
+            for user_id, date, validated_at in Timesheet.objects.filter(
+                _months_filter("date", months), user_id__in=user_ids
+            ).values_list("user_id", "date", "validated_at")
+        }
+
+        statuses = {}
+        for user_id, day in worked:
+            status = statuses.setdefault((user_id, day.year, day.month), [0, 0])
+            status[0] += 1
+            if (user_id, day) not in timesheets:
+                status[1] |= TimesheetStatus.TIMESHEET_MISSING
+        for (user_id, date), validated_at in timesheets.items():
+            statuses.setdefault((user_id, date.year, date.month), [0, 0])[1] |= (
+                TimesheetStatus.TIMESHEET_VALIDATED
+                if validated_at
+                else TimesheetStatus.TIMESHEET_NOT_VALIDATED
+            )
+        return statuses
+
+    @classmethod
+    def update_for(cls, user_ids, dates):
+        """
+        Recompute the statuses of the given users, for the months of `dates`
+        """
+        user_ids = {user_id for user_id in user_ids if user_id}
+        months = {(date.year, date.month) for date in dates if date}
+        if not user_ids or not months:
+            return
+        statuses = cls.compute(user_ids, months)
+        previous_statuses = Q(pk__in=[])
+        for year, month in months:
+            previous_statuses |= Q(year=year, month=month)
+        with transaction.atomic():
+            cls.objects.filter(previous_statuses, user_id__in=user_ids).delete()
+            cls.objects.bulk_create(
+                [
+                    cls(
+                        user_id=user_id,
+                        year=year,
+                        month=month,
+                        worked_days=worked_days,
+                        flags=flags,
+                    )
+                    for (user_id, year, month), (worked_days, flags) in statuses.items()
+                ]
+            )
+
+
+class UserWorkedDay(models.Model):
+    """
+    What a user did on a day in a canton's sessions, as counts of qualifications
+    by role, kept up to date by the signals on the qualifications, sessions and
+    organizations
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="worked_days",
+        on_delete=models.CASCADE,
+    )
+    day = models.DateField()
+    # Upper-cased canton of the sessions' organizations
+    canton = models.CharField(max_length=2, blank=True)
+    orga_count = models.PositiveSmallIntegerField(default=0)
+    # As helper or leader
+    helper_count = models.PositiveSmallIntegerField(default=0)
+    leader_count = models.PositiveSmallIntegerField(default=0)
+    actor_count = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = (
+            (
+                "user",
+                "day",
+                "canton",
+            ),
+        )
+
+    @classmethod
+    def compute(cls, user_ids, days):
+        """
+        Return a `{(user_id, day, canton): {"orgas": …, "helper": …, "leader": …,
+        "actor": …}}` dict of sets of organizations and qualifications, for the
+        given users and days
+        """
+        # The challenge models depend on the salary ones
+        from apps.challenge.models import Qualification
+
+        worked_days = {}
+
+        def add(user_id, day, canton, orga_id, qualification_id, *roles):
+            worked_day = worked_days.setdefault(
+                (user_id, day, (canton or "").upper()),
+                {"orgas": set(), "helper": set(), "leader": set(), "actor": set()},
+            )
+            worked_day["orgas"].add(orga_id)
+            for role in roles:
+                worked_day[role].add(qualification_id)
+
+        qualifications = Qualification.objects.filter(session__day__in=days)
+        for (
+            qualification_id,
+            day,
+            canton,
+            orga_id,
+            leader_id,
+            actor_id,
+        ) in qualifications.values_list(
+            "pk",
+            "session__day",
+            "session__orga__address_canton",
+            "session__orga_id",
+            "leader_id",
+            "actor_id",
+        ):
+            session = (day, canton, orga_id, qualification_id)
+            if leader_id in user_ids:
+                add(leader_id, *session, "helper", "leader")
+            if actor_id in user_ids:
+                add(actor_id, *session, "actor")
+        for (
+            qualification_id,
+            day,
+            canton,
+            orga_id,
+            user_id,
+        ) in Qualification.helpers.through.objects.filter(
+            qualification__in=qualifications, user_id__in=user_ids
+        ).values_list(
+            "qualification_id",
+            "qualification__session__day",
+            "qualification__session__orga__address_canton",
+            "qualification__session__orga_id",
+            "user_id",
+        ):
+            add(user_id, day, canton, orga_id, qualification_id, "helper")
+        return worked_days
+
+    @classmethod
+    def update_for(cls, user_ids, days):
+        """
+        Recompute the worked days of the given users, for the given days
+        """
+        user_ids = {user_id for user_id in user_ids if user_id}
+        days = {day for day in days if day}
+        if not user_ids or not days:
+            return
+        worked_days = cls.compute(user_ids, days)
+        with transaction.atomic():
+            cls.objects.filter(user_id__in=user_ids, day__in=days).delete()
+            cls.objects.bulk_create(
+                [
+                    cls(
+                        user_id=user_id,
+                        day=day,
+                        canton=canton,
+                        orga_count=len(worked_day["orgas"]),
+                        helper_count=len(worked_day["helper"]),
+                        leader_count=len(worked_day["leader"]),
+                        actor_count=len(worked_day["actor"]),
+                    )
+                    for (user_id, day, canton), worked_day in worked_days.items()
+                ]
+            )
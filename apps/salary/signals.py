@@ -0,0 +1,132 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from apps.challenge.models import Qualification, Session
+from apps.orga.models import Organization
+
+from .models import MonthlyTimesheetStatus, Timesheet, UserWorkedDay
+
+
+@receiver(pre_save, sender=Timesheet)
+def timesheet_previous_state(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._previous_state = (
+            Timesheet.objects.filter(pk=instance.pk)
+            .values_list("user_id", "date")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Timesheet)
+@receiver(post_delete, sender=Timesheet)
+def timesheet_statuses(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    user_ids, dates = {instance.user_id}, {instance.date}
+    previous_state = getattr(instance, "_previous_state", None)
+    if previous_state:
+        user_ids.add(previous_state[0])
+        dates.add(previous_state[1])
+    MonthlyTimesheetStatus.update_for(user_ids, dates)
+
+
+def _session_days(*session_ids):
+    return Session.objects.filter(pk__in=session_ids).values_list("day", flat=True)
+
+
+def _sessions_users(sessions):
+    qualifications = Qualification.objects.filter(session__in=sessions)
+    user_ids = set(
+        Qualification.helpers.through.objects.filter(
+            qualification__in=qualifications
+        ).values_list("user_id", flat=True)
+    )
+    for leader_id, actor_id in qualifications.values_list("leader_id", "actor_id"):
+        user_ids.update([leader_id, actor_id])
+    return user_ids
+
+
+def _update_worked_days(user_ids, days):
+    """
+    Recompute the worked days, and the timesheet statuses of their months
+    """
+    days = set(days)
+    UserWorkedDay.update_for(user_ids, days)
+    MonthlyTimesheetStatus.update_for(user_ids, days)
+
+
+# The previous states of the qualifications, sessions and organizations are kept
+# by the pre_save and pre_delete handlers of the challenge signals
+
+
+@receiver(post_save, sender=Qualification)
+def qualification_worked_days(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous_state = getattr(instance, "_previous_state", None)
+    state = (instance.session_id, instance.leader_id, instance.actor_id)
+    if previous_state == state:
+        return
+    previous_session_id, *previous_user_ids = previous_state or state
+    _update_worked_days(
+        {instance.leader_id, instance.actor_id, *previous_user_ids}
+        | set(instance.helpers.values_list("id", flat=True)),
+        _session_days(instance.session_id, previous_session_id),
+    )
+
+
+@receiver(post_delete, sender=Qualification)
+def qualification_deleted_worked_days(sender, instance, **kwargs):
+    _update_worked_days(
+        getattr(instance, "_previous_user_ids", set()),
+        _session_days(instance.session_id),
+    )
+
+
+@receiver(m2m_changed, sender=Qualification.helpers.through)
+def qualification_helpers_worked_days(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    if action == "post_clear":
+        pk_set = getattr(instance, "_cleared_pks", set())
+    if not pk_set:
+        return
+    if not reverse:
+        _update_worked_days(pk_set, _session_days(instance.session_id))
+    else:
+        _update_worked_days(
+            {instance.pk},
+            Session.objects.filter(qualifications__in=pk_set).values_list(
+                "day", flat=True
+            ),
+        )
+
+
+@receiver(post_save, sender=Session)
+def session_worked_days(sender, instance, created, raw=False, **kwargs):
+    previous_position = getattr(instance, "_previous_position", None)
+    if (
+        raw
+        or created
+        or not previous_position
+        or previous_position[:2] == (instance.day, instance.orga_id)
+    ):
+        return
+    _update_worked_days(
+        _sessions_users([instance.pk]), {previous_position[0], instance.day}
+    )
+
+
+@receiver(post_save, sender=Organization)
+def organization_worked_days(sender, instance, created, raw=False, **kwargs):
+    previous_state = getattr(instance, "_previous_state", None)
+    if raw or created or not previous_state:
+        return
+    if previous_state[0] == instance.address_canton:
+        return
+    sessions = instance.sessions.all()
+    UserWorkedDay.update_for(
+        _sessions_users(sessions), sessions.values_list("day", flat=True)
+    )
@@ -10,7 +10,6 @@ from apps.orga.tests.factories import OrganizationFactory
 from apps.user.tests.factories import UserFactory
 from defivelo.tests.utils import AuthClient, PowerUserAuthClient, StateManagerAuthClient
 
-from .. import timesheets_overview
 from ..models import MonthlyCantonalValidation, MonthlyCantonalValidationUrl
 from .factories import MonthlyCantonalValidationFactory, TimesheetFactory
 
@@ -149,8 +148,6 @@ class StateManagerUserTest(TestCase):
                     validated_at=today.replace(day=13),
                     validated_by=actor,
                 )
-                # Clear the cache
-                timesheets_overview.timesheets_validation_status.all_users = {}
                 # So post with all ticks ticked
                 initial["timesheets_checked"] = True
                 response = self.client.post(url, initial)
@@ -1,5 +1,6 @@
 import datetime
 
+from django.contrib.auth import get_user_model
 from django.core import mail
 from django.urls import reverse
 
@@ -10,6 +11,7 @@ from apps.user.tests.factories import UserFactory
 from defivelo.roles import user_cantons
 from defivelo.tests.utils import AuthClient, StateManagerAuthClient
 
+from .. import timesheets_overview
 from .factories import TimesheetFactory, ValidatedTimesheetFactory
 
 
@@ -116,3 +118,24 @@ def test_helper_cant_send_reminder(db):
         reverse("salary:send-timesheets-reminder", kwargs={"year": 2019, "month": 2})
     )
     assert response.status_code == 403
+
+
+def test_missing_timesheets_by_canton(db):
+    vd_helpers = UserFactory.create_batch(2, profile__affiliation_canton="VD")
+    ge_helper = UserFactory(profile__affiliation_canton="GE")
+    date = datetime.date(2019, 2, 11)
+    session = SessionFactory(day=date)
+    for helper in vd_helpers + [ge_helper]:
+        QualificationFactory(actor=helper, session=session)
+    TimesheetFactory(user=vd_helpers[0], date=date)
+    QualificationFactory(
+        actor=ge_helper, session=SessionFactory(day=datetime.date(2019, 3, 11))
+    )
+    users = get_user_model().objects.all()
+
+    missing = timesheets_overview.get_missing_timesheets_by_canton(2019, users)
+
+    assert missing == [{}, {"VD": 1, "GE": 1}, {"GE": 1}] + [{}] * 9
+    assert set(
+        timesheets_overview.get_users_with_missing_timesheets(2019, 2, users)
+    ) == {vd_helpers[1], ge_helper}
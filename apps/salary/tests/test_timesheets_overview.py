@@ -2,6 +2,7 @@ import datetime
 
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
 
 from apps.challenge.tests.factories import (
     QualificationFactory,
@@ -9,7 +10,14 @@ from apps.challenge.tests.factories import (
     SessionFactory,
 )
 from apps.orga.tests.factories import OrganizationFactory
-from apps.salary import HOURLY_RATE_HELPER, timesheets_overview
+from apps.salary import (
+    BONUS_LEADER,
+    HOURLY_RATE_HELPER,
+    RATE_ACTOR,
+    timesheets_overview,
+)
+from apps.salary.models import MonthlyTimesheetStatus, Timesheet, TimesheetStatus
+from apps.user.models import UserProfile
 from apps.user.tests.factories import UserFactory
 from defivelo.roles import user_cantons
 from defivelo.tests.utils import (
@@ -354,8 +362,9 @@ def test_state_manager_sees_reminder_button_for_month_with_missing_timesheets(db
 
     response = client.get(reverse("salary:timesheets-overview", kwargs={"year": 2019}))
     assert response.status_code == 200
-    show_jan, show_feb, show_march, *_ = response.context["show_reminder_button_months"]
-    assert not show_jan and not show_feb and show_march
+    jan, feb, march, *_ = response.context["missing_timesheets_by_month"]
+    assert jan == (0, {}) and feb == (0, {})
+    assert march == (1, {managed_cantons[0]: 1})
     assert "Envoyer un rappel aux collabora" in response.content.decode()
 
 
@@ -402,3 +411,167 @@ def test_state_manager_sees_orphanage_fix_button_for_month_with_orphaned_timeshe
     assert ts in response.context["orphaned_timesheets"][4]
 
     assert "1 entrée orpheline" in response.content.decode()
+
+
+def test_yearly_timesheets_validation_status(db):
+    vd_helper = UserFactory(profile__affiliation_canton="VD")
+    ge_helper = UserFactory(profile__affiliation_canton="GE")
+    april, may = datetime.date(2019, 4, 11), datetime.date(2019, 5, 11)
+    for user in [vd_helper, ge_helper]:
+        orga = OrganizationFactory(address_canton=user.profile.affiliation_canton)
+        QualificationFactory(actor=user, session=SessionFactory(day=april, orga=orga))
+        QualificationFactory(actor=user, session=SessionFactory(day=may, orga=orga))
+    # VD: April validated, May not validated; GE: April validated, May missing
+    ValidatedTimesheetFactory(date=april, user=vd_helper)
+    TimesheetFactory(date=may, user=vd_helper)
+    ValidatedTimesheetFactory(date=april, user=ge_helper)
+
+    statuses = timesheets_overview.timesheets_validation_status(
+        2019, cantons=["VD", "GE", "NE"]
+    )
+
+    assert statuses[4] == {"VD": True, "GE": True, "NE": None}
+    assert statuses[5] == {"VD": False, "GE": False, "NE": None}
+    assert statuses[6] == {"VD": None, "GE": None, "NE": None}
+    assert (
+        timesheets_overview.timesheets_validation_status(
+            2019, month=5, cantons=["VD", "GE", "NE"]
+        )
+        == statuses[5]
+    )
+
+
+def test_monthly_timesheet_statuses_follow_the_changes(db):
+    user = UserFactory()
+    april, may = datetime.date(2019, 4, 11), datetime.date(2019, 5, 11)
+    session = SessionFactory(day=april)
+
+    def statuses():
+        return set(
+            MonthlyTimesheetStatus.objects.filter(user=user).values_list(
+                "month", "worked_days", "flags"
+            )
+        )
+
+    qualification = QualificationFactory(session=session)
+    qualification.helpers.add(user)
+    assert statuses() == {(4, 1, TimesheetStatus.TIMESHEET_MISSING)}
+
+    timesheet = TimesheetFactory(date=april, user=user)
+    assert statuses() == {(4, 1, TimesheetStatus.TIMESHEET_NOT_VALIDATED)}
+
+    timesheet.validated_at = timezone.now()
+    timesheet.save()
+    assert statuses() == {(4, 1, TimesheetStatus.TIMESHEET_VALIDATED)}
+
+    # The session moves, the timesheet is orphaned
+    session.day = may
+    session.save()
+    assert statuses() == {
+        (4, 0, TimesheetStatus.TIMESHEET_VALIDATED),
+        (5, 1, TimesheetStatus.TIMESHEET_MISSING),
+    }
+
+    qualification.helpers.remove(user)
+    timesheet.delete()
+    assert statuses() == set()
+
+
+def test_yearly_matrix_projects_cantons(db, django_assert_max_num_queries):
+    user = UserFactory()
+    other_user = UserFactory()
+    vd_date = datetime.date(2019, 4, 11)
+    ge_date = datetime.date(2019, 5, 11)
+    QualificationFactory(
+        actor=user,
+        session=SessionFactory(day=vd_date, orga__address_canton="VD"),
+    )
+    QualificationFactory(
+        actor=other_user,
+        session=SessionFactory(day=ge_date, orga__address_canton="GE"),
+    )
+    TimesheetFactory(date=vd_date, user=user, overtime=5)
+    TimesheetFactory(date=ge_date, user=other_user, overtime=3)
+    # A timesheet without session, counted in the amounts of all cantons
+    TimesheetFactory(date=ge_date, user=user, overtime=1)
+    users = get_user_model().objects.filter(pk__in=[user.pk, other_user.pk])
+
+    matrix = timesheets_overview.YearlyTimesheetsMatrix(2019, users)
+
+    assert matrix.status_matrix() == timesheets_overview.get_timesheets_status_matrix(
+        2019, users
+    )
+    for canton in ["VD", "GE", "NE"]:
+        canton_users = UserProfile.get_users_that_worked_in_cantons([canton], year=2019)
+        assert set(matrix.canton_users(canton)) == set(canton_users)
+        assert matrix.status_matrix(
+            canton
+        ) == timesheets_overview.get_timesheets_status_matrix(
+            2019, canton_users, cantons=[canton]
+        )
+        # Only the amounts are queried
+        with django_assert_max_num_queries(1):
+            amounts = matrix.amounts_by_month(canton)
+        assert amounts == timesheets_overview.get_timesheets_amount_by_month(
+            2019, canton_users, cantons=[canton]
+        )
+    assert (
+        matrix.amounts_by_month()
+        == [0] * 3 + [5 * HOURLY_RATE_HELPER] + [4 * HOURLY_RATE_HELPER] + [0] * 7
+    )
+
+
+def test_timesheets_amounts_are_summed_in_the_database(db):
+    user = UserFactory()
+    timesheets = [
+        TimesheetFactory(
+            date=datetime.date(2019, 4, 11),
+            user=user,
+            time_helper=2,
+            overtime=0.5,
+            traveltime=1,
+            actor_count=1,
+            leader_count=1,
+        ),
+        TimesheetFactory(date=datetime.date(2019, 4, 12), user=user, overtime=3),
+        TimesheetFactory(
+            date=datetime.date(2019, 5, 11), user=user, overtime=3, ignore=True
+        ),
+    ]
+    queryset = Timesheet.objects.filter(user=user)
+
+    amounts = {t.pk: t.amount for t in queryset.with_amount()}
+    assert amounts == {t.pk: t.get_total_amount() for t in timesheets}
+    assert queryset.total_amount() == sum(t.get_total_amount() for t in timesheets)
+    assert (
+        queryset.amounts_by_month()
+        == [0] * 3 + [6.5 * HOURLY_RATE_HELPER + RATE_ACTOR + BONUS_LEADER] + [0] * 8
+    )
+    assert list(queryset.amounts_by("user")) == [
+        {"user": user.pk, "amount": queryset.total_amount()}
+    ]
+
+
+def test_delete_orphaned_timesheets(db):
+    vd_user = UserFactory(profile__affiliation_canton="VD")
+    ge_user = UserFactory(profile__affiliation_canton="GE")
+    date = datetime.date(2019, 4, 11)
+    QualificationFactory(actor=vd_user, session=SessionFactory(day=date))
+    kept = TimesheetFactory(date=date, user=vd_user)
+    orphaned = [
+        TimesheetFactory(date=datetime.date(2019, 4, 12), user=vd_user),
+        TimesheetFactory(date=datetime.date(2019, 4, 13), user=vd_user),
+    ]
+    ge_orphaned = TimesheetFactory(date=date, user=ge_user)
+    users = get_user_model().objects.all()
+
+    assert set(
+        timesheets_overview.get_orphaned_timesheets(2019, users, month=4)
+    ) == set(orphaned) | {ge_orphaned}
+
+    deleted = timesheets_overview.delete_orphaned_timesheets(
+        2019, users, month=4, cantons=["VD"], batch_size=1
+    )
+
+    assert deleted == 2
+    assert set(Timesheet.objects.all()) == {kept, ge_orphaned}
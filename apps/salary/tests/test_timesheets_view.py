@@ -8,12 +8,18 @@ from apps.challenge.tests.factories import (
     SessionFactory,
 )
 from apps.orga.tests.factories import OrganizationFactory
-from apps.salary.models import Timesheet
+from apps.salary.models import (
+    MonthlyTimesheetStatus,
+    Timesheet,
+    TimesheetStatus,
+    UserWorkedDay,
+)
 from apps.user.tests.factories import UserFactory
 from defivelo.roles import user_cantons
 from defivelo.tests.utils import (
     AuthClient,
     CollaboratorAuthClient,
+    PowerUserAuthClient,
     StateManagerAuthClient,
 )
 
@@ -338,6 +344,63 @@ def test_state_manager_can_validate_timesheet(db):
     assert Timesheet.objects.count() == 1 and Timesheet.objects.first().validated_at
 
 
+def test_power_user_saves_the_month_at_once(db):
+    client = PowerUserAuthClient()
+    actor = UserFactory(profile__affiliation_canton="VD")
+    orga = OrganizationFactory(address_canton="VD")
+    for day in [11, 12]:
+        QualificationFactory(
+            actor=actor,
+            session=SessionFactory(day=datetime.date(2019, 4, day), orga=orga),
+        )
+    Timesheet.objects.create(
+        user=actor, date=datetime.date(2019, 4, 11), time_helper=1, comments="Old"
+    )
+    url = reverse(
+        "salary:user-timesheets",
+        kwargs={"year": 2019, "month": 4, "pk": actor.pk},
+    )
+
+    def post(validated):
+        datas = {
+            "form-TOTAL_FORMS": "2",
+            "form-INITIAL_FORMS": "2",
+            "form-MIN_NUM_FORMS": "0",
+            "form-MAX_NUM_FORMS": "0",
+        }
+        for i, day in enumerate(["2019-04-11", "2019-04-12"]):
+            datas.update(
+                {
+                    f"form-{i}-date": day,
+                    f"form-{i}-time_helper": "4.5",
+                    f"form-{i}-actor_count": "1",
+                    f"form-{i}-leader_count": "0",
+                    f"form-{i}-overtime": "0",
+                    f"form-{i}-traveltime": "0",
+                    f"form-{i}-comments": "New",
+                    f"form-{i}-validated": validated,
+                }
+            )
+        client.post(url, datas)
+
+    def status():
+        return MonthlyTimesheetStatus.objects.get(user=actor, year=2019, month=4)
+
+    post(True)
+    timesheets = Timesheet.objects.order_by("date")
+    assert [(t.comments, t.validated_by) for t in timesheets] == [
+        ("New", client.user),
+        ("New", client.user),
+    ]
+    assert all(t.validated_at for t in timesheets)
+    assert status().flags == TimesheetStatus.TIMESHEET_VALIDATED
+
+    post(False)
+    assert not Timesheet.objects.filter(validated_at__isnull=False).exists()
+    assert not Timesheet.objects.filter(validated_by__isnull=False).exists()
+    assert status().flags == TimesheetStatus.TIMESHEET_NOT_VALIDATED
+
+
 def test_state_manager_can_set_timesheet_to_ignore(db):
     client = StateManagerAuthClient()
     managed_cantons = user_cantons(client.user)
@@ -439,3 +502,45 @@ def test_collaborator_cannot_timesheet_if_he_has_not_work(db):
         datas,
     )
     assert Timesheet.objects.count() == 0
+
+
+def test_worked_days_follow_the_qualifications(db):
+    user = UserFactory()
+    date = datetime.date(2019, 4, 11)
+    orga = OrganizationFactory(address_canton="vd")
+    session = SessionFactory(day=date, orga=orga)
+
+    def worked_days():
+        return list(
+            UserWorkedDay.objects.filter(user=user).values_list(
+                "day",
+                "canton",
+                "orga_count",
+                "helper_count",
+                "leader_count",
+                "actor_count",
+            )
+        )
+
+    QualificationFactory(session=session, actor=user)
+    qualification = QualificationFactory(session=session)
+    qualification.helpers.add(user)
+    QualificationFactory(session=SessionFactory(day=date, orga=orga)).helpers.add(user)
+    assert worked_days() == [(date, "VD", 1, 2, 0, 1)]
+
+    orga.address_canton = "GE"
+    orga.save()
+    assert worked_days() == [(date, "GE", 1, 2, 0, 1)]
+
+    session.day = datetime.date(2019, 4, 12)
+    session.save()
+    assert sorted(worked_days()) == [
+        (date, "GE", 1, 1, 0, 0),
+        (session.day, "GE", 1, 1, 0, 1),
+    ]
+
+    qualification.delete()
+    assert sorted(worked_days()) == [
+        (date, "GE", 1, 1, 0, 0),
+        (session.day, "GE", 1, 0, 0, 1),
+    ]
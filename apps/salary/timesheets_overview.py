@@ -1,27 +1,22 @@
-import enum
-
 from django.contrib.auth import get_user_model
-from django.db.models import F, FloatField, IntegerField, Q, Sum
+from django.db import transaction
+from django.db.models import Count, Exists, F, FloatField, OuterRef, Q, Sum
 from django.db.models.functions import Cast, Upper
 from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
 
-from rolepermissions.checkers import has_permission
-
+from apps.challenge.models.availability import HelperSessionSchedule
+from apps.challenge.models.qualification import Qualification
 from apps.challenge.models.session import Session
 from apps.common import DV_STATES
-from apps.salary.models import Timesheet
+from apps.salary.models import (
+    MonthlyTimesheetStatus,
+    Timesheet,
+    TimesheetQuerySet,
+    TimesheetStatus,
+)
 from apps.user.models import UserProfile
-from defivelo.roles import user_cantons
-
-
-class TimesheetStatus(enum.IntFlag):
-    TIMESHEET_MISSING = 1
-    TIMESHEET_NOT_VALIDATED = 2
-    TIMESHEET_VALIDATED = 4
-
-    def __str__(self):
-        return str(self.value)
-
+from defivelo.roles import has_permission, user_cantons
 
 User = get_user_model()
 
@@ -35,114 +30,94 @@ def timesheets_validation_status(year, month=None, cantons=DV_STATES):
     - False for "missing timesheet validations"
     - None for "No sessions in that year-month, for that canton
     """
-    months = range(1, 13)
-    if month:
-        months = [month]
-
-    user_cache_key = f"{'-'.join(cantons)}-{year}"
-    if user_cache_key not in timesheets_validation_status.all_users:
-        timesheets_validation_status.all_users[user_cache_key] = (
-            UserProfile.get_users_that_worked_in_cantons(
-                cantons, year=year
-            ).prefetch_related("profile")
-        )
-
-    users = timesheets_validation_status.all_users[user_cache_key]
-
-    statuses = {}
-
-    for month_in_loop in months:
-        sessions = Session.objects.filter(
-            day__year=year, day__month=month_in_loop
-        ).prefetch_related(
-            "qualifications",
-            "qualifications__leader",
-            "qualifications__helpers",
-            "qualifications__actor",
-        )
-        timesheets = get_timesheets(year=year, month=month_in_loop, users=users)
-
-        sessions_by_user = regroup_sessions_by_user(sessions, users)
-        timesheets_by_user = regroup_timesheets_by_user(timesheets)
-        timesheets_statuses_by_canton = {
-            canton: [
-                get_timesheets_status_flags_for_user(
-                    user=user,
-                    sessions=sessions_by_user[user.pk],
-                    timesheets=timesheets_by_user.get(user.pk, set()),
-                    month_range=[month_in_loop],
-                )[0]
-                for user in users
-                if user.profile.affiliation_canton == canton
-                and user.pk in sessions_by_user
-            ]
-            for canton in cantons
-        }
-        are_all_timesheets_validated_in_month = {
-            canton: all(
-                [flag == TimesheetStatus.TIMESHEET_VALIDATED for flag in all_flags]
-            )
-            if len(all_flags)
-            else None
-            for canton, all_flags in timesheets_statuses_by_canton.items()
-        }
-        statuses[month_in_loop] = are_all_timesheets_validated_in_month
+    users = UserProfile.get_cached_users_that_worked_in_cantons(cantons, year)
 
+    statuses = get_yearly_timesheets_validation_status(year, users, cantons)
     if month:
-        return statuses[month_in_loop]
+        return statuses[month]
     return statuses
 
 
-timesheets_validation_status.all_users = {}
+def get_yearly_timesheets_validation_status(year, users, cantons=DV_STATES):
+    """
+    Compute the timesheets validation status of all months of the year at once, as
+    a {month: {'canton': status}} dict, from the monthly timesheet statuses
+    """
+    users_cantons = {
+        user.pk: user.profile.affiliation_canton
+        for user in users
+        if user.profile.affiliation_canton in cantons
+    }
+    statuses = {month: {canton: None for canton in cantons} for month in range(1, 13)}
+    for user_id, month, flags in MonthlyTimesheetStatus.objects.filter(
+        year=year, user_id__in=list(users_cantons), worked_days__gt=0
+    ).values_list("user_id", "month", "flags"):
+        canton = users_cantons[user_id]
+        statuses[month][canton] = (
+            statuses[month][canton] is not False
+            and flags == TimesheetStatus.TIMESHEET_VALIDATED
+        )
+    return statuses
 
 
-def get_orphaned_timesheets_per_month(year, users, month=None, cantons=DV_STATES):
+def get_orphaned_timesheets(year, users, month=None, cantons=None):
     """
-    Get orphaned timesheets validation status matrix, a {'canton': status} dict
-    if month is None, calculate for the full year
+    Return the queryset of the timesheets of the given `users` for the given `year`
+    (and eventually `month`) without any session of theirs on the same day, for the
+    users affiliated to `cantons`
     """
-    months = range(1, 13)
-    if month:
-        months = [month]
-
     if not cantons:
         cantons = DV_STATES
+    elif isinstance(cantons, str):
+        cantons = [cantons]
+    return (
+        get_timesheets(year=year, users=users, month=month)
+        .filter(user__profile__affiliation_canton__in=cantons)
+        .exclude(
+            Exists(
+                HelperSessionSchedule.objects.filter(
+                    helper=OuterRef("user"),
+                    session__day=OuterRef("date"),
+                    role__in=HelperSessionSchedule.ASSIGNED_ROLES,
+                )
+            )
+        )
+    )
 
-    orphaned_timesheets_year = {}
 
-    for month_in_loop in months:
-        sessions = Session.objects.filter(
-            day__year=year, day__month=month_in_loop
-        ).prefetch_related(
-            "qualifications",
-            "qualifications__leader",
-            "qualifications__helpers",
-            "qualifications__actor",
-        )
-        timesheets = get_timesheets(year=year, month=month_in_loop, users=users)
-
-        sessions_by_user = regroup_sessions_by_user(sessions, users)
-        timesheets_by_user = regroup_timesheets_by_user(timesheets)
-        orphaned_timesheets_month = set()
-        for user in users:
-            try:
-                if user.profile.affiliation_canton in cantons:
-                    orphaned_timesheets_month.update(
-                        get_timesheets_without_corresponding_session(
-                            sessions_by_user.get(user.pk, set()),
-                            timesheets_by_user.get(user.pk, set()),
-                        )
-                    )
-            except User.profile.RelatedObjectDoesNotExist:
-                pass
-
-        orphaned_timesheets_year[month_in_loop] = orphaned_timesheets_month
+def get_orphaned_timesheets_per_month(year, users, month=None, cantons=DV_STATES):
+    """
+    Get the orphaned timesheets, as a {month: {timesheet1, timesheet2, …}} dict
+    if month is None, or as the set of the month
+    """
+    orphaned_timesheets_year = {month_in_loop: set() for month_in_loop in range(1, 13)}
+    for timesheet in get_orphaned_timesheets(year, users, month, cantons):
+        orphaned_timesheets_year[timesheet.date.month].add(timesheet)
 
     if month:
-        return orphaned_timesheets_year[month_in_loop]
+        return orphaned_timesheets_year[month]
     return orphaned_timesheets_year
 
 
+def delete_orphaned_timesheets(year, users, month=None, cantons=None, batch_size=500):
+    """
+    Delete the orphaned timesheets, by batches of `batch_size`, and return how many
+    were deleted
+    """
+    orphaned_timesheets = get_orphaned_timesheets(year, users, month, cantons)
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            batch = list(orphaned_timesheets.values_list("pk", flat=True)[:batch_size])
+            if not batch:
+                return deleted
+            deleted += (
+                Timesheet.objects.filter(pk__in=batch)
+                .delete()[1]
+                .get(Timesheet._meta.label, 0)
+            )
+
+
 def get_timesheets_status_matrix(year, users, cantons: list | None = None):
     """
     Return a dict of `{user: [TimesheetStatus]}` for all users who worked during the
@@ -150,7 +125,11 @@ def get_timesheets_status_matrix(year, users, cantons: list | None = None):
     all cantons, or because they're affiliated in the canton the user manages) are
     returned.
     The cantons filter will apply on the Sessions & timesheets, not on the users.
+    Without it, the statuses are read from the monthly timesheet statuses.
     """
+    if cantons is None:
+        return get_stored_timesheets_status_matrix(year, users)
+
     sessions = (
         Session.objects.filter(day__year=year).annotate(
             orga_canton=Upper(F("orga__address_canton"))
@@ -175,6 +154,25 @@ def get_timesheets_status_matrix(year, users, cantons: list | None = None):
     return timesheets_status_matrix
 
 
+def get_stored_timesheets_status_matrix(year, users):
+    """
+    Same as `get_timesheets_status_matrix`, from the monthly timesheet statuses
+    """
+    flags_by_user = {}
+    worked_users_ids = set()
+    for user_id, month, worked_days, flags in MonthlyTimesheetStatus.objects.filter(
+        year=year, user__in=users
+    ).values_list("user_id", "month", "worked_days", "flags"):
+        flags_by_user.setdefault(user_id, [0] * 12)[month - 1] = (
+            TimesheetStatus(flags) if flags else 0
+        )
+        if worked_days:
+            worked_users_ids.add(user_id)
+    return {
+        user: flags_by_user[user.pk] for user in users if user.pk in worked_users_ids
+    }
+
+
 def get_timesheets_status_flags_for_user(
     user, sessions, timesheets, month_range=range(1, 13)
 ):
@@ -263,16 +261,6 @@ def get_months_without_timesheets(sessions, timesheets):
     return {date.month for date in days_with_missing_timesheets}
 
 
-def get_timesheets_without_corresponding_session(sessions, timesheets):
-    """
-    Return a set of timesheets without a session in the corresponding day
-    """
-    session_days = [session.day for session in sessions]
-    return set(
-        timesheet for timesheet in timesheets if timesheet.date not in session_days
-    )
-
-
 def get_timesheets(year, users, month=None):
     """
     Return the timesheets of the given `users` for the given `year` (and eventually `month`).
@@ -298,16 +286,118 @@ def get_timesheets_amount_by_month(year, users, cantons: list | None = None):
         )
         timesheets = timesheets.filter(date__in=sessions.values_list("day"))
 
-    timesheets_by_month = regroup_timesheets_by_month(timesheets)
+    return timesheets.amounts_by_month()
 
-    total_by_month = [
-        sum(
-            timesheet.get_total_amount() for timesheet in timesheets_by_month.get(i, [])
-        )
-        for i in range(1, 13)
-    ]
 
-    return total_by_month
+class YearlyTimesheetsMatrix:
+    """
+    The timesheets of the given `users` for a `year`, and the sessions days of the
+    year partitioned by canton, loaded once to project the status matrices and the
+    amounts by month of all cantons, or of a single one
+    """
+
+    def __init__(self, year, users):
+        self.year = year
+        self.users = users
+
+    @cached_property
+    def timesheets_by_user(self):
+        return regroup_timesheets_by_user(get_timesheets(self.year, self.users))
+
+    @cached_property
+    def days_by_canton(self):
+        """
+        `{canton: {day1, day2, ...}}` of all sessions of the year
+        """
+        days_by_canton = {}
+        for day, canton in Session.objects.filter(day__year=self.year).values_list(
+            "day", Upper("orga__address_canton")
+        ):
+            days_by_canton.setdefault(canton, set()).add(day)
+        return days_by_canton
+
+    @cached_property
+    def worked_days_by_canton(self):
+        """
+        `{canton: {user_id: {day1, day2, ...}}}` of the sessions of the users
+        """
+        users_ids = {user.pk for user in self.users}
+        qualifications = Qualification.objects.filter(session__day__year=self.year)
+        worked = set()
+        for day, canton, leader_id, actor_id in qualifications.values_list(
+            "session__day", Upper("session__orga__address_canton"), "leader", "actor"
+        ):
+            worked.update(
+                (canton, user_id, day)
+                for user_id in (leader_id, actor_id)
+                if user_id in users_ids
+            )
+        worked.update(
+            (canton, user_id, day)
+            for day, canton, user_id in Qualification.helpers.through.objects.filter(
+                qualification__in=qualifications, user__in=users_ids
+            ).values_list(
+                "qualification__session__day",
+                Upper("qualification__session__orga__address_canton"),
+                "user",
+            )
+        )
+        worked_days_by_canton = {}
+        for canton, user_id, day in worked:
+            worked_days_by_canton.setdefault(canton, {}).setdefault(user_id, set()).add(
+                day
+            )
+        return worked_days_by_canton
+
+    def canton_users(self, canton):
+        """
+        The users who worked in the given canton during the year
+        """
+        worked_days = self.worked_days_by_canton.get(canton.upper(), {})
+        return [user for user in self.users if user.pk in worked_days]
+
+    def canton_timesheets(self, user, canton):
+        canton_days = self.days_by_canton.get(canton.upper(), set())
+        return [
+            timesheet
+            for timesheet in self.timesheets_by_user.get(user.pk, [])
+            if timesheet.date in canton_days
+        ]
+
+    def status_matrix(self, canton=None):
+        """
+        Same as `get_timesheets_status_matrix`, for all cantons or for the given one
+        """
+        if canton is None:
+            return get_stored_timesheets_status_matrix(self.year, self.users)
+        worked_days = self.worked_days_by_canton.get(canton.upper(), {})
+        matrix = {}
+        for user in self.canton_users(canton):
+            timesheets = self.canton_timesheets(user, canton)
+            flags = [0] * 12
+            for day in worked_days[user.pk] - {t.date for t in timesheets}:
+                flags[day.month - 1] |= TimesheetStatus.TIMESHEET_MISSING
+            for timesheet in timesheets:
+                flags[timesheet.date.month - 1] |= (
+                    TimesheetStatus.TIMESHEET_VALIDATED
+                    if timesheet.validated_at
+                    else TimesheetStatus.TIMESHEET_NOT_VALIDATED
+                )
+            matrix[user] = flags
+        return matrix
+
+    def amounts_by_month(self, canton=None):
+        """
+        Same as `get_timesheets_amount_by_month`, for all cantons or for the given
+        one, from the already loaded users and sessions days
+        """
+        if canton is None:
+            return get_timesheets(self.year, self.users).amounts_by_month()
+        return (
+            get_timesheets(self.year, self.canton_users(canton))
+            .filter(date__in=self.days_by_canton.get(canton.upper(), set()))
+            .amounts_by_month()
+        )
 
 
 def get_visible_users(user):
@@ -327,26 +417,48 @@ def get_visible_users(user):
     return qs.prefetch_related("profile")
 
 
-def get_users_with_missing_timesheets(year: int, month: int, users):
-    return [
-        user
-        for user, flags in get_timesheets_status_matrix(year, users).items()
-        if flags[month - 1] & TimesheetStatus.TIMESHEET_MISSING
-    ]
+def get_missing_timesheets_statuses(year: int, users, month: int | None = None):
+    """
+    Return the monthly timesheet statuses of the given `users` for the given `year`
+    (and eventually `month`) with sessions missing their timesheet
+    """
+    statuses = (
+        MonthlyTimesheetStatus.objects.annotate(
+            missing=F("flags").bitand(TimesheetStatus.TIMESHEET_MISSING)
+        )
+        .filter(year=year, user__in=users, missing__gt=0)
+        .order_by()
+    )
+    if month:
+        statuses = statuses.filter(month=month)
+    return statuses
 
 
-def get_missing_timesheet_status_per_month(timesheets_status_matrix):
+def get_users_with_missing_timesheets(year: int, month: int, users):
     """
-    Return a list of booleans (one per month) that indicate if any user has missing
-    timesheets for each month.
+    Return the users from the `users` queryset with sessions missing their
+    timesheet in the given month
     """
-    return [
-        any(
-            statuses[month_index] & TimesheetStatus.TIMESHEET_MISSING
-            for _, statuses in timesheets_status_matrix.items()
+    return list(
+        users.filter(
+            pk__in=get_missing_timesheets_statuses(year, users, month).values("user")
         )
-        for month_index in range(0, 12)
-    ]
+    )
+
+
+def get_missing_timesheets_by_canton(year: int, users):
+    """
+    Return a list (one per month) of `{canton: count}` dicts of the users with
+    sessions missing their timesheet, by affiliation canton
+    """
+    missing_by_canton = [{} for month in range(1, 13)]
+    for missing in (
+        get_missing_timesheets_statuses(year, users)
+        .values("month", canton=F("user__profile__affiliation_canton"))
+        .annotate(count=Count("user"))
+    ):
+        missing_by_canton[missing["month"] - 1][missing["canton"]] = missing["count"]
+    return missing_by_canton
 
 
 def get_salary_details_list(object_list: QuerySet) -> QuerySet:
@@ -354,9 +466,7 @@ def get_salary_details_list(object_list: QuerySet) -> QuerySet:
     Return the queryset of salary details needed in multiple exports
     """
 
-    # Django queries to convert the ignore Bool (0 if not ignored, 1 if ignored)
-    # into an included Bool (1 if taken into account, 0 if ignored)
-    included = 1 - Cast(F("ignore"), IntegerField())
+    included = TimesheetQuerySet.included()
     included_float = Cast(included, FloatField())
 
     return object_list.values("user").annotate(
@@ -368,4 +478,5 @@ def get_salary_details_list(object_list: QuerySet) -> QuerySet:
         leader_count=Sum(F("leader_count") * included),
         overtime=Sum(F("overtime") * included_float),
         traveltime=Sum(F("traveltime") * included_float),
+        amount=Sum(TimesheetQuerySet.amount()),
     )
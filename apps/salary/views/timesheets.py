@@ -5,8 +5,7 @@ from django.contrib import messages
 from django.contrib.sites.models import Site
 from django.core import mail
 from django.core.exceptions import PermissionDenied
-from django.db.models import Count, F, Q
-from django.db.models.functions import Upper
+from django.db.models import F, Q
 from django.shortcuts import get_object_or_404, redirect
 from django.template.defaultfilters import date as datefilter
 from django.template.loader import render_to_string
@@ -29,10 +28,9 @@ from apps.common import DV_STATE_CHOICES
 from apps.common.views import ExportMixin
 from apps.salary import BONUS_LEADER, HOURLY_RATE_HELPER, RATE_ACTOR
 from apps.salary.forms import ControlTimesheetFormSet, TimesheetFormSet
-from apps.salary.models import Timesheet
+from apps.salary.models import Timesheet, UserWorkedDay
 from defivelo.roles import has_permission, user_cantons
 
-from ...user.models import UserProfile
 from ...user.views.standard import ReturnUrlMixin
 from .. import timesheets_overview
 
@@ -61,36 +59,17 @@ class UserMonthlyTimesheets(MonthArchiveView, ReturnUrlMixin, FormView):
 
     def get_queryset(self):
         return (
-            (
-                Session.objects.values("day")
-                .filter(
-                    Q(qualifications__actor=self.selected_user)
-                    | Q(qualifications__helpers=self.selected_user)
-                    | Q(qualifications__leader=self.selected_user)
-                )
-                .filter(day__lte=timezone.now())
-                .annotate(
-                    orga_count=Count("orga_id", distinct=True),
-                    orga_canton=Upper(F("orga__address_canton")),
-                    helper_count=Count(
-                        "qualifications__pk",
-                        filter=Q(qualifications__helpers=self.selected_user)
-                        | Q(qualifications__leader=self.selected_user),
-                        distinct=True,
-                    ),
-                    leader_count=Count(
-                        "qualifications__pk",
-                        filter=Q(qualifications__leader=self.selected_user),
-                        distinct=True,
-                    ),
-                    actor_count=Count(
-                        "qualifications__pk",
-                        filter=Q(qualifications__actor=self.selected_user),
-                        distinct=True,
-                    ),
-                )
+            UserWorkedDay.objects.filter(
+                user=self.selected_user, day__lte=timezone.now()
+            )
+            .values(
+                "day",
+                "orga_count",
+                "helper_count",
+                "leader_count",
+                "actor_count",
+                orga_canton=F("canton"),
             )
-            .exclude(actor_count=0, helper_count=0)
             .order_by("day")
         )
 
@@ -246,9 +225,8 @@ class UserMonthlyTimesheets(MonthArchiveView, ReturnUrlMixin, FormView):
 
     def form_valid(self, formset):
         """If the form is valid, save the associated model."""
-        for form in formset:
-            form.save()
-        return super().form_valid(form)
+        formset.save()
+        return super().form_valid(formset)
 
     def post(self, request, *args, **kwargs):
         self.date_list, self.object_list, extra_context = self.get_dated_items()
@@ -300,33 +278,22 @@ class YearlyTimesheets(TemplateView):
         users = timesheets_overview.get_visible_users(self.request.user).order_by(
             "first_name", "last_name"
         )
-        global_timesheets_status_matrix = (
-            timesheets_overview.get_timesheets_status_matrix(year=year, users=users)
+        matrix = timesheets_overview.YearlyTimesheetsMatrix(year=year, users=users)
+        missing_timesheets_by_canton = (
+            timesheets_overview.get_missing_timesheets_by_canton(year, users)
         )
         if active_canton:
-            users = UserProfile.get_users_that_worked_in_cantons(
-                [active_canton], year=year
-            )
-            timesheets_status_matrix = timesheets_overview.get_timesheets_status_matrix(
-                year=year, users=users, cantons=[active_canton]
-            )
+            users = matrix.canton_users(active_canton)
+            timesheets_status_matrix = matrix.status_matrix(active_canton)
         else:
-            timesheets_status_matrix = global_timesheets_status_matrix
+            timesheets_status_matrix = matrix.status_matrix()
 
         context["months"] = MONTHS_3
         context["timesheets_status_matrix"] = timesheets_status_matrix
-        context["show_reminder_button_months"] = (
-            timesheets_overview.get_missing_timesheet_status_per_month(
-                global_timesheets_status_matrix
-            )
-        )
-        context["timesheets_amount"] = (
-            timesheets_overview.get_timesheets_amount_by_month(
-                year=year,
-                users=users,
-                cantons=[active_canton] if active_canton else None,
-            )
-        )
+        context["missing_timesheets_by_month"] = [
+            (sum(missing.values()), missing) for missing in missing_timesheets_by_canton
+        ]
+        context["timesheets_amount"] = matrix.amounts_by_month(active_canton)
         context["orphaned_timesheets"] = (
             timesheets_overview.get_orphaned_timesheets_per_month(
                 year=year,
@@ -474,11 +441,7 @@ class ExportMonthlyControl(ExportMixin, MonthArchiveView):
                 + salary_details["overtime"]
                 + salary_details["traveltime"]
             )
-            chf_total = (
-                time_total * HOURLY_RATE_HELPER
-                + salary_details["actor_count"] * RATE_ACTOR
-                + salary_details["leader_count"] * BONUS_LEADER
-            )
+            chf_total = salary_details["amount"]
             dataset.append(
                 [
                     # See DEFIVELO-225
@@ -508,13 +471,20 @@ class CleanupOrphanedTimesheets(TemplateView):
         self.year = int(year)
 
         active_canton = self.request.GET.get("canton")
+        self.orphaned_timesheets_scope = {
+            "year": self.year,
+            "month": self.month,
+            "users": timesheets_overview.get_visible_users(self.request.user),
+            "cantons": (
+                [active_canton] if active_canton in dict(DV_STATE_CHOICES) else None
+            ),
+        }
         self.orphaned_timesheets = (
-            timesheets_overview.get_orphaned_timesheets_per_month(
-                year=year,
-                month=self.month,
-                users=timesheets_overview.get_visible_users(self.request.user),
-                cantons=(active_canton if active_canton in DV_STATE_CHOICES else None),
+            timesheets_overview.get_orphaned_timesheets(
+                **self.orphaned_timesheets_scope
             )
+            .select_related("user")
+            .order_by("date")
         )
         if not self.orphaned_timesheets:
             messages.success(
@@ -535,9 +505,9 @@ class CleanupOrphanedTimesheets(TemplateView):
         return context
 
     def post(self, request, *args, **kwargs):
-        (deleted, _) = Timesheet.objects.filter(
-            id__in=[t.id for t in self.orphaned_timesheets]
-        ).delete()
+        deleted = timesheets_overview.delete_orphaned_timesheets(
+            **self.orphaned_timesheets_scope
+        )
         messages.warning(
             request,
             n(
@@ -14,15 +14,30 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from collections import defaultdict
+
 from django.contrib.auth import get_user_model
-from django.utils.encoding import force_str
+from django.contrib.auth.hashers import is_password_usable
+from django.db.models import F
+from django.utils.encoding import force_str, smart_str
 from django.utils.translation import gettext_lazy as _
 
 from import_export import fields, resources, widgets
 
+from apps.challenge.models import QualificationActivity
+from apps.common import DV_STATE_CHOICES
 from defivelo.templatetags.dv_filters import canton_abbr, cantons_abbr
 
-from .models import COLLABORATOR_FIELDS, STD_PROFILE_FIELDS
+from . import FORMATION_CHOICES
+from .models import (
+    BAGSTATUS_CHOICES,
+    COLLABORATOR_FIELDS,
+    MARITALSTATUS_CHOICES,
+    STD_PROFILE_FIELDS,
+    USERSTATUS_CHOICES,
+    UserManagedState,
+    UserProfile,
+)
 
 
 class MultipleSelectWidget(widgets.Widget):
@@ -30,12 +45,24 @@ class MultipleSelectWidget(widgets.Widget):
         return ", ".join(value)
 
 
+def firstmed_text(firstmed_course, firstmed_course_comm):
+    final = _("Yes") if firstmed_course else _("No")
+    if firstmed_course_comm:
+        final += " - " + firstmed_course_comm
+    return force_str(final)
+
+
 class FirstMedWidget(widgets.Widget):
     def render(self, value, object=None):
-        final = _("Yes") if value.firstmed_course else _("No")
-        if value.firstmed_course_comm:
-            final += " - " + value.firstmed_course_comm
-        return force_str(final)
+        return firstmed_text(value.firstmed_course, value.firstmed_course_comm)
+
+
+def render_method_value(attribute):
+    if isinstance(attribute, list):
+        attribute = ", ".join(attribute)
+    if attribute:
+        return force_str(attribute)
+    return ""
 
 
 class ObjectMethodWidget(widgets.Widget):
@@ -44,12 +71,7 @@ class ObjectMethodWidget(widgets.Widget):
         return super(ObjectMethodWidget, self).__init__(*args, **kwargs)
 
     def render(self, value, object=None):
-        attribute = getattr(value, self.method)
-        if isinstance(attribute, list):
-            attribute = ", ".join(attribute)
-        if attribute:
-            return force_str(attribute)
-        return ""
+        return render_method_value(getattr(value, self.method))
 
 
 ALL_PROFILE_FIELDS = tuple(
@@ -208,6 +230,146 @@ class UserResource(resources.ModelResource):
             cantons_abbr(field.profile.activity_cantons, abbr=False, long=True)
         )
 
+    def export_rows(self, queryset):
+        """
+        The `export_resource()` rows of the users of `queryset`, pulled with one
+        `values()` query, and one query per many-to-many relation, the choices
+        being formatted through lookup tables
+        """
+        export_fields = self.get_export_fields()
+        methods = {
+            field.widget.method
+            for field in export_fields
+            if isinstance(field.widget, ObjectMethodWidget)
+        }
+        users_ids = queryset.order_by().values("pk")
+
+        cantons = {code: force_str(name) for code, name in DV_STATE_CHOICES}
+        choices = {
+            name: {key: force_str(label) for key, label in field_choices}
+            for name, field_choices in [
+                ("formation", FORMATION_CHOICES),
+                ("status", USERSTATUS_CHOICES),
+                ("marital_status", MARITALSTATUS_CHOICES),
+                ("bagstatus", BAGSTATUS_CHOICES),
+            ]
+        }
+        actors = defaultdict(list)
+        if "actor_inline" in methods:
+            # The names are translated, as in `UserProfile.actor_inline`
+            for activity in (
+                QualificationActivity.objects.filter(actor_for__user__in=users_ids)
+                .annotate(user_id=F("actor_for__user_id"))
+                .prefetch_related("translations")
+            ):
+                actors[activity.user_id].append(smart_str(activity))
+        managed_cantons = defaultdict(list)
+        if "managed_cantons" in methods:
+            for user_id, canton in (
+                UserManagedState.objects.filter(user__in=users_ids)
+                .order_by("pk")
+                .values_list("user_id", "canton")
+            ):
+                managed_cantons[user_id].append(canton)
+        roles = defaultdict(list)
+        if "access_level_text" in methods:
+            for user_id, role in (
+                get_user_model()
+                .groups.through.objects.filter(user__in=users_ids)
+                .values_list("user_id", "group__name")
+            ):
+                roles[user_id].append(role)
+
+        profile_methods = {
+            "formation_full": lambda user: (
+                choices["formation"][user["profile__formation"]]
+                if user["profile__formation"]
+                else ""
+            ),
+            "status_full": lambda user: (
+                choices["status"][user["profile__status"]]
+                if user["profile__status"]
+                else ""
+            ),
+            "marital_status_full": lambda user: (
+                choices["marital_status"][user["profile__marital_status"]]
+                if user["profile__marital_status"]
+                else ""
+            ),
+            "bagstatus_full": lambda user: (
+                choices["bagstatus"][user["profile__bagstatus"]]
+                if user["profile__bagstatus"]
+                else ""
+            ),
+            "actor_inline": lambda user: " - ".join(actors[user["pk"]]),
+            "managed_cantons": lambda user: managed_cantons[user["pk"]],
+            "access_level_text": lambda user: UserProfile.access_level_title_icon(
+                user["is_active"] and is_password_usable(user["password"]),
+                user["is_superuser"],
+                roles[user["pk"]],
+            )[0],
+        }
+        # As the dehydrate_* methods
+        dehydrated = {
+            "profile__address_canton": lambda user: cantons.get(
+                user["profile__address_canton"], user["profile__address_canton"]
+            ),
+            "profile__affiliation_canton": lambda user: cantons.get(
+                user["profile__affiliation_canton"],
+                user["profile__affiliation_canton"],
+            ),
+            "profile__activity_cantons": lambda user: ", ".join(
+                name
+                for code, name in cantons.items()
+                if code in user["profile__activity_cantons"]
+            ),
+        }
+
+        def renderer(field):
+            name = self.get_field_name(field)
+            if name in dehydrated:
+                return dehydrated[name]
+
+            def render_attribute(user):
+                value = user[field.attribute]
+                return "" if value is None else field.widget.render(value)
+
+            def render_profile(user):
+                if user["profile__pk"] is None:
+                    return ""
+                if isinstance(field.widget, FirstMedWidget):
+                    return firstmed_text(
+                        user["profile__firstmed_course"],
+                        user["profile__firstmed_course_comm"],
+                    )
+                return render_method_value(profile_methods[field.widget.method](user))
+
+            return render_profile if field.attribute == "profile" else render_attribute
+
+        renderers = [renderer(field) for field in export_fields]
+        columns = {
+            field.attribute
+            for field in export_fields
+            if field.attribute and field.attribute != "profile"
+        } | {
+            "pk",
+            "password",
+            "is_active",
+            "is_superuser",
+            "profile__pk",
+            "profile__formation",
+            "profile__status",
+            "profile__marital_status",
+            "profile__bagstatus",
+            "profile__firstmed_course",
+            "profile__firstmed_course_comm",
+            *dehydrated,
+        }
+        for user in (
+            queryset.prefetch_related(None).values(*columns).iterator(chunk_size=2000)
+        ):
+            yield [render(user) for render in renderers]
+
 
 class CollaboratorUserResource(UserResource):
     """
@@ -2,9 +2,8 @@
 from __future__ import unicode_literals
 
 from django.db import migrations, models
-from memoize import delete_memoized
 
-from defivelo.roles import user_cantons
+from defivelo.roles import invalidate_permissions
 
 
 def vsow_to_hw(apps, schema_editor):
@@ -21,7 +20,7 @@ def vsow_to_hw(apps, schema_editor):
         if up.affiliation_canton == "VS-OW":
             up.affiliation_canton = "WS"
         up.save()
-    delete_memoized(user_cantons)
+    invalidate_permissions()
 
 
 def hw_to_vsow(apps, schema_editor):
@@ -38,7 +37,7 @@ def hw_to_vsow(apps, schema_editor):
         if up.affiliation_canton == "WS":
             up.affiliation_canton = "VS-OW"
         up.save()
-    delete_memoized(user_cantons)
+    invalidate_permissions()
 
 
 class Migration(migrations.Migration):
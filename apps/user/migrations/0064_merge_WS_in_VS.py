@@ -1,7 +1,6 @@
 from django.db import migrations, models
-from memoize import delete_memoized
 
-from defivelo.roles import user_cantons
+from defivelo.roles import invalidate_permissions
 
 
 def ws_to_vs(apps, schema_editor):
@@ -20,7 +19,7 @@ def ws_to_vs(apps, schema_editor):
         if up.affiliation_canton == "WS":
             up.affiliation_canton = "VS"
         up.save()
-    delete_memoized(user_cantons)
+    invalidate_permissions()
 
 
 class Migration(migrations.Migration):
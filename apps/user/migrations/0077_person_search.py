@@ -0,0 +1,36 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# `unaccent` is only STABLE, so wrap it (with its dictionary pinned) in an
+# IMMUTABLE function usable in the indexes
+SEARCH_TEXT_FUNCTION = """
+CREATE OR REPLACE FUNCTION dv_search_text(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT lower(public.unaccent('public.unaccent'::regdictionary, $1)) $$;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("common", "0006_unaccented_psql"),
+        ("user", "0076_inclusive_language"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(
+            SEARCH_TEXT_FUNCTION,
+            "DROP FUNCTION IF EXISTS dv_search_text(text);",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX user_person_search_trgm ON auth_user USING gin ("
+            "dv_search_text(first_name || ' ' || last_name || ' ' || email)"
+            " gin_trgm_ops);",
+            "DROP INDEX IF EXISTS user_person_search_trgm;",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX user_userprofile_natel_search_trgm ON user_userprofile"
+            " USING gin (dv_search_text(natel) gin_trgm_ops);",
+            "DROP INDEX IF EXISTS user_userprofile_natel_search_trgm;",
+        ),
+    ]
@@ -13,8 +13,11 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import uuid
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.core.mail import send_mail
 from django.db import models, transaction
@@ -34,11 +37,10 @@ from allauth.account.models import EmailAddress
 from django_countries.fields import CountryField
 from localflavor.generic.countries.sepa import IBAN_SEPA_COUNTRIES
 from localflavor.generic.models import IBANField
-from memoize import delete_memoized, memoize
 from rolepermissions.checkers import has_role
-from rolepermissions.roles import assign_role, clear_roles
+from rolepermissions.roles import assign_role, clear_roles, get_user_roles
 
-from apps.challenge.models import QualificationActivity, Season
+from apps.challenge.models import Qualification, QualificationActivity, Season
 from apps.common import (
     DV_LANGUAGES,
     DV_LANGUAGES_WITH_DEFAULT,
@@ -48,7 +50,12 @@ from apps.common import (
     STDGLYPHICON,
 )
 from apps.common.models import Address
-from defivelo.roles import has_permission, user_cantons
+from defivelo.roles import (
+    has_permission,
+    invalidate_permissions,
+    permissions_snapshot,
+    user_cantons,
+)
 
 from ..common.fields import ChoiceArrayField
 from . import FORMATION_CHOICES, formation_short, get_new_username
@@ -148,6 +155,9 @@ COLLABORATOR_FIELDS = [
 
 STD_PROFILE_FIELDS = PERSONAL_FIELDS + DV_PUBLIC_FIELDS + DV_PRIVATE_FIELDS
 
+WORKED_IN_CANTONS_VERSION_KEY = "users-worked-in-cantons:version"
+WORKED_IN_CANTONS_CACHE_TIMEOUT = 60 * 60
+
 
 class ExistingUserProfileManager(models.Manager):
     def get_queryset(self):
@@ -267,36 +277,72 @@ class UserProfile(Address, models.Model):
         - actor (meeting - Qualif C)
         """
 
-        leader_filters = {
-            f"qualifs_mon2__{k}": v
-            for k, v in {"session__orga__address_canton__in": cantons}.items()
-        }
-        helper_filters = {
-            f"qualifs_mon1__{k}": v
-            for k, v in {"session__orga__address_canton__in": cantons}.items()
-        }
-        actor_filters = {
-            f"qualifs_actor__{k}": v
-            for k, v in {"session__orga__address_canton__in": cantons}.items()
-        }
-
+        # Each role is resolved on its own, and their users ids are united:
+        # OR-ing the three join paths makes PostgreSQL scan all the users
+        qualifications = Qualification.objects.filter(
+            session__orga__address_canton__in=cantons
+        )
         if year is not None:
-            leader_filters["qualifs_mon2__session__day__year"] = year
-            helper_filters["qualifs_mon1__session__day__year"] = year
-            actor_filters["qualifs_actor__session__day__year"] = year
-
-        criteria = Q(**leader_filters) | Q(**helper_filters) | Q(**actor_filters)
+            qualifications = qualifications.filter(session__day__year=year)
+        qualifications = qualifications.order_by()
+        users_ids = (
+            qualifications.filter(leader_id__isnull=False)
+            .values("leader_id")
+            .union(
+                qualifications.filter(actor_id__isnull=False).values("actor_id"),
+                Qualification.helpers.through.objects.filter(
+                    qualification__in=qualifications.values("pk")
+                ).values("user_id"),
+            )
+            .order_by()
+        )
 
+        criteria = Q(pk__in=users_ids)
         for q in additional_or if additional_or else []:
             criteria = criteria | q
 
+        users = get_user_model().objects.filter(criteria).prefetch_related("profile")
+        # The additional criteria could span multi-valued relations
+        return users.distinct() if additional_or else users
+
+    @staticmethod
+    def get_cached_users_that_worked_in_cantons(cantons: list[str], year: int):
+        """
+        Same as `get_users_that_worked_in_cantons`, with the users ids kept in the
+        cache, until they expire or the qualifications change
+        """
+        version = cache.get_or_set(
+            WORKED_IN_CANTONS_VERSION_KEY, uuid.uuid4().hex, None
+        )
+        key = f"users-worked-in-cantons:{version}:{'-'.join(sorted(cantons))}:{year}"
+        users_ids = cache.get(key)
+        if users_ids is None:
+            users_ids = list(
+                UserProfile.get_users_that_worked_in_cantons(
+                    cantons, year=year
+                ).values_list("pk", flat=True)
+            )
+            cache.set(key, users_ids, WORKED_IN_CANTONS_CACHE_TIMEOUT)
         return (
             get_user_model()
-            .objects.filter(criteria)
+            .objects.filter(pk__in=users_ids)
             .prefetch_related("profile")
-            .distinct()
         )
 
+    @staticmethod
+    def invalidate_users_that_worked_in_cantons():
+        """
+        Forget the cached users of `get_cached_users_that_worked_in_cantons`, now and
+        once the current transaction is committed (before which other workers could
+        still have cached the previous state)
+        """
+
+        def invalidate():
+            cache.set(WORKED_IN_CANTONS_VERSION_KEY, uuid.uuid4().hex, None)
+
+        invalidate()
+        transaction.on_commit(invalidate)
+
     def save(self, *args, **kwargs):
         if self.activity_cantons:
             # Remove the affiliation canton from the activity_cantons
@@ -329,9 +375,7 @@ class UserProfile(Address, models.Model):
         super().save(*args, **kwargs)
 
     def reset_cache(self):
-        delete_memoized(has_permission)
-        delete_memoized(user_cantons, self.user)
-        delete_memoized(self.get_seasons)
+        invalidate_permissions(self.user)
 
     def set_role(self, role_str=None):
         # Enforce that a user can only have one role at a time
@@ -519,29 +563,34 @@ class UserProfile(Address, models.Model):
         except IndexError:
             return ""
 
+    @staticmethod
+    def access_level_title_icon(can_login, is_superuser, roles):
+        """
+        (title, icon) of the access level of a user, from whether they can log in,
+        whether they are a superuser and the names of their roles
+        """
+        if not can_login:
+            return "", ""
+        if is_superuser:
+            return _("Administra·teur·trice"), "queen"
+        if "power_user" in roles:
+            return _("Bureau de coordination"), "king"
+        if "state_manager" in roles:
+            return _("Chargé·e de projet"), "bishop"
+        if "coordinator" in roles:
+            return _("Coordina·teur·trice"), "pawn"
+        if "collaborator" in roles:
+            return _("Collabora·teur·trice"), "user"
+        return _("A accès"), "user"
+
     def access_level(self, textonly=True):
-        icon = ""
-        title = ""
-        if self.can_login:
-            title = _("A accès")
-            icon = "user"
-
-            if self.user.is_superuser:
-                title = _("Administra·teur·trice")
-                icon = "queen"
-            elif self.user.groups.exists():
-                if has_role(self.user, "power_user"):
-                    title = _("Bureau de coordination")
-                    icon = "king"
-                elif has_role(self.user, "state_manager"):
-                    title = _("Chargé·e de projet")
-                    icon = "bishop"
-                elif has_role(self.user, "coordinator"):
-                    title = _("Coordina·teur·trice")
-                    icon = "pawn"
-                elif has_role(self.user, "collaborator"):
-                    title = _("Collabora·teur·trice")
-                    icon = "user"
+        title, icon = self.access_level_title_icon(
+            self.can_login,
+            self.user.is_superuser,
+            [role.get_name() for role in get_user_roles(self.user)]
+            if self.can_login and not self.user.is_superuser
+            else [],
+        )
         if title and textonly:
             return title
         if icon:
@@ -575,8 +624,19 @@ class UserProfile(Address, models.Model):
     def can_login(self):
         return self.user.is_active and self.user.has_usable_password()
 
-    @memoize()
     def get_seasons(self, raise_without_cantons=False):
+        """
+        Seasons visible to the user, selected once per request: the snapshot keeps
+        their ids, and each call gets a fresh queryset of them
+        """
+        seasons = permissions_snapshot(self.user).seasons
+        if raise_without_cantons not in seasons:
+            seasons[raise_without_cantons] = tuple(
+                self._get_seasons(raise_without_cantons).values_list("pk", flat=True)
+            )
+        return Season.objects.filter(pk__in=seasons[raise_without_cantons])
+
+    def _get_seasons(self, raise_without_cantons):
         qs = Season.objects
         usercantons = []
 
@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import F, Func, TextField, Value
+from django.db.models.functions import Greatest
+
+from .models import UserProfile
+
+
+class SearchText(Func):
+    """
+    Unaccented and lowercased text of the expressions, joined by spaces, as
+    indexed for the persons search (see the `0077_person_search` migration)
+    """
+
+    function = "dv_search_text"
+    template = "%(function)s(%(expressions)s)"
+    arg_joiner = " || ' ' || "
+    output_field = TextField()
+
+
+def person_search_text():
+    return SearchText(F("first_name"), F("last_name"), F("email"))
+
+
+def search_persons(queryset, value, rank=False):
+    """
+    Filter the users `queryset` on `value` within their names, email or natel,
+    through the trigram indexes. With `rank`, order them by similarity first.
+    """
+    search = SearchText(Value(value))
+    matching = (
+        get_user_model()
+        .objects.annotate(search_text=person_search_text())
+        .filter(search_text__contains=search)
+        .values("pk")
+        .union(
+            UserProfile.objects.annotate(search_text=SearchText(F("natel")))
+            .filter(search_text__contains=search)
+            .values("user_id")
+        )
+    )
+    queryset = queryset.filter(pk__in=matching)
+    if rank:
+        queryset = queryset.annotate(
+            search_rank=Greatest(
+                TrigramWordSimilarity(search, person_search_text()),
+                TrigramWordSimilarity(search, SearchText(F("profile__natel"))),
+            )
+        ).order_by("-search_rank", *queryset.query.order_by)
+    return queryset
@@ -3,13 +3,15 @@ import threading
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
 from django.core.mail import send_mail
 from django.core.signals import request_finished
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 
-from apps.user.models import UserProfile
+from apps.user.models import UserManagedState, UserProfile
+from defivelo.roles import invalidate_permissions
 
 # Global dictionary to store field changes temporarily during the save process
 _user_changes = {}  # Payload indexed by user.pk
@@ -17,6 +19,44 @@ _user_changes_lock = threading.Lock()
 _userprofile_to_notify = queue.Queue()  # User model that are used in user_changes.
 
 
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+@receiver(m2m_changed, sender=get_user_model().user_permissions.through)
+def user_roles_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Forget the cached permissions of the users whose roles or permissions changed
+    """
+    if action == "pre_clear" and reverse:
+        # Remember who is about to lose them
+        instance._cleared_user_ids = set(instance.user_set.values_list("id", flat=True))
+        return
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    if not reverse:
+        invalidate_permissions(instance)
+        return
+    if action == "post_clear":
+        pk_set = getattr(instance, "_cleared_user_ids", set())
+    if pk_set:
+        invalidate_permissions(*pk_set)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions(sender, action, **kwargs):
+    """
+    Forget the cached permissions of all users when the permissions of roles
+    change, e.g. by sync_roles
+    """
+    if action in ["post_add", "post_remove", "post_clear"]:
+        invalidate_permissions()
+
+
+@receiver(post_save, sender=UserManagedState)
+@receiver(post_delete, sender=UserManagedState)
+def user_managed_state_permissions(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_permissions(instance.user)
+
+
 @receiver(pre_save, sender=get_user_model())
 def user_email_change_signal(sender, instance, **kwargs):
     """
@@ -17,6 +17,7 @@
 import datetime
 from unittest.mock import patch
 
+from django.contrib.auth.models import Group
 from django.core.signals import request_finished
 from django.db.models import Q
 from django.test import override_settings
@@ -30,8 +31,10 @@ from apps.challenge.tests.factories import (
 )
 from apps.orga.tests.factories import OrganizationFactory
 from apps.user import FORMATION_M1, FORMATION_M2
-from apps.user.models import UserProfile
+from apps.user.models import UserManagedState, UserProfile
 from apps.user.tests.factories import UserFactory
+from defivelo import roles
+from defivelo.roles import has_permission, user_cantons
 
 
 def test_str_representations(db):
@@ -80,6 +83,119 @@ def test_get_users_that_worked_in_cantons_filters_by_year_and_role(db):
     assert extra_user in users_with_extra
 
 
+def test_get_users_that_worked_in_cantons_unites_the_roles(db):
+    session = SessionFactory(
+        day=datetime.date(2019, 4, 10),
+        orga=OrganizationFactory(address_canton="VD"),
+    )
+    # Without leader nor actor
+    QualificationFactory(session=session)
+    assert not UserProfile.get_users_that_worked_in_cantons(["VD"])
+
+    leader, actor, helper = UserFactory(), UserFactory(), UserFactory()
+    # Each role on its own
+    for user, role in [
+        (leader, {"leader": leader}),
+        (actor, {"actor": actor}),
+        (helper, {"helpers": [helper]}),
+    ]:
+        QualificationFactory(
+            session=SessionFactory(
+                day=datetime.date(2019, 4, 11),
+                orga=OrganizationFactory(address_canton="VD"),
+            ),
+            **role,
+        )
+        assert user in UserProfile.get_users_that_worked_in_cantons(
+            ["VD"], year=2019
+        )
+    assert set(UserProfile.get_users_that_worked_in_cantons(["VD"])) == {
+        leader,
+        actor,
+        helper,
+    }
+    assert not UserProfile.get_users_that_worked_in_cantons(["VD"], year=2020)
+    assert not UserProfile.get_users_that_worked_in_cantons(["GE"])
+
+    # Users working in several roles are only returned once, also with the
+    # additional criteria
+    QualificationFactory(session=session, leader=helper, actor=actor)
+    extra_user = UserFactory()
+    users = UserProfile.get_users_that_worked_in_cantons(
+        ["VD"], additional_or=[Q(pk=extra_user.pk), Q(pk=leader.pk)]
+    )
+    assert sorted(user.pk for user in users) == sorted(
+        [leader.pk, actor.pk, helper.pk, extra_user.pk]
+    )
+    assert list(
+        UserProfile.get_users_that_worked_in_cantons(
+            ["GE"], additional_or=[Q(pk=extra_user.pk)]
+        )
+    ) == [extra_user]
+
+
+def test_cached_users_that_worked_in_cantons_follow_the_qualifications(db):
+    session = SessionFactory(
+        day=datetime.date(2019, 4, 10),
+        orga=OrganizationFactory(address_canton="VD"),
+    )
+    actor = UserFactory()
+    qualification = QualificationFactory(session=session, actor=actor)
+
+    users = UserProfile.get_cached_users_that_worked_in_cantons(["VD"], 2019)
+    assert set(users) == {actor}
+
+    # Served from the cache
+    with patch.object(UserProfile, "get_users_that_worked_in_cantons") as uncached:
+        UserProfile.get_cached_users_that_worked_in_cantons(["VD"], 2019)
+    uncached.assert_not_called()
+
+    # Changing the helpers, or deleting the qualification invalidates it
+    helper = UserFactory()
+    qualification.helpers.add(helper)
+    users = UserProfile.get_cached_users_that_worked_in_cantons(["VD"], 2019)
+    assert set(users) == {actor, helper}
+
+    qualification.delete()
+    users = UserProfile.get_cached_users_that_worked_in_cantons(["VD"], 2019)
+    assert not users
+
+
+def test_cached_permissions_follow_the_roles_and_cantons(db):
+    manager, other = UserFactory(), UserFactory()
+    manager.profile.set_role("state_manager")
+    manager.profile.set_statemanager_for(["VD"])
+    other.profile.set_role("state_manager")
+    assert has_permission(manager, "user_create")
+    assert user_cantons(manager) == ["VD"]
+    assert has_permission(other, "user_create")
+
+    # Served from the cache, also for fresh instances
+    with patch("defivelo.roles._load_permissions") as uncached:
+        assert user_cantons(type(manager).objects.get(pk=manager.pk)) == ["VD"]
+    uncached.assert_not_called()
+
+    # Only the changed user is reloaded
+    UserManagedState.objects.create(user=manager, canton="GE")
+    manager = type(manager).objects.get(pk=manager.pk)
+    assert sorted(user_cantons(manager)) == ["GE", "VD"]
+    with patch("defivelo.roles._load_permissions") as uncached:
+        assert has_permission(type(other).objects.get(pk=other.pk), "user_create")
+    uncached.assert_not_called()
+
+    manager.profile.set_role("collaborator")
+    assert not has_permission(manager, "user_create")
+    assert not has_permission(type(manager).objects.get(pk=manager.pk), "user_create")
+
+    # Changing the permissions of a role reloads everyone
+    Group.objects.get(name="state_manager").permissions.clear()
+    with patch(
+        "defivelo.roles._load_permissions", wraps=roles._load_permissions
+    ) as loaded:
+        has_permission(type(other).objects.get(pk=other.pk), "user_create")
+    loaded.assert_called_once()
+
+
 def test_automatic_collaborator_role_assignment_formation(db):
     user = UserFactory()
     user.profile.formation = FORMATION_M1
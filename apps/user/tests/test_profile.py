@@ -13,7 +13,9 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import datetime
 import re
+from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
 from django.core import mail
@@ -22,17 +24,22 @@ from django.urls import NoReverseMatch, reverse
 
 from rolepermissions.roles import get_user_roles
 
+from apps.challenge.tests.factories import QualificationActivityFactory
 from apps.common import DV_STATES
+from apps.common.views import ExportMixin
 from apps.user import FORMATION_M1, FORMATION_M2
+from apps.user.export import CollaboratorUserResource, UserResource
 from apps.user.models import (
     BAGSTATUS_LOAN,
     BAGSTATUS_NONE,
     BAGSTATUS_PAID,
+    MARITALSTATUS_MARRIED,
     STD_PROFILE_FIELDS,
     USERSTATUS_ACTIVE,
     USERSTATUS_INACTIVE,
 )
 from apps.user.tests.factories import UserFactory
+from apps.user.views import UserListExport
 from defivelo.tests.utils import (
     AuthClient,
     CollaboratorAuthClient,
@@ -440,6 +447,66 @@ class PowerUserTest(ProfileTestCase):
             response = self.client.get(url)
             self.assertEqual(response.status_code, 200, url)
 
+    def test_export_rows_match_the_resource(self):
+        actor = self.users[0]
+        actor.profile.actor_for.add(
+            QualificationActivityFactory(category="C", name="Zorro"),
+            QualificationActivityFactory(category="C", name="Albert"),
+        )
+        actor.profile.formation = FORMATION_M2
+        actor.profile.marital_status = MARITALSTATUS_MARRIED
+        actor.profile.bagstatus = BAGSTATUS_PAID
+        actor.profile.firstmed_course = True
+        actor.profile.firstmed_course_comm = "Recyclage"
+        actor.profile.birthdate = datetime.date(1990, 2, 3)
+        actor.profile.activity_cantons = ["VS", "GE"]
+        actor.profile.languages_challenges = ["de", "it"]
+        actor.profile.address_canton = "VD"
+        actor.profile.save()
+        manager = self.users[1]
+        manager.set_password("password")
+        manager.is_active = True
+        manager.save()
+        manager.profile.set_role("state_manager")
+        manager.profile.set_statemanager_for(["VD", "GE"])
+
+        users = User.objects.order_by("pk")
+        for resource in [UserResource(), CollaboratorUserResource()]:
+            self.assertEqual(
+                list(resource.export_rows(users)),
+                [resource.export_resource(user) for user in users],
+            )
+
+        # Byte for byte, the same export as through the resource
+        url = tryurl("user-list-export", self.client.user)
+        with patch.object(
+            UserListExport, "get_export_rows", ExportMixin.get_export_rows
+        ):
+            expected = self.client.get(url).getvalue()
+        self.assertEqual(self.client.get(url).getvalue(), expected)
+        self.assertIn("Zorro - Albert", expected.decode("utf-8"))
+
+    def test_autocomplete_search(self):
+        joelle = UserFactory(first_name="Joëlle", last_name="Dupont")
+        joel = UserFactory(first_name="Joël", last_name="Martin")
+        natel = UserFactory(profile__natel="0791234567")
+        url = reverse("user-AllPersons-ac")
+
+        # Unaccented, most similar first
+        response = self.client.get(url, {"q": "JOEL"})
+        self.assertEqual(
+            [result["id"] for result in response.json()["results"]],
+            [str(joel.pk), str(joelle.pk)],
+        )
+        response = self.client.get(url, {"q": "1234567"})
+        self.assertEqual(
+            [result["id"] for result in response.json()["results"]],
+            [str(natel.pk)],
+        )
+        # The search patterns are escaped
+        response = self.client.get(url, {"q": "%"})
+        self.assertEqual(response.json()["results"], [])
+
 
 class CoordinatorUserTest(ProfileTestCase):
     def setUp(self):
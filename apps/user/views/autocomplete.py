@@ -19,15 +19,14 @@ from django.core.exceptions import PermissionDenied
 from django.db.models import Q
 
 from dal_select2.views import Select2QuerySetView
-from six import get_unbound_function
 
 from apps.challenge import MAX_MONO1_PER_QUALI
 from defivelo.roles import has_permission
 
 from .. import FORMATION_KEYS, FORMATION_M2
 from ..models import USERSTATUS_DELETED
+from ..search import search_persons
 from .mixins import ProfileMixin
-from .standard import UserProfileFilterSet
 
 
 class PersonAutocomplete(ProfileMixin, Select2QuerySetView):
@@ -57,8 +56,7 @@ class PersonAutocomplete(ProfileMixin, Select2QuerySetView):
             # Only non-deleted
             qs = qs.exclude(profile__status=USERSTATUS_DELETED)
             if q:
-                filter_wide = get_unbound_function(UserProfileFilterSet.filter_wide)
-                qs = filter_wide(qs, "", q)
+                qs = search_persons(qs, q, rank=True)
             return qs
         else:
             raise PermissionDenied
@@ -19,10 +19,9 @@ from django.forms import Form as DjangoEmptyForm
 from django.utils.translation import gettext_lazy as _
 from django.views.generic.edit import FormView
 
-from rolepermissions.checkers import has_role
 from rolepermissions.mixins import HasPermissionsMixin
 
-from defivelo.roles import has_permission, user_cantons
+from defivelo.roles import has_permission, has_role, user_cantons
 
 from ..forms import UserAssignRoleForm
 from .mixins import ProfileMixin
@@ -21,9 +21,7 @@ from django.db.models import Q
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
 
-from rolepermissions.checkers import has_role
-
-from defivelo.roles import has_permission, user_cantons
+from defivelo.roles import has_permission, has_role, user_cantons
 from defivelo.views import MenuView
 
 from ..forms import SimpleUserProfileForm, UserProfileForm
@@ -33,13 +33,12 @@ from django_filters import (
     MultipleChoiceFilter,
 )
 from django_filters.views import FilterView
-from rolepermissions.checkers import has_role
 from rolepermissions.mixins import HasPermissionsMixin
 
 from apps.challenge.models import QualificationActivity
 from apps.common import DV_LANGUAGES_WITH_DEFAULT, DV_STATE_CHOICES_WITH_DEFAULT
 from apps.common.views import ExportMixin, PaginatorMixin
-from defivelo.roles import DV_AVAILABLE_ROLES, has_permission, user_cantons
+from defivelo.roles import DV_AVAILABLE_ROLES, has_permission, has_role, user_cantons
 
 from .. import FORMATION_KEYS
 from ..export import CollaboratorUserResource, UserResource
@@ -52,6 +51,7 @@ from ..models import (
     USERSTATUS_DELETED,
     USERSTATUS_RESERVE,
 )
+from ..search import search_persons
 from .mixins import ProfileMixin, UserSelfAccessMixin
 
 
@@ -253,13 +253,7 @@ class UserProfileFilterSet(FilterSet):
 
     def filter_wide(queryset, name, value):
         if value:
-            allfields_filter = [
-                Q(last_name__unaccent__icontains=value),
-                Q(first_name__unaccent__icontains=value),
-                Q(email__icontains=value),
-                Q(profile__natel__icontains=value),
-            ]
-            return queryset.filter(reduce(operator.or_, allfields_filter))
+            return search_persons(queryset, value)
         return queryset
 
     def filter_roles(queryset, name, value):
@@ -347,6 +341,7 @@ class UserList(HasPermissionsMixin, ProfileMixin, PaginatorMixin, FilterView):
 class UserListExport(ExportMixin, UserList):
     export_class = UserResource()
     export_filename = _("Utilisateur·rice·s")
+    export_streaming = True
 
     def get_export_class(self, request):
         """
@@ -357,6 +352,12 @@ class UserListExport(ExportMixin, UserList):
             return CollaboratorUserResource()
         return super().get_export_class(request)
 
+    def get_export_rows(self):
+        export_class = self.get_export_class(self.request)
+        return export_class.get_export_headers(), export_class.export_rows(
+            self.object_list
+        )
+
 
 class UserDetailedList(UserList):
     paginate_by = None
@@ -0,0 +1,20 @@
+from django.utils.functional import SimpleLazyObject
+
+from .roles import permissions_snapshot
+
+
+class PermissionsSnapshotMiddleware:
+    """
+    Attach the `PermissionsSnapshot` of the request user as `request.permissions`,
+    computed on first use and shared with the template filters for the rest of the
+    request
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.permissions = SimpleLazyObject(
+            lambda: permissions_snapshot(request.user)
+        )
+        return self.get_response(request)
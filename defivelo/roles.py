@@ -14,32 +14,152 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import inspect
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 
-from memoize import memoize
-from rolepermissions.checkers import has_permission as uncached_has_permission
-from rolepermissions.roles import AbstractUserRole
+from rolepermissions.checkers import _check_superpowers
+from rolepermissions.permissions import available_perm_names
+from rolepermissions.roles import AbstractUserRole, get_user_roles
 
 from apps.common import DV_STATES
 
+PERMISSIONS_VERSION_KEY = "permissions:version"
+# As memoize did, in case the cache isn't shared between the workers
+PERMISSIONS_CACHE_TIMEOUT = 5 * 60
+
+
+def _permissions_version_key(user_id=None):
+    if user_id is None:
+        return PERMISSIONS_VERSION_KEY
+    return f"{PERMISSIONS_VERSION_KEY}:{user_id}"
+
+
+def _load_permissions(user):
+    """
+    (role names, permission names, managed cantons) of the user, from the database
+    """
+    roles = frozenset(role.get_name() for role in get_user_roles(user))
+    permissions = frozenset(available_perm_names(user))
+    cantons = []
+    if "cantons_all" not in permissions and "cantons_mine" in permissions:
+        cantons = [m.canton for m in user.managedstates.all()]
+    return roles, permissions, cantons
+
+
+def user_permissions(user):
+    """
+    (role names, permission names, managed cantons) of the user, loaded at once and
+    kept in the cache under the user's version
+    """
+    if not getattr(user, "pk", None):
+        return frozenset(), frozenset(), []
+    version_keys = [_permissions_version_key(), _permissions_version_key(user.pk)]
+    versions = cache.get_many(version_keys)
+    missing = {
+        version_key: uuid.uuid4().hex
+        for version_key in version_keys
+        if version_key not in versions
+    }
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    key = ":".join(["permissions", str(user.pk)] + [versions[k] for k in version_keys])
+    permissions = cache.get(key)
+    if permissions is None:
+        permissions = _load_permissions(user)
+        cache.set(key, permissions, PERMISSIONS_CACHE_TIMEOUT)
+    return permissions
+
+
+class PermissionsSnapshot:
+    """
+    Roles, permissions, managed cantons and visible seasons of a user, computed
+    once per request
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.superuser = bool(_check_superpowers(user))
+        self.roles, self.permissions, self.cantons = user_permissions(user)
+        # Ids of the visible seasons, filled by `UserProfile.get_seasons`
+        self.seasons = {}
+
+    def has_role(self, roles):
+        if self.superuser:
+            return True
+        if not isinstance(roles, list):
+            roles = [roles]
+        return any(
+            (role.get_name() if inspect.isclass(role) else role) in self.roles
+            for role in roles
+        )
+
+    def has_permission(self, permission_name):
+        return self.superuser or permission_name in self.permissions
+
+    def user_cantons(self):
+        if self.has_permission("cantons_all"):
+            return list(DV_STATES)
+        elif self.has_permission("cantons_mine"):
+            return list(self.cantons)
+        else:
+            raise LookupError("No user cantons")
+
+
+def permissions_snapshot(user):
+    """
+    The `PermissionsSnapshot` of the user, kept on it for the rest of the request
+    (see `defivelo.middleware.PermissionsSnapshotMiddleware`)
+    """
+    if not user:
+        # A missing template variable
+        return PermissionsSnapshot(user)
+    try:
+        return user._dv_permissions
+    except AttributeError:
+        user._dv_permissions = PermissionsSnapshot(user)
+        return user._dv_permissions
+
+
+def invalidate_permissions(*users):
+    """
+    Forget the cached permissions of the users (or users ids), or of all users
+    without any, now and once the current transaction is committed (before which
+    other workers could still have cached the previous state)
+    """
+    version_keys = [
+        _permissions_version_key(getattr(user, "pk", user)) for user in users
+    ] or [_permissions_version_key()]
+
+    def invalidate():
+        cache.set_many({key: uuid.uuid4().hex for key in version_keys}, None)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+    for user in users:
+        if hasattr(user, "_dv_permissions"):
+            del user._dv_permissions
+
+
+# Override 'has_role' and 'has_permission' from rolepermissions to serve them from
+# the permissions snapshot, for performance reasons
+def has_role(user, roles):
+    return permissions_snapshot(user).has_role(roles)
+
 
-# Override 'has_permission' from rolepermissions to add memoization for performance reasons
-@memoize()
 def has_permission(user, permission_name):
-    return uncached_has_permission(user, permission_name)
+    return permissions_snapshot(user).has_permission(permission_name)
 
 
-@memoize()
 def user_cantons(user):
     """
     List of the cantons _managed_ by this user
     """
-    if has_permission(user, "cantons_all"):
-        return DV_STATES
-    elif has_permission(user, "cantons_mine"):
-        return [m.canton for m in user.managedstates.all()]
-    else:
-        raise LookupError("No user cantons")
+    return permissions_snapshot(user).user_cantons()
 
 
 class Collaborator(AbstractUserRole):
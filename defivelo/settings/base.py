@@ -110,6 +110,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "defivelo.middleware.PermissionsSnapshotMiddleware",
     "allauth.account.middleware.AccountMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
@@ -187,6 +188,20 @@ DATABASE_PASSWORD = get_env_variable("DATABASE_PASSWORD", False)
 if DATABASE_PASSWORD:
     DATABASES["default"]["PASSWORD"] = DATABASE_PASSWORD
 
+# The cache defaults to Django's per-process one. Production should use a cache
+# shared between the workers (the invalidations have to reach them all), such
+# as the database one: CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache
+# with the table name as CACHE_LOCATION, created by `./manage.py createcachetable`
+# (run along the migrations by the deployment).
+CACHES = {
+    "default": {
+        "BACKEND": get_env_variable(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": get_env_variable("CACHE_LOCATION", ""),
+    }
+}
+
 
 SITE_ID = 1
 
@@ -257,6 +272,15 @@ MEDIA_URL = get_env_variable("MEDIA_URL", "/media/")
 # Example: "/home/media/media.lawrence.com/media/"
 MEDIA_ROOT = get_env_variable("MEDIA_ROOT", "/tmp/static/media")
 
+# Build the exports in the background (see the run_export_jobs command), and
+# keep the files (outside of MEDIA_ROOT, they are not public) until the data
+# changes.
+EXPORT_JOBS = bool(get_env_variable("EXPORT_JOBS", False))
+EXPORT_JOBS_ROOT = get_env_variable("EXPORT_JOBS_ROOT", "/tmp/exports")
+# Seconds after which a running export is deemed lost (its worker died), and
+# built again when requested
+EXPORT_JOBS_TIMEOUT = int(get_env_variable("EXPORT_JOBS_TIMEOUT", 30 * 60))
+
 # Adapt Stronghold for allauth
 STRONGHOLD_PUBLIC_URLS = [
     r"^/admin/.*$",  # Administration
@@ -20,7 +20,6 @@ from re import search, sub
 
 from django import template
 from django.conf import settings
-from django.core.exceptions import PermissionDenied
 from django.template.defaultfilters import date as datefilter
 from django.urls import reverse
 from django.utils.dates import MONTHS
@@ -31,9 +30,7 @@ from django.utils.translation import get_language
 from django.utils.translation import gettext_lazy as _
 
 import phonenumbers
-from memoize import memoize
 from phonenumbers import NumberParseException, PhoneNumberFormat
-from rolepermissions.templatetags.permission_tags import can_template_tag
 
 from apps.challenge import (
     AVAILABILITY_FIELDKEY,
@@ -48,7 +45,6 @@ from apps.challenge import (
     CONFLICT_FIELDKEY,
     SEASON_WORKWISH_FIELDKEY,
     STAFF_FIELDKEY,
-    STAFF_FIELDKEY_HELPER_PREFIX,
     SUPERLEADER_FIELDKEY,
 )
 from apps.common import (
@@ -66,15 +62,11 @@ from defivelo.roles import has_permission, user_cantons
 register = template.Library()
 
 
-@memoize()
-def can_memoized(user, role):
-    return can_template_tag(user, role)
-
-
-# Override 'can' from rolepermissions to add memoization for performance reasons
+# Override 'can' from rolepermissions to use the permissions cache for performance
+# reasons
 @register.filter
 def can(user, role):
-    return can_memoized(user, role)
+    return has_permission(user, role)
 
 
 @register.simple_tag
@@ -152,6 +144,17 @@ def profile_tag(user, is_restricted: bool = False):
     return mark_safe(usertag)
 
 
+def _helper_keys(struct, user):
+    """
+    Keys of `struct` concerning that user; directly from the index when `struct` is a
+    SeasonAvailabilityMatrix, the full struct otherwise
+    """
+    try:
+        return struct.helper_keys(user.pk)
+    except AttributeError:
+        return struct
+
+
 @register.filter
 def useravailsessions(form, user):
     """
@@ -160,16 +163,15 @@ def useravailsessions(form, user):
     if not form or not user:
         return ""
     output = ""
-    for key in form.fields:
-        if (
-            key == SEASON_WORKWISH_FIELDKEY.format(hpk=user.pk)
-            or AVAILABILITY_FIELDKEY_HELPER_PREFIX.format(hpk=user.pk) in key
-        ):
-            output += "<td>{field}</td>".format(
-                field=form.fields[key].widget.render(
-                    key, form.fields[key].initial, attrs={"id": key}
-                )
+    workwishkey = SEASON_WORKWISH_FIELDKEY.format(hpk=user.pk)
+    if workwishkey in form.fields:
+        output += "<td>{field}</td>".format(
+            field=form.fields[workwishkey].widget.render(
+                workwishkey, form.fields[workwishkey].initial, attrs={"id": workwishkey}
             )
+        )
+    for cell in form.fields["availabilities"].render_row(user.pk):
+        output += "<td>{field}</td>".format(field=cell)
     return mark_safe(output)
 
 
@@ -189,13 +191,13 @@ def useravailsessions_readonly(
     if not struct or not user:
         return ""
     output = ""
-    for key in struct:
+    keys = _helper_keys(struct, user)
+    # If there's a sessionkey specified, only look at that one
+    if sesskey:
+        sesskey_key = AVAILABILITY_FIELDKEY.format(hpk=user.pk, spk=sesskey)
+        keys = [sesskey_key] if sesskey_key in struct else []
+    for key in keys:
         if AVAILABILITY_FIELDKEY_HELPER_PREFIX.format(hpk=user.pk) in key:
-            # If there's a sessionkey specified, skip the ones not
-            # corresponding
-            if sesskey:
-                if key != AVAILABILITY_FIELDKEY.format(hpk=user.pk, spk=sesskey):
-                    continue
             availability = struct[key]
             avail_verb = ""  # Fulltext
             avail_label = ""  # Bootstrap glyphicon name
@@ -230,7 +232,7 @@ def useravailsessions_readonly(
                 conflictkey = CONFLICT_FIELDKEY.format(hpk=user.pk, spk=thissesskey)
                 conflicts = struct[conflictkey] if conflictkey in struct else []
                 if len(conflicts) > 0:
-                    conflict = conflicts.pop()
+                    conflict = conflicts[-1]
 
                 # Si le choix des moniteurs est connu, remplace le label et
                 # la version verbeuse par l’état du choix
@@ -333,20 +335,16 @@ def userstaffsessions(form, user):
     if not form or not user:
         return ""
     output = ""
-    for key in form.fields:
-        if STAFF_FIELDKEY_HELPER_PREFIX.format(hpk=user.pk) in key:
-            # Lookout for the session key in the form field key, and pipe
-            # it to the useravailsessions_readonly function
-            sesskey = int(search(r"-s(\d+)", key).group(1))
-            output += useravailsessions_readonly(
-                struct=form.initial,
-                user=user,
-                sesskey=sesskey,
-                onlyavail=True,
-                avail_forced_content=form.fields[key].widget.render(
-                    key, form.fields[key].initial, attrs={"id": key}
-                ),
-            )
+    field = form.fields["staff"]
+    for sesskey, cell in zip(field.session_pks, field.render_row(user.pk)):
+        # Pipe the rendered widget to the useravailsessions_readonly function
+        output += useravailsessions_readonly(
+            struct=form.initial,
+            user=user,
+            sesskey=sesskey,
+            onlyavail=True,
+            avail_forced_content=cell,
+        )
     return mark_safe(output)
 
 
@@ -356,7 +354,7 @@ def chosen_staff_for_season(struct, user):
         return ""
     accu_in_qualif = 0
     accu_in_sess = 0
-    for key in struct:
+    for key in _helper_keys(struct, user):
         if AVAILABILITY_FIELDKEY_HELPER_PREFIX.format(hpk=user.pk) in key:
             if struct[key] in ["y", "i"]:
                 thissesskey = int(search(r"-s(\d+)", key).group(1))
@@ -517,7 +515,7 @@ def anyofusercantons(user, cantons):
     try:
         usercantons = user_cantons(user)
         return list(set(usercantons).intersection(set(cantons)))
-    except PermissionDenied:
+    except LookupError:
         return
 
 
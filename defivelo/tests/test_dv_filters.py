@@ -14,11 +14,59 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from unittest.mock import patch
 
-from django.test import TestCase
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
 from django.utils.html import escape
 
-from defivelo.templatetags.dv_filters import tel_link
+from apps.user.tests.factories import UserFactory
+from defivelo import roles
+from defivelo.middleware import PermissionsSnapshotMiddleware
+from defivelo.templatetags.dv_filters import (
+    anyofusercantons,
+    can,
+    inusercantons,
+    tel_link,
+)
+
+
+class PermissionsSnapshotTestCase(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.user.profile.set_role("state_manager")
+        self.user.profile.set_statemanager_for(["VD", "GE"])
+
+    def get_request(self):
+        request = RequestFactory().get("/")
+        # A fresh user, as loaded by the authentication middleware
+        request.user = type(self.user).objects.get(pk=self.user.pk)
+        PermissionsSnapshotMiddleware(lambda request: HttpResponse())(request)
+        return request
+
+    def test_snapshot_is_computed_once_per_request(self):
+        request = self.get_request()
+        with patch.object(
+            roles, "user_permissions", wraps=roles.user_permissions
+        ) as user_permissions:
+            self.assertTrue(request.permissions.has_role("state_manager"))
+            self.assertTrue(can(request.user, "user_create"))
+            self.assertFalse(can(request.user, "user_deletions"))
+            self.assertTrue(inusercantons(request.user, "VD"))
+            self.assertFalse(inusercantons(request.user, "BE"))
+            self.assertEqual(anyofusercantons(request.user, ["GE", "BE"]), ["GE"])
+            request.user.profile.get_seasons()
+            request.user.profile.get_seasons()
+        self.assertEqual(user_permissions.call_count, 1)
+        # Only the seasons themselves are queried again
+        with self.assertNumQueries(1):
+            list(request.user.profile.get_seasons())
+
+        # The next request sees the changes
+        self.user.profile.set_statemanager_for(["BE"])
+        request = self.get_request()
+        self.assertEqual(request.permissions.user_cantons(), ["BE"])
+        self.assertEqual(anyofusercantons(request.user, ["GE"]), [])
 
 
 class TelLinkTestCase(TestCase):
@@ -661,9 +661,10 @@ def dj_collect_static(c):
 @remote
 def dj_migrate_database(c):
     """
-    Django: Migrate the database
+    Django: Migrate the database, and create the cache table
     """
     c.conn.manage_py("migrate")
+    c.conn.manage_py("createcachetable")
 
 
 @task